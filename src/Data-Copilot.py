@@ -106,14 +106,10 @@ def insert_default_user():
             db_run_sql(insert_user, _conn)        
 
 def create_tables():
-    # run a test query
-    try:
-        db_get_row_count(table_name=CFG["TABLE_CONFIG"])
-    except Exception as e:
-        ddl_script = open(CFG["META_DB_DDL"]).read()
-        logging.error(ddl_script)
-        with DBConn() as _conn:
-            db_run_sql(ddl_script, _conn)
+    # all statements are "IF NOT EXISTS", tables added in later versions are created on existing meta DBs
+    ddl_script = open(CFG["META_DB_DDL"]).read()
+    with DBConn() as _conn:
+        db_run_sql(ddl_script, _conn, debug=False)
             
 if __name__ == '__main__':
     # create tables if missing
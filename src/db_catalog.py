@@ -0,0 +1,101 @@
+"""
+Catalog of SQLite datasets: integrity check, schema, row counts and previews
+
+The catalog is gathered in a single pass over one pooled connection and cached per
+database file version, so the import preview, the SQL editor and other pages
+do not reopen and rescan the file on every rerun.
+"""
+
+from threading import Lock
+import logging
+import sqlite3
+
+from db_engine import get_pool, query_arrow
+from result_cache import db_file_version
+
+CATALOG_PREVIEW_ROWS = 5
+QUICK_CHECK_MAX_ERRORS = 10
+
+# db_url -> (version, catalog)
+_CATALOGS = {}
+_CATALOGS_LOCK = Lock()
+
+def quick_check(conn, max_errors=QUICK_CHECK_MAX_ERRORS):
+    """PRAGMA quick_check (O(N), skips index content checks), return list of errors, [] if ok"""
+    rows = [r[0] for r in conn.execute(f"PRAGMA quick_check({int(max_errors)});").fetchall()]
+    return [] if rows == ["ok"] else rows
+
+def stat1_counts(conn):
+    """row counts of tables from sqlite_stat1 (written by ANALYZE)"""
+    try:
+        counts = {}
+        for tbl, idx, stat in conn.execute("select tbl, idx, stat from sqlite_stat1").fetchall():
+            if stat and (idx is None or tbl not in counts):
+                counts[tbl] = int(str(stat).split()[0])
+        return counts
+    except Exception:
+        return {}    # no sqlite_stat1 table
+
+def build_catalog(conn, check=True, preview_rows=CATALOG_PREVIEW_ROWS):
+    """schema, row count and preview of each table over one connection
+
+    Returns:
+        dict(
+            quick_check,    # list of errors ([] if ok), None if not checked
+            tables,         # dict of name -> dict(sql, columns, row_count, preview)
+            views,          # dict of name -> sql
+        )
+    """
+    catalog = dict(quick_check=quick_check(conn) if check else None, tables={}, views={})
+    counts = stat1_counts(conn)
+    schema = conn.execute("""
+        select type, name, sql from sqlite_schema
+        where type in ('table', 'view') and name not like 'sqlite_%'
+        order by name
+    """).fetchall()
+    for obj_type, name, sql in schema:
+        if obj_type == "view":
+            catalog["views"][name] = sql
+            continue
+        columns = [(r[1], r[2]) for r in conn.execute(f'PRAGMA table_info("{name}")').fetchall()]
+        row_count = counts.get(name)
+        if row_count is None:
+            row_count = conn.execute(f'select count(*) from "{name}"').fetchone()[0]
+        preview = query_arrow(conn, f'select * from "{name}" limit {int(preview_rows)}') if preview_rows else None
+        catalog["tables"][name] = dict(sql=sql, columns=columns, row_count=row_count, preview=preview)
+    return catalog
+
+def get_catalog(db_url, check=False, refresh=False):
+    """cached catalog of a dataset, rebuilt when the file changes
+
+    check=True runs PRAGMA quick_check, unless the cached catalog of this file version is checked already
+    """
+    pool = get_pool(db_url)    # may switch the file to WAL mode, before taking the version
+    key, version = str(db_url), db_file_version(db_url)
+    with _CATALOGS_LOCK:
+        cached = _CATALOGS.get(key)
+    if cached and cached[0] == version and not refresh:
+        catalog = cached[1]
+        if not check or catalog["quick_check"] is not None:
+            return catalog
+
+    try:
+        with pool.connection() as conn:
+            catalog = build_catalog(conn, check=check)
+    except sqlite3.DatabaseError as e:
+        if not check:
+            raise
+        # e.g. "file is not a database", "database disk image is malformed"
+        catalog = dict(quick_check=[str(e)], tables={}, views={})
+    if catalog["quick_check"]:
+        logging.warning(f"[db_catalog] quick_check failed on {db_url}: {catalog['quick_check']}")
+    with _CATALOGS_LOCK:
+        _CATALOGS[key] = (version, catalog)
+    return catalog
+
+def clear_catalog(db_url=None):
+    with _CATALOGS_LOCK:
+        if db_url is None:
+            _CATALOGS.clear()
+        else:
+            _CATALOGS.pop(str(db_url), None)
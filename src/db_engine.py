@@ -0,0 +1,513 @@
+"""
+Database engine helpers for user datasets
+
+SQLite datasets are opened read-only (mode=ro URI) in WAL mode with tuned pragmas,
+connections are pooled per db_url and checked out by one thread at a time,
+so that small queries do not pay connect overhead and a cold page cache.
+A process that replaces or reloads a dataset (e.g. a job worker) touches a
+".<name>.changed" marker next to it, other processes then recycle their pool.
+
+DuckDB datasets (db_type "DuckDB") are either native .duckdb files opened read-only,
+or existing SQLite files ATTACHed through the sqlite scanner, so aggregation-heavy
+queries run vectorized and multi-threaded behind the same run_sql interface.
+
+Queries go through a guarded executor: a progress handler enforces a wall-clock
+timeout and cancellation, rows are fetched in batches up to a max-rows cap,
+and partial results are returned with df.attrs["truncated"] set.
+Rows are fetched batch by batch into pyarrow Tables, which Streamlit renders
+and exports without an intermediate object-dtype DataFrame. Results and whole
+tables export to CSV, Parquet or Arrow IPC by writing the batches as they arrive.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+SQLITE_READ_PRAGMAS = {
+    "mmap_size": 256*1024*1024,    # bytes
+    "cache_size": -64*1024,        # negative value in KiB, i.e. 64 MB
+    "temp_store": "MEMORY",
+    "query_only": 1,
+}
+SQLITE_POOL_MAX_IDLE = 8
+
+SQL_TIMEOUT_SECONDS = int(os.getenv("SQL_TIMEOUT_SECONDS", 30))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", 100000))
+SQL_FETCH_BATCH = 5000
+SQL_PROGRESS_STEPS = 10000    # SQLite VM instructions between progress handler calls
+
+# format -> (file suffix, mime type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Arrow IPC": ("arrow", "application/vnd.apache.arrow.file"),
+}
+EXPORT_COMPRESSION = "zstd"
+
+DUCKDB_DIALECT = "DuckDB"
+DUCKDB_SUFFIXES = (".duckdb", ".ddb")
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", os.cpu_count() or 4))
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "4GB")
+
+# list tables with their DDL, per dialect (used to train the knowledge base)
+DDL_QUERIES = {
+    "SQLite": "select name, sql from sqlite_master where type='table' and name not like 'sqlite%';",
+    DUCKDB_DIALECT: "select table_name as name, sql from duckdb_tables() where database_name = current_database() and not internal;",
+}
+
+def apply_pragmas(conn, pragmas):
+    for k, v in pragmas.items():
+        conn.execute(f"PRAGMA {k}={v};")
+
+def ensure_wal(db_url):
+    """switch database file to WAL journal mode (persistent), so readers do not block on writers
+
+    files hard-linked to an upload blob (see upload_store.py) are shared and left unchanged
+    """
+    try:
+        if os.stat(db_url).st_nlink > 1:
+            return
+        with sqlite3.connect(db_url, timeout=10) as conn:
+            mode = conn.execute("PRAGMA journal_mode;").fetchone()[0]
+            if str(mode).lower() != "wal":
+                conn.execute("PRAGMA journal_mode=WAL;")
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"[db_engine] failed to set WAL mode on {db_url}: {str(e)}")
+
+def pool_key(db_url):
+    return str(Path(db_url).resolve())
+
+def changed_marker(db_url):
+    key = Path(pool_key(db_url))
+    return key.with_name(f".{key.name}.changed")
+
+def mark_dataset_changed(db_url):
+    """tell other processes (e.g. the app, from a job worker) that a dataset file was
+    replaced or reloaded, their pools and DuckDB engines are recycled on next use
+    """
+    changed_marker(db_url).write_text(str(time.time_ns()))
+
+def changed_stamp(db_url):
+    try:
+        return os.stat(changed_marker(db_url)).st_mtime_ns
+    except OSError:
+        return None
+
+def to_arrow_array(values):
+    """python values of one column -> pyarrow array,
+    SQLite columns may mix types across rows, these fall back to string
+    """
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+def rows_to_arrow(rows, columns):
+    """list of row tuples -> pyarrow.Table (column-wise, duplicate column names allowed)"""
+    if not rows:
+        return pa.Table.from_arrays([pa.array([], type=pa.null()) for _ in columns], names=columns)
+    return pa.Table.from_arrays([to_arrow_array(list(col)) for col in zip(*rows)], names=columns)
+
+def concat_arrow(tables, columns):
+    if not tables:
+        return rows_to_arrow([], columns)
+    try:
+        # e.g. all-NULL first batch (null type) followed by int64 batch
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # incompatible types across batches
+        schema = pa.schema([(c, pa.string()) for c in columns])
+        return pa.concat_tables([t.cast(schema) for t in tables])
+
+def fetch_arrow(cursor, batch_size=SQL_FETCH_BATCH, max_rows=None):
+    """fetch rows of an executed DB-API cursor into pyarrow.Table batches
+
+    yields one table per batch, so that the caller keeps what was fetched
+    when the query is interrupted; stops after max_rows + 1 rows (to detect truncation)
+    """
+    columns = [d[0] for d in cursor.description] if cursor.description else []
+    n_rows = 0
+    while True:
+        n = batch_size if not max_rows else min(batch_size, max_rows + 1 - n_rows)
+        batch = cursor.fetchmany(n) if n > 0 else []
+        if not batch:
+            break
+        n_rows += len(batch)
+        yield rows_to_arrow(batch, columns)
+
+def query_arrow(conn, sql, batch_size=SQL_FETCH_BATCH):
+    """run a query on a DB-API connection, return pyarrow.Table"""
+    cur = conn.execute(sql)
+    columns = [d[0] for d in cur.description] if cur.description else []
+    table = concat_arrow(list(fetch_arrow(cur, batch_size=batch_size)), columns)
+    cur.close()
+    return table
+
+def open_arrow_writer(sink, schema, fmt="Parquet"):
+    """batch writer of an export format, see EXPORT_FORMATS"""
+    if fmt == "Parquet":
+        return pq.ParquetWriter(sink, schema, compression=EXPORT_COMPRESSION)
+    if fmt == "Arrow IPC":
+        return pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression=EXPORT_COMPRESSION))
+    if fmt == "CSV":
+        return pa_csv.CSVWriter(sink, schema)
+    raise ValueError(f"unsupported export format: {fmt}")
+
+def arrow_to_bytes(table, fmt="Parquet"):
+    """pyarrow.Table -> bytes of a CSV/Parquet/Arrow IPC file"""
+    sink = pa.BufferOutputStream()
+    writer = open_arrow_writer(sink, table.schema, fmt)
+    writer.write_table(table)
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+def export_query(conn, sql, fmt="Parquet", batch_size=SQL_FETCH_BATCH):
+    """run a query and write its rows batch by batch into a CSV/Parquet/Arrow IPC file,
+    return (bytes, n_rows)
+
+    the schema is taken from the first batch (all-NULL columns as string); if a later batch
+    does not fit (SQLite columns may mix types), that column is exported as string and the query re-runs
+    """
+    as_string = set()
+    while True:
+        cur = conn.execute(sql)
+        columns = [d[0] for d in cur.description] if cur.description else []
+        sink = pa.BufferOutputStream()
+        writer, schema, n_rows, retry = None, None, 0, None
+        try:
+            for batch in fetch_arrow(cur, batch_size=batch_size):
+                if schema is None:
+                    schema = pa.schema([
+                        pa.field(f.name, pa.string() if pa.types.is_null(f.type) or f.name in as_string else f.type)
+                        for f in batch.schema
+                    ])
+                    writer = open_arrow_writer(sink, schema, fmt)
+                for i, field in enumerate(schema):
+                    if batch.schema.field(i).type != field.type:
+                        try:
+                            batch = batch.set_column(i, field, batch.column(i).cast(field.type))
+                        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                            retry = field.name
+                            break
+                if retry:
+                    break
+                writer.write_table(batch)
+                n_rows += batch.num_rows
+        finally:
+            cur.close()
+        if retry:
+            as_string.add(retry)
+            continue
+        if writer is None:
+            writer = open_arrow_writer(sink, rows_to_arrow([], columns).schema, fmt)
+        writer.close()
+        return sink.getvalue().to_pybytes(), n_rows
+
+def arrow_to_df(table, info=None):
+    """pyarrow.Table -> DataFrame, with guard info (truncated etc) in df.attrs"""
+    df = table.to_pandas()
+    df.attrs.update(info or {})
+    return df
+
+def run_sql_guarded_arrow(conn, sql, timeout=SQL_TIMEOUT_SECONDS, max_rows=SQL_MAX_ROWS,
+                    cancel_event=None, batch_size=SQL_FETCH_BATCH):
+    """execute a query with timeout, row cap and cancellation, fetch into pyarrow.Table
+
+    instead of raising on timeout/cancel, rows fetched so far are returned with info:
+        truncated         True if the result is incomplete
+        truncated_reason  None | "timeout" | "cancelled" | "max_rows"
+        elapsed           seconds
+    return (table, info)
+    """
+    ts_start = time.monotonic()
+    state = {"reason": None}
+
+    def _check_progress():
+        # non-zero return value interrupts the running statement
+        if cancel_event is not None and cancel_event.is_set():
+            state["reason"] = "cancelled"
+            return 1
+        if timeout and time.monotonic() - ts_start > timeout:
+            state["reason"] = "timeout"
+            return 1
+        return 0
+
+    columns, tables = [], []
+    conn.set_progress_handler(_check_progress, SQL_PROGRESS_STEPS)
+    try:
+        cur = conn.execute(sql)
+        columns = [d[0] for d in cur.description] if cur.description else []
+        for t in fetch_arrow(cur, batch_size=batch_size, max_rows=max_rows):
+            tables.append(t)
+        cur.close()
+    except sqlite3.OperationalError:
+        if state["reason"] not in ("timeout", "cancelled"):
+            raise
+        logging.warning(f"[db_engine] query {state['reason']} after {time.monotonic()-ts_start:.1f}s, {sum(len(t) for t in tables)} rows fetched")
+    finally:
+        conn.set_progress_handler(None, 0)
+
+    table = concat_arrow(tables, columns)
+    if max_rows and table.num_rows > max_rows:
+        table = table.slice(0, max_rows)
+        state["reason"] = "max_rows"
+    info = {
+        "truncated": state["reason"] is not None,
+        "truncated_reason": state["reason"],
+        "elapsed": round(time.monotonic() - ts_start, 3),
+    }
+    return table, info
+
+def run_sql_guarded(conn, sql, timeout=SQL_TIMEOUT_SECONDS, max_rows=SQL_MAX_ROWS,
+                    cancel_event=None, batch_size=SQL_FETCH_BATCH):
+    """run_sql_guarded_arrow() as DataFrame, guard info in df.attrs"""
+    table, info = run_sql_guarded_arrow(conn, sql, timeout=timeout, max_rows=max_rows,
+                    cancel_event=cancel_event, batch_size=batch_size)
+    return arrow_to_df(table, info)
+
+class SQLitePool(object):
+    """Pool of read-only connections to one SQLite dataset
+
+    usage:
+        with get_pool(db_url).connection() as conn:
+            df = pd.read_sql(sql, conn)
+    """
+
+    def __init__(self, db_url, max_idle=SQLITE_POOL_MAX_IDLE, pragmas=SQLITE_READ_PRAGMAS, changed_stamp=None):
+        self.db_url = pool_key(db_url)
+        self.pragmas = pragmas
+        self.changed_stamp = changed_stamp    # see mark_dataset_changed()
+        # LIFO keeps reusing the connection with the warmest page cache
+        self.idle = queue.LifoQueue(maxsize=max_idle)
+        self.closed = False
+        if not Path(self.db_url).exists():
+            raise FileNotFoundError(f"DB file not found: {self.db_url}")
+        ensure_wal(self.db_url)
+
+    def _connect(self):
+        uri = f"{Path(self.db_url).as_uri()}?mode=ro"
+        # a connection is used by one thread at a time, but may move between threads
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        if self.closed:
+            conn.close()
+            return
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_POOLS = {}
+_POOLS_LOCK = Lock()
+
+def get_pool(db_url):
+    key = pool_key(db_url)
+    stamp = changed_stamp(key)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is not None and pool.changed_stamp != stamp:
+            # dataset changed by another process, pooled connections may read a replaced file
+            _close_key(key)
+            pool = None
+        if pool is None:
+            pool = SQLitePool(key, changed_stamp=stamp)
+            _POOLS[key] = pool
+        return pool
+
+def _close_key(key):
+    pool = _POOLS.pop(key, None)
+    if pool is not None:
+        pool.close()
+    engine = _DUCKDB_ENGINES.pop(key, None)
+    if engine is not None:
+        engine.close()
+
+def close_pool(db_url=None):
+    """close pooled connections, e.g. after a dataset file is replaced or dropped
+    """
+    with _POOLS_LOCK:
+        keys = list(_POOLS.keys()) + list(_DUCKDB_ENGINES.keys()) if db_url is None else [pool_key(db_url)]
+        for key in keys:
+            _close_key(key)
+
+def is_duckdb_file(db_url):
+    return Path(str(db_url)).suffix.lower() in DUCKDB_SUFFIXES
+
+
+class DuckDBEngine(object):
+    """DuckDB connection to one dataset, shared by threads via cursors
+
+    native .duckdb files are opened read-only, SQLite files are attached
+    read-only through the sqlite scanner and made the default catalog
+    """
+
+    def __init__(self, db_url, threads=DUCKDB_THREADS, memory_limit=DUCKDB_MEMORY_LIMIT, changed_stamp=None):
+        import duckdb
+        self.duckdb = duckdb
+        self.db_url = pool_key(db_url)
+        if not Path(self.db_url).exists():
+            raise FileNotFoundError(f"DB file not found: {self.db_url}")
+
+        config = {"threads": threads, "memory_limit": memory_limit}
+        self.db_alias = None
+        self.changed_stamp = changed_stamp    # see mark_dataset_changed()
+        if is_duckdb_file(self.db_url):
+            self.mode = "native"
+            self.conn = duckdb.connect(self.db_url, read_only=True, config=config)
+        else:
+            self.mode = "sqlite"
+            self.conn = duckdb.connect(":memory:", config=config)
+            self.conn.execute("INSTALL sqlite; LOAD sqlite;")
+            self.db_alias = re.sub(r"\W", "_", Path(self.db_url).stem)
+            self.conn.execute(f"ATTACH '{self.db_url}' AS {self.db_alias} (TYPE SQLITE, READ_ONLY);")
+            self.conn.execute(f"USE {self.db_alias};")
+
+    def cursor(self):
+        """cursor of the shared connection, a cursor does not inherit USE, so it is set again"""
+        cur = self.conn.cursor()
+        if self.db_alias:
+            cur.execute(f"USE {self.db_alias};")
+        return cur
+
+    def run_sql_arrow(self, sql, timeout=SQL_TIMEOUT_SECONDS, max_rows=SQL_MAX_ROWS, cancel_event=None):
+        """same contract as run_sql_guarded_arrow(): timeout/cancel interrupt the query,
+        the result is streamed as record batches, so batches read before the interrupt are kept
+        """
+        ts_start = time.monotonic()
+        state = {"reason": None}
+        cur = self.cursor()
+        done = threading.Event()
+
+        def _watch():
+            while not done.wait(0.1):
+                if cancel_event is not None and cancel_event.is_set():
+                    state["reason"] = "cancelled"
+                elif timeout and time.monotonic() - ts_start > timeout:
+                    state["reason"] = "timeout"
+                else:
+                    continue
+                cur.interrupt()
+                return
+
+        watcher = threading.Thread(target=_watch, daemon=True)
+        watcher.start()
+        table = pa.table({})
+        schema, batches = None, []
+        try:
+            rel = cur.sql(sql.strip().rstrip(";"))
+            if rel is not None:
+                # fetch one row beyond the cap to detect truncation
+                rel = rel.limit(max_rows + 1) if max_rows else rel
+                reader = rel.to_arrow_reader(SQL_FETCH_BATCH) if hasattr(rel, "to_arrow_reader") else rel.fetch_record_batch(SQL_FETCH_BATCH)
+                schema = reader.schema
+                for batch in reader:
+                    batches.append(batch)
+        except (self.duckdb.InterruptException, OSError):
+            # an interrupt while reading batches surfaces as OSError from the arrow stream
+            if state["reason"] not in ("timeout", "cancelled"):
+                raise
+            logging.warning(f"[db_engine] query {state['reason']} after {time.monotonic()-ts_start:.1f}s, {sum(len(b) for b in batches)} rows fetched")
+        finally:
+            done.set()
+            cur.close()
+
+        if schema is not None:
+            table = pa.Table.from_batches(batches, schema=schema)
+            if max_rows and table.num_rows > max_rows:
+                table = table.slice(0, max_rows)
+                state["reason"] = "max_rows"
+
+        info = {
+            "truncated": state["reason"] is not None,
+            "truncated_reason": state["reason"],
+            "elapsed": round(time.monotonic() - ts_start, 3),
+        }
+        return table, info
+
+    def run_sql(self, sql, timeout=SQL_TIMEOUT_SECONDS, max_rows=SQL_MAX_ROWS, cancel_event=None):
+        table, info = self.run_sql_arrow(sql, timeout=timeout, max_rows=max_rows, cancel_event=cancel_event)
+        return arrow_to_df(table, info)
+
+    def close(self):
+        self.conn.close()
+
+
+_DUCKDB_ENGINES = {}
+
+def get_duckdb_engine(db_url):
+    key = pool_key(db_url)
+    stamp = changed_stamp(key)
+    with _POOLS_LOCK:
+        engine = _DUCKDB_ENGINES.get(key)
+        if engine is not None and engine.changed_stamp != stamp:
+            _close_key(key)
+            engine = None
+        if engine is None:
+            engine = DuckDBEngine(key, changed_stamp=stamp)
+            _DUCKDB_ENGINES[key] = engine
+        return engine
+
+def connect_to_duckdb(vn, db_url):
+    """DuckDB engine for native .duckdb files or attached SQLite files
+    """
+    get_duckdb_engine(db_url)
+
+    def run_sql_duckdb(sql: str, timeout=SQL_TIMEOUT_SECONDS, max_rows=SQL_MAX_ROWS, cancel_event=None):
+        # looked up per query, the engine is recycled when the dataset changes
+        return get_duckdb_engine(db_url).run_sql(sql, timeout=timeout, max_rows=max_rows, cancel_event=cancel_event)
+
+    vn.dialect = DUCKDB_DIALECT
+    vn.run_sql = run_sql_duckdb
+    vn.run_sql_is_set = True
+
+def connect_to_sqlite_pool(vn, db_url):
+    """pooled, read-only, guarded replacement of vn.connect_to_sqlite()
+    """
+    get_pool(db_url)
+
+    def run_sql_sqlite(sql: str, timeout=SQL_TIMEOUT_SECONDS, max_rows=SQL_MAX_ROWS, cancel_event=None):
+        # looked up per query, the pool is recycled when the dataset changes
+        with get_pool(db_url).connection() as conn:
+            return run_sql_guarded(conn, sql, timeout=timeout, max_rows=max_rows, cancel_event=cancel_event)
+
+    vn.dialect = "SQLite"
+    vn.run_sql = run_sql_sqlite
+    vn.run_sql_is_set = True
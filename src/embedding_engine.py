@@ -0,0 +1,221 @@
+"""
+Local embedding backend with batched, multi-threaded CPU inference and a disk cache
+
+The embedding function of the knowledge base (see vector_store.py) is built here:
+    EMBEDDING_BACKEND=default       Chroma's default model (all-MiniLM-L6-v2, ONNX)
+    EMBEDDING_BACKEND=onnx          all-MiniLM-L6-v2 on onnxruntime, CPU provider only
+    EMBEDDING_BACKEND=sentence-transformers   EMBEDDING_MODEL via sentence-transformers (optional dependency)
+default and onnx give the same vectors; another model needs the knowledge base re-trained.
+
+Texts are embedded in batches of EMBED_BATCH_SIZE, spread over EMBED_THREADS threads
+(onnxruntime releases the GIL). Vectors are cached by sha256 of (backend, model, text)
+in a memory-mapped float32 file with a sidecar file of keys, shared by all processes
+on the host, so DDL re-trains, business terms and repeated questions are embedded once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from chromadb.api.types import EmbeddingFunction
+from chromadb.utils import embedding_functions
+
+try:
+    import fcntl    # cross-process lock of cache appends, not on Windows
+except ImportError:
+    fcntl = None
+
+from semantic_cache import EMBED_BATCH_SIZE
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "default")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", 2))
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") not in ("0", "false", "False")
+EMBED_CACHE_DIR = Path(__file__).parent / "store/cache/embeddings"
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", 512))
+
+KEY_SIZE = 32    # sha256 digest bytes
+
+def create_backend(backend=EMBEDDING_BACKEND, model=EMBEDDING_MODEL):
+    """embedding function of a backend: callable(list of texts) -> list of vectors"""
+    if backend == "default":
+        return embedding_functions.DefaultEmbeddingFunction()
+    if backend == "onnx":
+        return embedding_functions.ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+    if backend == "sentence-transformers":
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model, device="cpu")
+    raise ValueError(f"Unsupported EMBEDDING_BACKEND: {backend}")
+
+class EmbeddingCache(object):
+    """content hash -> vector, append-only files of one model:
+        <name>.keys   sha256 digests, KEY_SIZE bytes per row
+        <name>.f32    float32 vectors, dim per row, memory-mapped for reads
+
+    Vectors are written before their keys, so a key visible to another process always has its vector.
+    """
+
+    def __init__(self, cache_dir, name, max_bytes=EMBED_CACHE_MAX_MB*1024*1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.keys_path = self.cache_dir / f"{name}.keys"
+        self.vectors_path = self.cache_dir / f"{name}.f32"
+        self.lock_path = self.cache_dir / f"{name}.lock"
+        self.max_bytes = max_bytes
+        self.dim = None
+        self.rows = {}            # digest -> row
+        self.keys_size = 0        # bytes of keys file loaded into self.rows
+        self.vectors = None       # np.memmap, shape (n, dim)
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def make_key(text, namespace=""):
+        return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).digest()
+
+    def _refresh(self):
+        """load keys appended (by any process) since the last refresh, remap vectors"""
+        try:
+            size = self.keys_path.stat().st_size
+        except OSError:
+            return
+        if size == self.keys_size or self.dim is None and not self._read_dim():
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self.keys_size)
+            data = f.read(size - self.keys_size)
+        n0 = self.keys_size // KEY_SIZE
+        for i in range(len(data) // KEY_SIZE):
+            self.rows[data[i*KEY_SIZE:(i+1)*KEY_SIZE]] = n0 + i
+        self.keys_size = n0 * KEY_SIZE + (len(data) // KEY_SIZE) * KEY_SIZE
+        n_rows = self.keys_size // KEY_SIZE
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim)) if n_rows else None
+
+    def _read_dim(self):
+        dim_path = self.cache_dir / f"{self.vectors_path.stem}.dim"
+        try:
+            self.dim = int(dim_path.read_text())
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def get_many(self, keys):
+        """list of vectors (np.ndarray) or None per key"""
+        with self.lock:
+            self._refresh()
+            found = []
+            for key in keys:
+                row = self.rows.get(key)
+                found.append(None if row is None else np.array(self.vectors[row]))
+            n_hits = sum(v is not None for v in found)
+            self.hits += n_hits
+            self.misses += len(keys) - n_hits
+            return found
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+        with self.lock:
+            if self.dim is None and not self._read_dim():
+                self.dim = vectors.shape[1]
+                (self.cache_dir / f"{self.vectors_path.stem}.dim").write_text(str(self.dim))
+            if vectors.shape[1] != self.dim:
+                logging.warning(f"[embedding_engine] vector dim {vectors.shape[1]} != cache dim {self.dim}, not cached")
+                return
+            with open(self.lock_path, "a+b") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    new = {}
+                    for key, vector in zip(keys, vectors):
+                        if key not in self.rows and key not in new:
+                            new[key] = vector
+                    if not new:
+                        return
+                    if (self.keys_size // KEY_SIZE + len(new)) * (self.dim * 4 + KEY_SIZE) > self.max_bytes:
+                        logging.warning(f"[embedding_engine] cache {self.vectors_path} is full (EMBED_CACHE_MAX_MB)")
+                        return
+                    # vectors first, then keys, both appended right after the rows already known
+                    n_rows = self.keys_size // KEY_SIZE
+                    with open(self.vectors_path, "r+b" if self.vectors_path.exists() else "wb") as f:
+                        f.seek(n_rows * self.dim * 4)
+                        f.write(np.stack(list(new.values())).astype(np.float32).tobytes())
+                        f.truncate()
+                        f.flush()
+                        os.fsync(f.fileno())
+                    with open(self.keys_path, "r+b" if self.keys_path.exists() else "wb") as f:
+                        f.seek(self.keys_size)
+                        f.write(b"".join(new))
+                        f.truncate()
+                    self._refresh()
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return dict(entries=len(self.rows), hits=self.hits, misses=self.misses,
+                        hit_rate=self.hits / total if total else 0.0)
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """embedding function of the knowledge base: cache lookup, then batched multi-threaded inference of misses"""
+
+    def __init__(self, backend=EMBEDDING_BACKEND, model=EMBEDDING_MODEL, batch_size=EMBED_BATCH_SIZE,
+                 n_threads=EMBED_THREADS, cache_enabled=EMBED_CACHE_ENABLED, cache_dir=EMBED_CACHE_DIR):
+        self.namespace = f"{backend}:{model}"
+        self.embed_batch = create_backend(backend, model)
+        self.batch_size = batch_size
+        self.n_threads = n_threads
+        self.executor = ThreadPoolExecutor(max_workers=n_threads) if n_threads > 1 else None
+        cache_name = hashlib.sha256(self.namespace.encode("utf-8")).hexdigest()[:16]
+        self.cache = EmbeddingCache(cache_dir, cache_name) if cache_enabled else None
+
+    def _embed(self, texts):
+        batches = [texts[i:i+self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self.executor is None or len(batches) == 1:
+            results = [self.embed_batch(b) for b in batches]
+        else:
+            results = list(self.executor.map(self.embed_batch, batches))
+        return np.asarray([v for r in results for v in r], dtype=np.float32)
+
+    def __call__(self, input):
+        texts = list(input)
+        if not texts:
+            return []
+        if self.cache is None:
+            return [v.tolist() for v in self._embed(texts)]
+
+        keys = [EmbeddingCache.make_key(t, self.namespace) for t in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {}    # key -> text, unique
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            embedded = self._embed(list(missing.values()))
+            self.cache.put_many(list(missing), embedded)
+            computed = dict(zip(missing, embedded))
+            vectors = [computed[k] if v is None else v for k, v in zip(keys, vectors)]
+        return [np.asarray(v, dtype=np.float32).tolist() for v in vectors]
+
+    def stats(self):
+        return self.cache.stats() if self.cache else {}
+
+_EMBEDDING_FUNCTION = None
+_EMBEDDING_FUNCTION_LOCK = Lock()
+
+def get_embedding_function():
+    """the process-wide embedding function of the knowledge base"""
+    global _EMBEDDING_FUNCTION
+    with _EMBEDDING_FUNCTION_LOCK:
+        if _EMBEDDING_FUNCTION is None:
+            _EMBEDDING_FUNCTION = CachedEmbeddingFunction()
+        return _EMBEDDING_FUNCTION
@@ -0,0 +1,81 @@
+"""
+Lexical (BM25) search over knowledge-base documents, fused with vector search
+
+Table and column names are exact tokens that embedding similarity often misses
+(e.g. "InvoiceLine" for a question on "quantity sold"). A LexicalIndex is an in-memory
+SQLite FTS5 table over the documents of one collection, with identifiers also split
+into words (InvoiceLine, invoice_line -> invoice line), ranked by bm25().
+rrf_fuse() merges the lexical and the vector ranking by reciprocal rank fusion.
+"""
+
+from threading import Lock
+import re
+import sqlite3
+
+RRF_K = 60    # reciprocal rank fusion constant, larger values flatten the rank weights
+
+# frequent words that carry no schema signal
+LEXICAL_STOPWORDS = set("""
+a an and are as at be by can do does for from get give how i in is it list me of on or per show
+than that the their there these this to was were what when where which who whose why with you
+""".split())
+
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+def split_identifiers(text):
+    """words of identifiers in text: "InvoiceLine.UnitPrice" -> "Invoice Line Unit Price" """
+    words = []
+    for token in re.findall(r"[A-Za-z0-9_]+", text):
+        words.extend(w for part in token.split("_") for w in _CAMEL_RE.split(part) if w)
+    return " ".join(words)
+
+def strip_prompt_hints(question):
+    """drop instruction lines (e.g. "Hint: ...") that are not part of the question itself"""
+    return "\n".join(line for line in str(question).splitlines() if not line.strip().lower().startswith("hint:"))
+
+def lexical_query(question, min_prefix_len=4):
+    """FTS5 MATCH expression: any question word, longer words also match as prefix (quantity -> quantities)"""
+    terms = []
+    for word in _WORD_RE.findall(split_identifiers(strip_prompt_hints(question)).lower()):
+        if len(word) < 2 or word in LEXICAL_STOPWORDS:
+            continue
+        term = f'"{word}"*' if len(word) >= min_prefix_len else f'"{word}"'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms)
+
+class LexicalIndex(object):
+    """in-memory FTS5 index of (id, document) pairs"""
+
+    def __init__(self, ids, documents):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.lock = Lock()
+        self.conn.execute("create virtual table docs using fts5(doc_id unindexed, body)")
+        self.conn.executemany("insert into docs(doc_id, body) values(?, ?)",
+                              [(i, f"{d}\n{split_identifiers(d)}") for i, d in zip(ids, documents)])
+        self.documents = dict(zip(ids, documents))
+        self.size = len(ids)
+
+    def search(self, question, k=10):
+        """ids of the k best matching documents, best first"""
+        match = lexical_query(question)
+        if not match or not self.size:
+            return []
+        with self.lock:
+            rows = self.conn.execute("""
+                select doc_id from docs where docs match ? order by bm25(docs) limit ?
+            """, (match, int(k))).fetchall()
+        return [r[0] for r in rows]
+
+    def close(self):
+        self.conn.close()
+
+def rrf_fuse(rankings, k=RRF_K, top_n=None):
+    """reciprocal rank fusion of ranked id lists: score(id) = sum of 1/(k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+    return fused[:top_n] if top_n else fused
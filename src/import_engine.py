@@ -0,0 +1,524 @@
+"""
+Streaming import of data files into SQLite datasets
+
+Uploads are copied to disk in fixed-size blocks (content-addressed, see upload_store.py),
+column types are inferred from a sample of rows, and the data is inserted chunk by chunk
+with executemany in one transaction, so peak memory depends on the chunk size, not on the file size.
+
+Parquet and Arrow IPC files are typed, so no type inference is needed: only the selected
+columns are read (projection) and rows are streamed record batch by record batch
+(Parquet row groups, memory-mapped IPC batches).
+
+Excel workbooks are read with openpyxl in read-only mode: rows are streamed from the
+sheet XML, only a sample per sheet is kept for the preview, and only the sheets and
+columns that are not ignored are materialized, one batch at a time.
+
+Multi-file (or multi-sheet) imports parse in a process pool; parsed batches are
+funneled through a bounded queue to a single writer connection, as SQLite has one writer.
+
+Bulk-load mode keeps the rollback journal in memory and turns off fsync for the duration
+of the load (a failed load still rolls back, the other tables of the dataset stay intact),
+or only turns off fsync while the dataset is open elsewhere, indexes are built after the
+data is in place, then ANALYZE runs and safe pragmas (WAL) are restored.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+import datetime as dt
+import logging
+import multiprocessing
+import os
+import queue
+import sqlite3
+
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from upload_store import store_upload, link_file
+
+IMPORT_COPY_BLOCK = 1024*1024    # bytes
+IMPORT_CHUNK_ROWS = 50000
+IMPORT_SAMPLE_ROWS = 10000
+CSV_SEP = "\t"
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", os.cpu_count() or 2))
+IMPORT_QUEUE_SIZE = 16    # parsed batches in flight, bounds memory of the writer queue
+
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "MEMORY",    # not OFF: ROLLBACK is undefined without a journal
+    "synchronous": "OFF",
+    "cache_size": -512*1024,    # KiB, i.e. 512 MB
+    "temp_store": "MEMORY",
+    "locking_mode": "EXCLUSIVE",
+}
+# fallback while other connections (e.g. pooled readers of the app) hold the dataset:
+# leaving WAL and an exclusive lock need the only connection to the file
+BULK_LOAD_WAL_PRAGMAS = {k: v for k, v in BULK_LOAD_PRAGMAS.items() if k not in ("journal_mode", "locking_mode")}
+SAFE_PRAGMAS = {
+    "locking_mode": "NORMAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+}
+
+SQLITE_TYPE_MAP = {
+    "i": "INTEGER",    # int
+    "u": "INTEGER",    # unsigned int
+    "b": "INTEGER",    # bool
+    "f": "REAL",       # float
+}
+
+ARROW_FORMATS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",    # Feather v2 is the Arrow IPC file format
+    ".ipc": "arrow",
+}
+
+XLSX_STREAM_SUFFIXES = (".xlsx", ".xlsm")    # openpyxl read-only mode, other Excel files go through pandas
+
+def save_upload(uploaded_file, save_path, block_size=IMPORT_COPY_BLOCK):
+    """copy an uploaded file-like object block by block into the content-addressed store
+    (see upload_store.py) and link it to save_path
+
+    Returns:
+        dict(n_bytes, content_hash, is_new), is_new=False if the same content was uploaded before
+    """
+    content_hash, n_bytes, blob, is_new = store_upload(uploaded_file, block_size=block_size)
+    link_file(blob, save_path)
+    return dict(n_bytes=n_bytes, content_hash=content_hash, is_new=is_new)
+
+def sample_csv(csv_path, sep=CSV_SEP, nrows=IMPORT_SAMPLE_ROWS):
+    """first nrows of a CSV file, used for preview and type inference"""
+    return pd.read_csv(csv_path, sep=sep, nrows=nrows)
+
+def infer_sqlite_type(dtype):
+    """pandas dtype -> SQLite column type (datetime and text are stored as TEXT)"""
+    return SQLITE_TYPE_MAP.get(getattr(dtype, "kind", "O"), "TEXT")
+
+def infer_sqlite_types(df_sample):
+    return {col: infer_sqlite_type(df_sample[col].dtype) for col in df_sample.columns}
+
+def quote_ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def insert_sql(table_name, columns):
+    cols = ", ".join(quote_ident(c) for c in columns)
+    params = ", ".join(["?"] * len(columns))
+    return f"INSERT INTO {quote_ident(table_name)} ({cols}) VALUES ({params})"
+
+def to_sqlite_value(v):
+    """values sqlite3 cannot bind (e.g. timestamps, time from Excel cells) as text"""
+    if v is None or isinstance(v, (str, int, float, bytes)):
+        return v
+    if isinstance(v, (dt.datetime, dt.date, dt.time)):
+        return v.isoformat(sep=" ") if isinstance(v, dt.datetime) else v.isoformat()
+    return str(v)
+
+def chunk_to_rows(df_chunk, sanitize=False):
+    """DataFrame chunk -> iterator of tuples, NaN as NULL
+
+    sanitize=True converts non-primitive values (parsed by e.g. read_excel) to text
+    """
+    df_chunk = df_chunk.astype(object).where(df_chunk.notna(), None)
+    rows = df_chunk.itertuples(index=False, name=None)
+    if sanitize:
+        rows = (tuple(to_sqlite_value(v) for v in row) for row in rows)
+    return rows
+
+def arrow_format(path):
+    """file suffix -> "parquet" | "arrow" | None"""
+    return ARROW_FORMATS.get(Path(path).suffix.lower())
+
+def _open_ipc(path):
+    """Arrow IPC reader of a file (random access) or of a stream, memory-mapped"""
+    source = pa.memory_map(str(path), "r")
+    try:
+        return pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return pa.ipc.open_stream(source)
+
+def read_arrow_schema(path):
+    if arrow_format(path) == "parquet":
+        return pq.read_schema(path)
+    return _open_ipc(path).schema
+
+def arrow_sqlite_type(pa_type):
+    """Arrow type -> SQLite column type (temporal and decimal types are stored as TEXT)"""
+    if pa.types.is_integer(pa_type) or pa.types.is_boolean(pa_type):
+        return "INTEGER"
+    if pa.types.is_floating(pa_type):
+        return "REAL"
+    if pa.types.is_binary(pa_type) or pa.types.is_large_binary(pa_type) or pa.types.is_fixed_size_binary(pa_type):
+        return "BLOB"
+    return "TEXT"
+
+def iter_arrow_batches(path, columns=None, batch_size=IMPORT_CHUNK_ROWS):
+    """yield (RecordBatch, rows_done, total_rows) of a Parquet/Arrow IPC file,
+    reading only the given columns
+    """
+    if arrow_format(path) == "parquet":
+        pf = pq.ParquetFile(path)
+        total = pf.metadata.num_rows
+        done = 0
+        for batch in pf.iter_batches(batch_size=batch_size, columns=columns):
+            done += batch.num_rows
+            yield batch, done, total
+        return
+
+    reader = _open_ipc(path)
+    if isinstance(reader, pa.ipc.RecordBatchFileReader):
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        total = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))    # metadata only, zero-copy
+    else:
+        batches, total = iter(reader), None
+    done = 0
+    for batch in batches:
+        if columns:
+            batch = batch.select(columns)
+        # IPC batches can be arbitrarily large, slice them to bound the rows per insert
+        for offset in range(0, batch.num_rows, batch_size):
+            part = batch.slice(offset, batch_size)
+            done += part.num_rows
+            yield part, done, total if total is not None else done
+
+def sample_arrow(path, nrows=IMPORT_SAMPLE_ROWS):
+    """first nrows of a Parquet/Arrow IPC file as DataFrame, used for preview"""
+    for batch, _, _ in iter_arrow_batches(path, batch_size=nrows):
+        return batch.to_pandas()
+    return read_arrow_schema(path).empty_table().to_pandas()
+
+def arrow_batch_to_rows(batch):
+    """RecordBatch -> iterator of tuples, converted column-wise (NULL as None)"""
+    columns = [col.to_pylist() for col in batch.columns]
+    return (tuple(to_sqlite_value(v) for v in row) for row in zip(*columns))
+
+def xlsx_header(values):
+    """header cells -> column names, same as pandas.read_excel: "Unnamed: i" for empty cells,
+    ".1", ".2" ... suffix for duplicates
+    """
+    names, seen = [], {}
+    for i, v in enumerate(values):
+        name = f"Unnamed: {i}" if v is None or str(v).strip() == "" else str(v)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _iter_sheet_rows(ws):
+    """(header, iterator of row tuples) of a read-only worksheet, blank rows skipped"""
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return [], iter(())
+    header = xlsx_header(header)
+    n = len(header)
+    return header, (tuple(r[:n]) + (None,) * (n - len(r)) for r in rows if any(v is not None for v in r))
+
+def sample_xlsx(xlsx_path, sheet_names=None, nrows=IMPORT_SAMPLE_ROWS):
+    """first nrows of each sheet as DataFrame (dict of sheet_name -> DataFrame), used for preview
+    and type inference; only the sampled rows of each sheet are read
+    """
+    if Path(xlsx_path).suffix.lower() not in XLSX_STREAM_SUFFIXES:
+        return pd.read_excel(xlsx_path, sheet_name=sheet_names, nrows=nrows)
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        samples = {}
+        for sheet_name in (sheet_names or wb.sheetnames):
+            header, rows = _iter_sheet_rows(wb[sheet_name])
+            data = [r for _, r in zip(range(nrows), rows)]
+            samples[sheet_name] = pd.DataFrame(data, columns=header)
+        return samples
+    finally:
+        wb.close()
+
+def iter_xlsx_rows(xlsx_path, sheet_name, columns=None, chunk_rows=IMPORT_CHUNK_ROWS):
+    """yield (rows, rows_done, total_rows) of a sheet, streamed in read-only mode,
+    only the given columns (header names) are kept; total_rows is taken from the sheet
+    dimension and may be an estimate
+    """
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name]
+        total = max((ws.max_row or 1) - 1, 1)
+        header, rows = _iter_sheet_rows(ws)
+        if columns:
+            missing = [c for c in columns if c not in header]
+            if missing:
+                raise ValueError(f"sheet '{sheet_name}': columns not found: {missing}")
+            positions = [header.index(c) for c in columns]
+            rows = (tuple(r[i] for i in positions) for r in rows)
+        batch, done = [], 0
+        for row in rows:
+            batch.append(tuple(to_sqlite_value(v) for v in row))
+            if len(batch) >= chunk_rows:
+                done += len(batch)
+                yield batch, done, max(total, done)
+                batch = []
+        if batch:
+            done += len(batch)
+            yield batch, done, max(total, done)
+    finally:
+        wb.close()
+
+def load_job(conn, job, chunk_rows=IMPORT_CHUNK_ROWS, progress_callback=None):
+    """(re)create the table of an import job (see import_parallel) and insert its rows
+    batch by batch within one transaction, in-process
+
+    Args:
+        progress_callback: called with (rows_loaded, done, total)
+
+    Returns:
+        number of rows loaded
+    """
+    stmt = insert_sql(job["table"], job["columns"])
+    n_rows = 0
+    in_transaction = conn.in_transaction
+    if not in_transaction:
+        conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_ident(job['table'])}")
+        conn.execute(job["ddl"])
+        for rows, done, total in _iter_job_rows(job, chunk_rows):
+            conn.executemany(stmt, rows)
+            n_rows += len(rows)
+            if progress_callback:
+                progress_callback(n_rows, done, total)
+        if not in_transaction:
+            conn.commit()
+    except Exception:
+        if not in_transaction:
+            conn.rollback()
+        raise
+    logging.info(f"[import_engine] loaded {n_rows} rows from {job['name']} into {job['table']}")
+    return n_rows
+
+
+@contextmanager
+def bulk_load_mode(conn):
+    """fast, unsafe pragmas while loading a dataset, safe pragmas restored afterwards
+
+    when the dataset is open elsewhere the journal mode can't be changed ("database is locked"),
+    the load then keeps WAL with synchronous=OFF
+    """
+    if conn.in_transaction:
+        conn.commit()
+    pragmas = BULK_LOAD_PRAGMAS
+    try:
+        journal_mode = conn.execute(f"PRAGMA journal_mode={BULK_LOAD_PRAGMAS['journal_mode']};").fetchone()[0]
+    except sqlite3.OperationalError as e:
+        journal_mode = str(e)
+    if journal_mode.lower() != BULK_LOAD_PRAGMAS["journal_mode"].lower():
+        logging.warning(f"[import_engine] journal_mode={BULK_LOAD_PRAGMAS['journal_mode']} failed ({journal_mode}), bulk load keeps WAL with synchronous=OFF")
+        pragmas = BULK_LOAD_WAL_PRAGMAS
+    for k, v in pragmas.items():
+        if k != "journal_mode":
+            conn.execute(f"PRAGMA {k}={v};")
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        for k, v in SAFE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {k}={v};")
+        # the exclusive lock is released by the next access after locking_mode=NORMAL
+        conn.execute("select count(*) from sqlite_schema;").fetchone()
+
+def auto_index_columns(columns):
+    """key-like columns worth an index: id, *_id, *_key, *_code"""
+    return [c for c in columns if c.lower() == "id" or c.lower().endswith(("_id", "_key", "_code"))]
+
+def create_indexes(conn, table_name, columns):
+    """single-column indexes, built after the bulk load (faster than maintaining them per insert)"""
+    created = []
+    for col in columns:
+        idx_name = f"idx_{table_name}_{col}"
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_ident(idx_name)} ON {quote_ident(table_name)} ({quote_ident(col)})")
+        created.append(idx_name)
+    conn.commit()
+    return created
+
+def finalize_load(conn, indexes):
+    """build indexes per table (dict of table -> columns), then ANALYZE for the query planner"""
+    created = []
+    for table_name, columns in (indexes or {}).items():
+        created += create_indexes(conn, table_name, columns)
+    conn.execute("ANALYZE;")
+    conn.commit()
+    return created
+
+def _iter_job_rows(job, chunk_rows):
+    """yield (rows, done, total) of an import job, see import_parallel()"""
+    if job["kind"] in ("parquet", "arrow"):
+        for batch, done, total in iter_arrow_batches(job["path"], columns=job.get("source_columns"), batch_size=chunk_rows):
+            if batch.num_columns != len(job["columns"]):
+                raise ValueError(f"expected {len(job['columns'])} columns, got {batch.num_columns}")
+            yield list(arrow_batch_to_rows(batch)), done, total
+        return
+
+    if job["kind"] == "xlsx" and Path(job["path"]).suffix.lower() in XLSX_STREAM_SUFFIXES:
+        for rows, done, total in iter_xlsx_rows(job["path"], job["sheet"], columns=job.get("source_columns"), chunk_rows=chunk_rows):
+            if rows and len(rows[0]) != len(job["columns"]):
+                raise ValueError(f"expected {len(job['columns'])} columns, got {len(rows[0])}")
+            yield rows, done, total
+        return
+
+    sanitize = job["kind"] != "csv"
+    for chunk, done, total in _iter_job_chunks(job, chunk_rows):
+        if job.get("source_columns"):
+            chunk = chunk[job["source_columns"]]
+        if len(chunk.columns) != len(job["columns"]):
+            raise ValueError(f"expected {len(job['columns'])} columns, got {len(chunk.columns)}")
+        yield list(chunk_to_rows(chunk, sanitize=sanitize)), done, total
+
+def _iter_job_chunks(job, chunk_rows):
+    """yield (DataFrame chunk, done, total) of a csv (or legacy .xls) import job"""
+    if job["kind"] == "csv":
+        total = os.path.getsize(job["path"])
+        with open(job["path"], "rb") as f:
+            for chunk in pd.read_csv(f, sep=job.get("sep", CSV_SEP), dtype=str, chunksize=chunk_rows,
+                                     usecols=job.get("source_columns")):
+                yield chunk, min(f.tell(), total), total
+    elif job["kind"] == "xlsx":
+        # no streaming reader for legacy .xls, the sheet is read at once
+        df = pd.read_excel(job["path"], sheet_name=job["sheet"], usecols=job.get("source_columns"))
+        total = len(df)
+        for i in range(0, total, chunk_rows):
+            yield df.iloc[i:i+chunk_rows], min(i+chunk_rows, total), total
+    else:
+        raise ValueError(f"unsupported import kind: {job['kind']}")
+
+_out_queue = None
+_cancel_event = None
+
+def _init_worker(out_queue, cancel_event):
+    # multiprocessing queues/events can only be shared at process start, not as task arguments
+    global _out_queue, _cancel_event
+    _out_queue, _cancel_event = out_queue, cancel_event
+
+def _send(msg):
+    """put msg to the writer queue, give up when the import is cancelled (e.g. writer failed)"""
+    while not _cancel_event.is_set():
+        try:
+            _out_queue.put(msg, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _parse_worker(job, chunk_rows):
+    """runs in a worker process: parse one file/sheet and send its batches to the writer
+
+    messages: ("batch", name, rows, done, total) ... then ("done", name) or ("error", name, message)
+    """
+    name = job["name"]
+    try:
+        for rows, done, total in _iter_job_rows(job, chunk_rows):
+            if not _send(("batch", name, rows, done, total)):
+                return
+        _send(("done", name))
+    except Exception as e:
+        _send(("error", name, f"{type(e).__name__}: {str(e)}"))
+
+def import_parallel(db_path, jobs, max_workers=IMPORT_WORKERS, chunk_rows=IMPORT_CHUNK_ROWS, progress_callback=None, conn=None):
+    """parse import jobs in a process pool, write all batches through one connection in one transaction
+
+    Args:
+        jobs: list of dict(
+                name,            # unique job name, e.g. file or sheet name
+                kind,            # "csv" | "xlsx" | "parquet" | "arrow"
+                path, sheet,     # source file (and sheet of xlsx)
+                table, ddl,      # target table and its CREATE TABLE statement
+                columns,         # target column names, in source column order
+                source_columns,  # optional subset of source columns to load
+                sep)             # optional CSV separator
+        progress_callback: called with (name, status, rows, fraction), status in running|done|error
+        conn: writer connection (e.g. in bulk_load_mode), by default a new connection to db_path
+
+    Returns:
+        dict of name -> dict(table, status, rows, error); a failed job leaves no table behind
+    """
+    results = {j["name"]: dict(table=j["table"], status="pending", rows=0, error=None) for j in jobs}
+    if not jobs:
+        return results
+    stmts = {j["name"]: insert_sql(j["table"], j["columns"]) for j in jobs}
+    tables = {j["name"]: j["table"] for j in jobs}
+
+    def _notify(name, fraction=None):
+        if progress_callback:
+            r = results[name]
+            progress_callback(name, r["status"], r["rows"], fraction)
+
+    def _fail(name, message):
+        results[name].update(status="error", error=message)
+        conn.execute(f"DROP TABLE IF EXISTS {quote_ident(tables[name])}")
+        logging.error(f"[import_engine] {name} failed: {message}")
+        _notify(name)
+
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    ctx = multiprocessing.get_context("spawn")
+    out_queue = ctx.Queue(maxsize=IMPORT_QUEUE_SIZE)
+    cancel_event = ctx.Event()
+    try:
+        conn.execute("BEGIN")
+        for j in jobs:
+            conn.execute(f"DROP TABLE IF EXISTS {quote_ident(j['table'])}")
+            conn.execute(j["ddl"])
+
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs)), mp_context=ctx,
+                                 initializer=_init_worker, initargs=(out_queue, cancel_event)) as pool:
+            futures = {pool.submit(_parse_worker, j, chunk_rows): j["name"] for j in jobs}
+            try:
+                finished = set()
+                while len(finished) < len(jobs):
+                    try:
+                        msg = out_queue.get(timeout=0.5)
+                    except queue.Empty:
+                        # worker died without reporting (e.g. killed, unpicklable job)
+                        for f, name in futures.items():
+                            if name not in finished and f.done() and f.exception() is not None:
+                                finished.add(name)
+                                _fail(name, str(f.exception()))
+                        continue
+
+                    kind, name = msg[0], msg[1]
+                    if name in finished:
+                        continue
+                    if kind == "batch":
+                        _, _, rows, done, total = msg
+                        try:
+                            conn.executemany(stmts[name], rows)
+                        except Exception as e:
+                            finished.add(name)
+                            _fail(name, f"{type(e).__name__}: {str(e)}")
+                            continue
+                        results[name].update(status="running", rows=results[name]["rows"] + len(rows))
+                        _notify(name, done / max(total, 1))
+                    elif kind == "done":
+                        finished.add(name)
+                        results[name]["status"] = "done"
+                        _notify(name, 1.0)
+                    elif kind == "error":
+                        finished.add(name)
+                        _fail(name, msg[2])
+            except BaseException:
+                # e.g. Streamlit stopped the script run, workers must not block on a full queue
+                cancel_event.set()
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+    return results
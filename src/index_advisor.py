@@ -0,0 +1,209 @@
+"""
+Index advisor for SQLite datasets, driven by the Q&A history
+
+Validated SQL recorded in t_qa is parsed for join, filter and order-by columns per table,
+frequent column combinations become (covering) index candidates, which are kept only if
+EXPLAIN QUERY PLAN shows a full scan or an automatic index on that table today.
+After indexes are created, the recorded queries are re-planned and re-timed.
+"""
+
+from collections import Counter, defaultdict
+import hashlib
+import logging
+import re
+import statistics
+import time
+
+from db_engine import close_pool, get_pool, run_sql_guarded
+from query_analyzer import explain_query_plan, parse_table_aliases, parse_plan_step
+
+MAX_INDEX_COLUMNS = 3      # key columns
+MAX_COVERING_COLUMNS = 5   # key + included columns
+TIMING_RUNS = 3
+TIMING_TIMEOUT = 10        # seconds per query run
+
+CLAUSE_KEYWORDS = {
+    "select": "select", "from": "from", "join": "from", "on": "join", "using": "join",
+    "where": "filter", "having": "filter", "group": "group", "order": "order", "limit": "limit",
+}
+TOKEN_PATTERN = r"'(?:[^']|'')*'|\"[^\"]+\"|\[[^\]]+\]|`[^`]+`|[A-Za-z_][\w$]*(?:\.[A-Za-z_\"`\[][\w$\"`\]]*)?|\S"
+
+def strip_quotes(name):
+    return name.strip('"`[]')
+
+def get_table_columns(conn):
+    """table (lower) -> list of columns (lower)"""
+    tables = [r[0] for r in conn.execute("select name from sqlite_schema where type = 'table' and name not like 'sqlite_%'").fetchall()]
+    return {t.lower(): [r[1].lower() for r in conn.execute(f'PRAGMA table_info("{t}")').fetchall()] for t in tables}
+
+def get_existing_indexes(conn, table_name):
+    """list of column tuples of existing indexes (incl. INTEGER PRIMARY KEY as rowid)"""
+    indexes = []
+    for idx in conn.execute(f'PRAGMA index_list("{table_name}")').fetchall():
+        cols = tuple(r[2].lower() for r in conn.execute(f'PRAGMA index_info("{idx[1]}")').fetchall() if r[2])
+        if cols:
+            indexes.append(cols)
+    for r in conn.execute(f'PRAGMA table_info("{table_name}")').fetchall():
+        if r[5] == 1 and str(r[2]).upper() == "INTEGER":
+            indexes.append((r[1].lower(),))
+    return indexes
+
+def is_covered(columns, existing_indexes):
+    """an existing index starting with the same key columns already serves the candidate"""
+    n = len(columns)
+    return any(tuple(idx[:n]) == tuple(columns) for idx in existing_indexes)
+
+def extract_column_usage(sql, table_columns):
+    """classify column references of one query by clause
+
+    returns dict of table -> dict(join=[...], filter=[...], order=[...], select=[...])
+    """
+    aliases = {a: t for a, t in parse_table_aliases(sql).items() if t in table_columns}
+    query_tables = set(aliases.values())
+    usage = defaultdict(lambda: defaultdict(list))
+    clause = None
+    prev = None
+    for tok in re.findall(TOKEN_PATTERN, sql):
+        low = tok.lower()
+        if low in CLAUSE_KEYWORDS and not (low == "order" and prev == "window"):
+            clause = CLAUSE_KEYWORDS[low]
+            prev = low
+            continue
+        prev = low
+        if clause not in ("join", "filter", "group", "order", "select") or tok.startswith("'"):
+            continue
+        if "." in tok:
+            qualifier, col = [strip_quotes(x).lower() for x in tok.split(".", 1)]
+            table = aliases.get(qualifier)
+            if table is None or col not in table_columns[table]:
+                continue
+        else:
+            col = strip_quotes(tok).lower()
+            owners = [t for t in query_tables if col in table_columns[t]]
+            if len(owners) != 1:
+                continue
+            table = owners[0]
+        kind = "order" if clause == "group" else clause
+        if col not in usage[table][kind]:
+            usage[table][kind].append(col)
+    return usage
+
+def plan_scanned_tables(conn, sql):
+    """tables that EXPLAIN QUERY PLAN reads with a full SCAN or an AUTOMATIC index"""
+    aliases = parse_table_aliases(sql)
+    scanned = set()
+    for _, _, detail in explain_query_plan(conn, sql):
+        parsed = parse_plan_step(detail)
+        if parsed is None:
+            continue
+        op, name, rest = parsed
+        if op == "SCAN" or "AUTOMATIC" in rest:
+            scanned.add(aliases.get(name.lower(), name.lower()))
+    return scanned
+
+def plan_uses_index(conn, sql, index_name):
+    return any(index_name.lower() in d.lower() for _, _, d in explain_query_plan(conn, sql))
+
+def index_name(table_name, columns, max_len=60):
+    """readable index name, a long one is truncated with a short hash of its columns so names don't collide"""
+    name = f"idx_{table_name}_{'_'.join(columns)}"
+    if len(name) <= max_len:
+        return name
+    digest = hashlib.sha1("\x00".join([table_name] + list(columns)).encode("utf-8")).hexdigest()[:8]
+    return f"{name[:max_len - len(digest) - 1]}_{digest}"
+
+def index_ddl(table_name, columns):
+    cols = ", ".join(f'"{c}"' for c in columns)
+    return f'CREATE INDEX IF NOT EXISTS "{index_name(table_name, columns)}" ON "{table_name}" ({cols});'
+
+def advise_indexes(db_url, queries, min_queries=1):
+    """propose indexes for a dataset from its recorded queries
+
+    Args:
+        queries: list of SQL strings (validated SQL from Q&A history)
+
+    Returns:
+        list of dict(table, columns, key_columns, ddl, name, n_queries, queries), most used first
+    """
+    candidates = Counter()
+    candidate_queries = defaultdict(list)
+    with get_pool(db_url).connection() as conn:
+        table_columns = get_table_columns(conn)
+        existing = {t: get_existing_indexes(conn, t) for t in table_columns}
+        for sql in dict.fromkeys(q.strip().rstrip(";").strip() for q in queries if q and q.strip()):
+            try:
+                scanned = plan_scanned_tables(conn, sql)
+            except Exception as e:
+                logging.info(f"[index_advisor] skip query, EXPLAIN failed: {str(e)}")
+                continue
+            for table, usage in extract_column_usage(sql, table_columns).items():
+                if table not in scanned:
+                    continue  # already served by an index
+                # equality/range filters first, then join keys, then sort/group columns
+                key_cols = list(dict.fromkeys(usage["filter"] + usage["join"] + usage["order"]))[:MAX_INDEX_COLUMNS]
+                if not key_cols or is_covered(tuple(key_cols), existing[table]):
+                    continue
+                # covering: include selected columns while the index stays narrow
+                extra = [c for c in usage["select"] if c not in key_cols]
+                cols = tuple(key_cols + extra) if len(key_cols) + len(extra) <= MAX_COVERING_COLUMNS else tuple(key_cols)
+                candidates[(table, cols, tuple(key_cols))] += 1
+                candidate_queries[(table, cols, tuple(key_cols))].append(sql)
+
+    proposals = []
+    for (table, cols, key_cols), n in candidates.most_common():
+        if n < min_queries:
+            continue
+        proposals.append(dict(
+            table=table, columns=list(cols), key_columns=list(key_cols),
+            name=index_name(table, cols), ddl=index_ddl(table, cols),
+            n_queries=n, queries=candidate_queries[(table, cols, key_cols)],
+        ))
+    return proposals
+
+def time_query(db_url, sql, runs=TIMING_RUNS, timeout=TIMING_TIMEOUT):
+    """median wall-clock seconds of a query (None if it timed out)"""
+    timings = []
+    with get_pool(db_url).connection() as conn:
+        for _ in range(runs):
+            ts_start = time.perf_counter()
+            df = run_sql_guarded(conn, sql, timeout=timeout, max_rows=None)
+            if df.attrs.get("truncated_reason") == "timeout":
+                return None
+            timings.append(time.perf_counter() - ts_start)
+    return statistics.median(timings)
+
+def apply_indexes(db_url, proposals, write_conn):
+    """create proposed indexes and report before/after latency of their recorded queries
+
+    Args:
+        write_conn: read-write connection to the dataset (pooled connections are read-only)
+
+    Returns:
+        list of dict(name, ddl, query, used, before, after, speedup)
+    """
+    report = []
+    timed = {}
+    for p in proposals:
+        for sql in p["queries"]:
+            if sql not in timed:
+                timed[sql] = time_query(db_url, sql)
+
+    for p in proposals:
+        write_conn.execute(p["ddl"])
+    write_conn.execute("ANALYZE;")
+    write_conn.commit()
+    close_pool(db_url)  # pooled readers may still hold the old schema/snapshot
+
+    with get_pool(db_url).connection() as conn:
+        for p in proposals:
+            for sql in p["queries"]:
+                report.append(dict(name=p["name"], ddl=p["ddl"], query=sql,
+                                   used=plan_uses_index(conn, sql, p["name"]),
+                                   before=timed[sql]))
+    after = {}
+    for r in report:
+        if r["query"] not in after:
+            after[r["query"]] = time_query(db_url, r["query"])
+        r["after"] = after[r["query"]]
+        r["speedup"] = round(r["before"] / r["after"], 2) if r["before"] and r["after"] else None
+    return report
@@ -0,0 +1,244 @@
+"""
+Background job queue backed by the meta SQLite database
+
+Long-running work (imports, knowledge base training, report generation) is submitted
+as a row in t_job and executed by worker processes, so it survives browser refreshes
+and does not block the Streamlit session. Workers claim queued jobs atomically
+(UPDATE ... RETURNING), report progress into the row, and check for a cancel request
+whenever progress is reported.
+
+Handlers are registered by job type as "module:function" and imported lazily in the
+worker, a handler is called with (params, ctx), see JobContext.
+
+Workers are started by the app (see utils.ensure_job_workers), or standalone:
+    python job_queue.py --workers 2
+"""
+
+from pathlib import Path
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import traceback
+from datetime import datetime
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL_SECONDS = 1.0
+JOB_CANCEL_CHECK_SECONDS = 1.0    # min interval between cancel checks in ctx.progress()
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_ERROR = "error"
+JOB_STATUS_CANCELLED = "cancelled"
+JOB_FINAL_STATUS = [JOB_STATUS_DONE, JOB_STATUS_ERROR, JOB_STATUS_CANCELLED]
+
+# job type -> "module:function"
+JOB_HANDLERS = {
+    "import": "utils:job_import",
+    "train": "utils:job_train",
+    "qa_report": "utils:job_qa_report",
+    "schema_sync": "utils:job_schema_sync",
+}
+
+META_DB_URL = Path(__file__).parent / "store/sql/sqlite/data_copilot/data_copilot.sqlite3"
+
+class JobCancelled(Exception):
+    pass
+
+def get_ts_now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _connect(db_url=META_DB_URL):
+    conn = sqlite3.connect(db_url, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def submit_job(job_type, params, title="", created_by="", db_url=META_DB_URL):
+    """queue a job, return its id"""
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"unknown job type: {job_type}")
+    curr_ts = get_ts_now()
+    with _connect(db_url) as conn:
+        cur = conn.execute("""
+            insert into t_job(job_type, title, params, status, progress, created_at, updated_at, created_by, updated_by)
+            values(?, ?, ?, ?, 0, ?, ?, ?, ?)
+        """, (job_type, title or job_type, json.dumps(params, default=str), JOB_STATUS_QUEUED,
+              curr_ts, curr_ts, created_by, created_by))
+        return cur.lastrowid
+
+def get_job(job_id, db_url=META_DB_URL):
+    with _connect(db_url) as conn:
+        row = conn.execute("select * from t_job where id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def list_jobs(limit=100, status=None, db_url=META_DB_URL):
+    """latest jobs first, list of dict"""
+    sql = "select * from t_job where is_active = 1"
+    args = []
+    if status:
+        sql += f" and status in ({','.join('?' * len(status))})"
+        args += list(status)
+    sql += " order by id desc limit ?"
+    with _connect(db_url) as conn:
+        return [dict(r) for r in conn.execute(sql, args + [int(limit)]).fetchall()]
+
+def cancel_job(job_id, db_url=META_DB_URL):
+    """queued jobs are cancelled right away, running jobs stop at their next progress report"""
+    curr_ts = get_ts_now()
+    with _connect(db_url) as conn:
+        conn.execute("""
+            update t_job set status = ?, finished_at = ?, updated_at = ?, message = 'cancelled before start'
+            where id = ? and status = ?
+        """, (JOB_STATUS_CANCELLED, curr_ts, curr_ts, job_id, JOB_STATUS_QUEUED))
+        conn.execute("""
+            update t_job set cancel_requested = 1, updated_at = ?
+            where id = ? and status = ?
+        """, (curr_ts, job_id, JOB_STATUS_RUNNING))
+
+def process_token(pid=None):
+    """boot id, pid and start time of a process (Linux /proc), None where unavailable
+
+    unlike the pid alone it does not match another process after a restart reuses the pid
+    """
+    pid = os.getpid() if pid is None else int(pid)
+    try:
+        boot_id = Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+        # starttime is field 22, counted after the parenthesized command name
+        start_ticks = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[19]
+        return f"{boot_id}:{pid}:{start_ticks}"
+    except (OSError, IndexError):
+        return None
+
+def ensure_job_schema(db_url=META_DB_URL):
+    """add columns missing in a t_job created by an earlier version"""
+    with _connect(db_url) as conn:
+        columns = [r["name"] for r in conn.execute("PRAGMA table_info(t_job)").fetchall()]
+        if columns and "worker_token" not in columns:
+            conn.execute("alter table t_job add column worker_token text")
+
+def claim_next_job(db_url=META_DB_URL):
+    """atomically mark the oldest queued job as running by this process, return it or None"""
+    curr_ts = get_ts_now()
+    with _connect(db_url) as conn:
+        row = conn.execute("""
+            update t_job set status = ?, pid = ?, worker_token = ?, started_at = ?, updated_at = ?
+            where id = (select id from t_job where status = ? and is_active = 1 order by id limit 1)
+                and status = ?
+            returning *
+        """, (JOB_STATUS_RUNNING, os.getpid(), process_token(), curr_ts, curr_ts, JOB_STATUS_QUEUED, JOB_STATUS_QUEUED)).fetchone()
+    return dict(row) if row else None
+
+def _worker_alive(pid, worker_token=None):
+    try:
+        os.kill(int(pid), 0)
+    except (OSError, TypeError, ValueError):
+        return False
+    # a live pid of another process (reused after a restart) has another token
+    return worker_token is None or process_token(pid) == worker_token
+
+def recover_stale_jobs(db_url=META_DB_URL):
+    """running jobs whose worker process is gone (e.g. app restarted) are marked as failed"""
+    curr_ts = get_ts_now()
+    with _connect(db_url) as conn:
+        stale = [r["id"] for r in conn.execute("select id, pid, worker_token from t_job where status = ?", (JOB_STATUS_RUNNING,)).fetchall()
+                 if not _worker_alive(r["pid"], r["worker_token"])]
+        for job_id in stale:
+            conn.execute("""
+                update t_job set status = ?, message = 'worker process exited', finished_at = ?, updated_at = ?
+                where id = ? and status = ?
+            """, (JOB_STATUS_ERROR, curr_ts, curr_ts, job_id, JOB_STATUS_RUNNING))
+    return stale
+
+class JobContext(object):
+    """passed to job handlers: report progress, check for cancellation"""
+
+    def __init__(self, job_id, db_url=META_DB_URL):
+        self.job_id = job_id
+        self.db_url = db_url
+        self._last_check = 0.0
+
+    def is_cancelled(self):
+        with _connect(self.db_url) as conn:
+            row = conn.execute("select cancel_requested from t_job where id = ?", (self.job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def progress(self, fraction=None, message=None):
+        """update progress (0..1) and message, raise JobCancelled if a cancel was requested"""
+        now = time.monotonic()
+        if now - self._last_check < JOB_CANCEL_CHECK_SECONDS and fraction not in (0.0, 1.0):
+            return
+        self._last_check = now
+        with _connect(self.db_url) as conn:
+            conn.execute("""
+                update t_job set progress = coalesce(?, progress), message = coalesce(?, message), updated_at = ?
+                where id = ?
+            """, (None if fraction is None else float(min(max(fraction, 0.0), 1.0)), message, get_ts_now(), self.job_id))
+            row = conn.execute("select cancel_requested from t_job where id = ?", (self.job_id,)).fetchone()
+        if row and row[0]:
+            raise JobCancelled()
+
+def _finish_job(job_id, status, message=None, result=None, db_url=META_DB_URL):
+    curr_ts = get_ts_now()
+    with _connect(db_url) as conn:
+        conn.execute("""
+            update t_job set status = ?, message = ?, result = ?,
+                progress = case when ? = 'done' then 1.0 else progress end,
+                finished_at = ?, updated_at = ?
+            where id = ?
+        """, (status, message, None if result is None else json.dumps(result, default=str), status, curr_ts, curr_ts, job_id))
+
+def resolve_handler(job_type):
+    module_name, func_name = JOB_HANDLERS[job_type].split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+def run_job(job, db_url=META_DB_URL):
+    """run a claimed job to completion, recording status/result/error in t_job"""
+    ctx = JobContext(job["id"], db_url)
+    try:
+        handler = resolve_handler(job["job_type"])
+        result = handler(json.loads(job["params"] or "{}"), ctx)
+        _finish_job(job["id"], JOB_STATUS_DONE, message="done", result=result, db_url=db_url)
+    except JobCancelled:
+        _finish_job(job["id"], JOB_STATUS_CANCELLED, message="cancelled", db_url=db_url)
+    except Exception as e:
+        logging.error(f"[job_queue] job {job['id']} failed: {traceback.format_exc()}")
+        _finish_job(job["id"], JOB_STATUS_ERROR, message=f"{type(e).__name__}: {str(e)}", db_url=db_url)
+
+def worker_loop(db_url=META_DB_URL, poll_seconds=JOB_POLL_SECONDS):
+    """claim and run jobs until the process is terminated"""
+    logging.info(f"[job_queue] worker {os.getpid()} started")
+    while True:
+        try:
+            job = claim_next_job(db_url)
+        except sqlite3.Error as e:
+            logging.warning(f"[job_queue] claim failed: {str(e)}")
+            job = None
+        if job is None:
+            time.sleep(poll_seconds)
+            continue
+        run_job(job, db_url)
+
+def start_workers(n=JOB_WORKERS, db_url=META_DB_URL):
+    """start n worker processes (spawned, daemon: they exit with the app), return them"""
+    ensure_job_schema(db_url)
+    recover_stale_jobs(db_url)
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(n):
+        p = ctx.Process(target=worker_loop, args=(db_url,), daemon=True)
+        p.start()
+        workers.append(p)
+    return workers
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run background job workers")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    for p in start_workers(args.workers):
+        p.join()
@@ -0,0 +1,167 @@
+"""
+Disk-backed LLM response cache
+
+Responses are stored in a SQLite file (WAL mode) so that every Streamlit
+process on the host shares the same cache and it survives restarts.
+
+Entries are keyed on (model, dataset, prompt hash, retrieved-context hash),
+expire after a TTL and are evicted least-recently-used once the total
+payload size exceeds a budget.
+"""
+
+from contextlib import closing
+from pathlib import Path
+from time import time
+import hashlib
+import json
+import logging
+import sqlite3
+
+LLM_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS llm_cache
+    (
+        key TEXT PRIMARY KEY
+        , model TEXT
+        , dataset TEXT
+        , prompt_hash TEXT
+        , context_hash TEXT
+        , response TEXT
+        , size INTEGER
+        , hits INTEGER DEFAULT 0
+        , created_at REAL
+        , accessed_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed_at ON llm_cache(accessed_at);
+
+    CREATE TABLE IF NOT EXISTS llm_cache_stats
+    (
+        name TEXT PRIMARY KEY
+        , value INTEGER DEFAULT 0
+    );
+    INSERT OR IGNORE INTO llm_cache_stats(name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+"""
+
+def hash_text(obj):
+    """sha256 of a string or any JSON-serializable object (e.g. prompt message list)
+    """
+    if not isinstance(obj, str):
+        obj = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(obj.encode("utf-8")).hexdigest()
+
+def split_prompt(prompt):
+    """split prompt into (context, messages)
+
+    vanna puts the retrieved DDL/docs/SQL examples into the leading system message,
+    the remaining messages carry the question and chat history
+    """
+    if isinstance(prompt, list) and len(prompt) > 1:
+        return prompt[0], prompt[1:]
+    return "", prompt
+
+
+class LLMCache(object):
+    """SQLite-backed LLM response cache shared across processes"""
+
+    def __init__(self, db_file, ttl=7*24*3600, max_bytes=256*1024*1024):
+        self.db_file = Path(db_file)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.executescript(LLM_CACHE_DDL)
+            conn.commit()
+
+    def _connect(self):
+        # a short-lived connection per call keeps the cache safe across threads and processes
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    @staticmethod
+    def make_key(model, dataset, prompt_hash, context_hash):
+        return hash_text([model or "", dataset or "", prompt_hash, context_hash])
+
+    def _bump(self, conn, name, n=1):
+        conn.execute("UPDATE llm_cache_stats SET value = value + ? WHERE name = ?", (n, name))
+
+    def get(self, key):
+        """return cached response or None, counting the hit/miss"""
+        now = time()
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._bump(conn, "misses")
+                conn.commit()
+                return None
+
+            conn.execute(
+                "UPDATE llm_cache SET hits = hits + 1, accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._bump(conn, "hits")
+            conn.commit()
+            return row[0]
+
+    def put(self, key, response, model="", dataset="", prompt_hash="", context_hash=""):
+        if response is None:
+            return
+        now = time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache(
+                    key, model, dataset, prompt_hash, context_hash,
+                    response, size, hits, created_at, accessed_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)
+                """,
+                (key, model, dataset, prompt_hash, context_hash,
+                 response, len(response.encode("utf-8")), now, now)
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        """drop expired entries, then least-recently-used ones above max_bytes"""
+        n_evicted = 0
+        if self.ttl:
+            n_evicted += conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+        if self.max_bytes:
+            n_evicted += conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, sum(size) over (order by accessed_at desc) as running_size
+                        FROM llm_cache
+                    ) WHERE running_size > ?
+                )
+                """, (self.max_bytes,)
+            ).rowcount
+        if n_evicted > 0:
+            self._bump(conn, "evictions", n_evicted)
+            logging.info(f"[LLMCache] evicted {n_evicted} entries")
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            stats = dict(conn.execute("SELECT name, value FROM llm_cache_stats").fetchall())
+            entries, total_size = conn.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        stats.update({
+            "entries": entries,
+            "size_bytes": total_size,
+            "hit_rate": (stats.get("hits", 0) / lookups) if lookups else 0.0,
+        })
+        return stats
+
+    def clear(self):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM llm_cache")
+            conn.execute("UPDATE llm_cache_stats SET value = 0")
+            conn.commit()
@@ -231,7 +231,7 @@ def do_config():
 
     with st.expander("Specify data source: (default - SQLite)", expanded=True):
 
-        db_dialects = sorted(SQL_DIALECTS)
+        db_dialects = sorted(set(SQL_DIALECTS) | set(FILE_DB_DIALECTS))
         c1, c2, c3 = st.columns([2,2,6])
         with c1:
             db_type = st.selectbox(
@@ -241,7 +241,7 @@ def do_config():
                 key="cfg_db_type_select"
             )
 
-            if db_type in [DEFAULT_DB_DIALECT]:
+            if db_type in FILE_DB_DIALECTS:
                 avail_dbs = list_datasets(db_type)
                 db_names = sorted(list(avail_dbs.keys()))
             else:
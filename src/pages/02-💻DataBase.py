@@ -26,18 +26,15 @@ db_info = {
 }
 
 def _execute_code_sql(code, db_url=DB_URL):
-    with DBConn(db_url) as _conn:
-        if code.strip().lower().startswith("select") or code.strip().lower().startswith("with"):
-            df = pd.read_sql(code, _conn)
-            if df is not None and not df.empty:
-                st.dataframe(df)
-                st.download_button(
-                    label="Download CSV",
-                    data=df_to_csv(df, index=False),
-                    file_name=f"{DB_NAME}-{get_ts_now()}.csv",
-                    mime='text/csv',
-                )
-        elif code.strip().split(" ")[0].lower() in ["create", "insert","update", "delete", "drop"]:
+    if code.strip().lower().startswith("select") or code.strip().lower().startswith("with"):
+        # user datasets are queried via pooled read-only connections
+        with DBConn(db_url, read_only=True) as _conn:
+            tbl = query_arrow(_conn, code)
+            if tbl.num_rows > 0:
+                st.dataframe(tbl)
+                ui_download_arrow(tbl, file_stem=f"{DB_NAME}-{get_ts_now()}", key="sql_result")
+    elif code.strip().split(" ")[0].lower() in ["create", "insert","update", "delete", "drop"]:
+        with DBConn(db_url) as _conn:
             cur = _conn.cursor()
             cur.executescript(code)
             _conn.commit()
@@ -77,7 +74,7 @@ def do_database():
             key="select_table_name"
         )
         if st.button("Show Schema"):
-            with DBConn(db_url) as _conn:
+            with DBConn(db_url, read_only=True) as _conn:
                 df_schema = pd.read_sql(f"select sql from sqlite_schema where name = '{table_name}'; ", _conn)
                 schema_value = df_schema["sql"].to_list()[0]
                 st.session_state.update({"TABLE_SCHEMA" : schema_value})
@@ -85,6 +82,24 @@ def do_database():
     with c3:
         st.text_area("Schema:", value=schema_value, height=150)
 
+    c1, c2, _ = st.columns([2,2,4])
+    with c1:
+        export_fmt = st.selectbox("Export table as:", options=list(EXPORT_FORMATS.keys()), index=1, key="select_table_export_format")
+    with c2:
+        st.write("")
+        if st.button("Export Table"):
+            try:
+                data, n_rows = db_export_table(db_url, table_name, fmt=export_fmt)
+                suffix, mime = EXPORT_FORMATS[export_fmt]
+                st.download_button(
+                    label=f"Download {table_name}.{suffix} ({n_rows:,} rows)",
+                    data=data,
+                    file_name=f"{db_name}-{table_name}.{suffix}",
+                    mime=mime,
+                )
+            except:
+                st.error(format_exc())
+
     sql_stmt = st.text_area(
         "SQL Console:", 
         value=f"select * from {table_name} limit 5;", 
@@ -97,6 +112,9 @@ def do_database():
         except:
             st.error(format_exc())
 
+    if db_name != META_APP_NAME:
+        do_index_advisor(db_name, db_url)
+
     st.markdown(f"""
     #### Dataset Information
     """, unsafe_allow_html=True)
@@ -113,6 +131,46 @@ def do_database():
         st.image(schema_url)
 
 
+def do_index_advisor(db_name, db_url):
+    st.markdown(f"""
+    #### Index Advisor
+    """, unsafe_allow_html=True)
+
+    if st.button("Analyze Q&A History"):
+        try:
+            st.session_state.update({"INDEX_PROPOSALS" : (db_name, ui_advise_indexes(db_name, db_url))})
+        except:
+            st.error(format_exc())
+
+    adv_db_name, proposals = st.session_state.get("INDEX_PROPOSALS", (None, []))
+    if adv_db_name != db_name:
+        return
+    if not proposals:
+        st.info("No index recommended: recorded queries are already served by indexes (or no validated SQL yet)")
+        return
+
+    df_proposals = pd.DataFrame([
+        {"name": p["name"], "table": p["table"], "columns": ", ".join(p["columns"]), 
+         "key_columns": ", ".join(p["key_columns"]), "n_queries": p["n_queries"], "ddl": p["ddl"]}
+        for p in proposals
+    ])
+    st.dataframe(df_proposals, hide_index=True)
+    selected = st.multiselect(
+        "Indexes to create:",
+        options=df_proposals["name"].to_list(),
+        default=df_proposals["name"].to_list(),
+        key="select_index_proposals"
+    )
+    if st.button("Create Indexes") and selected:
+        try:
+            with st.spinner("Creating indexes and timing recorded queries ..."):
+                df_report = ui_apply_indexes(db_url, [p for p in proposals if p["name"] in selected])
+            st.session_state.pop("INDEX_PROPOSALS", None)
+            st.success(f"Created {len(selected)} index(es) and ran ANALYZE")
+            st.dataframe(df_report, hide_index=True)
+        except:
+            st.error(format_exc())
+
 ## sidebar Menu
 def do_sidebar():
     with st.sidebar:
@@ -67,18 +67,18 @@ def do_knowledgebase():
     with st.expander("Add Schema", expanded=False):
         c1, c2 = st.columns([2,2])
         with c1:
-            btn_add_all_ddl = st.button("Add All DDL scripts")
-            df_ddl = None
+            btn_add_all_ddl = st.button("Add All DDL scripts", help="Embed DDL of new or changed tables, remove dropped ones")
+            is_background_ddl = st.checkbox("Run in background", value=False, key="add_all_ddl_background")
             if btn_add_all_ddl:
-                sql_stmt = """
-                    select * from sqlite_master where type='table' and name not like 'sqlite%';
-                """
-                df_ddl = vn.run_sql(sql_stmt)
-                for ddl in df_ddl['sql'].to_list():
-                    ddl_text = strip_brackets(ddl)
-                    vn.train(ddl=ddl_text, dataset=DB_NAME)
-                if df_ddl is not None and not df_ddl.empty:
-                    st.dataframe(df_ddl)
+                if is_background_ddl:
+                    ui_submit_job("schema_sync", dict(cfg_data=cfg_data), title=f"Sync schema: {DB_NAME}")
+                else:
+                    with st.spinner("Syncing DDL scripts ..."):
+                        diff = sync_dataset_schema(cfg_data)
+                    st.caption(", ".join(f"{len(v)} {k}" for k, v in diff.items()))
+                    manifest = get_manifest(DB_NAME, CFG["META_DB_URL"])
+                    if manifest:
+                        st.dataframe(pd.DataFrame([dict(table_name=k, **v) for k, v in sorted(manifest.items())]), hide_index=True)
 
         with c2:
             ddl_sample = """CREATE TABLE IF NOT EXISTS t_person (
@@ -109,13 +109,22 @@ def do_knowledgebase():
         except Exception as e:
             st.warning(f"table '{TABLE_BUS_TERM}' not found, skip!")
 
-        if st.button("Add Bus Term", key="btn_add_bus_term"):
+        c5, c6 = st.columns([1,3])
+        with c5:
+            btn_add_bus_term = st.button("Add Bus Term", key="btn_add_bus_term")
+        with c6:
+            is_background_doc = st.checkbox("Run in background", value=False, key="add_bus_term_background")
+        if btn_add_bus_term:
             try:
                 if df_doc is not None and not df_doc.empty:
                     business_docs = convert_to_string_list(df_doc)
-                    for doc_text in business_docs:
-                        result = vn.train(documentation=doc_text, dataset=DB_NAME)
-                        st.write(result)
+                    if is_background_doc:
+                        ui_submit_job("train", dict(cfg_data=cfg_data, kind="documentation", items=business_docs), 
+                                      title=f"Add Bus Term: {DB_NAME}")
+                    else:
+                        with st.spinner(f"Embedding {len(business_docs)} business terms ..."):
+                            result = vn.train_bulk(documentation=business_docs, dataset=DB_NAME)
+                        st.write(result.get("documentation", []))
             except Exception as e:
                 st.warning(str(e))
 
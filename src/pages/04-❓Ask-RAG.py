@@ -11,6 +11,8 @@ KEY_PREFIX = f"col_{TABLE_NAME}"
 
 cfg_data = db_current_cfg()
 DB_URL = cfg_data.get("db_url")
+if is_rag:
+    ui_prewarm_retrieval(cfg_data)
 
 if "chat_history" not in st.session_state:
     st.session_state["chat_history"] = []
@@ -180,6 +182,13 @@ def db_insert_qa_result(qa_data, DEBUG_FLAG=True):
             logging.info(sql_script)
         db_run_sql(sql_script, _conn)
 
+    # add to semantic question cache
+    if is_rag and sql_is_valid == "Y" and my_question and sql_generated:
+        try:
+            semantic_cache_add(cfg_data, my_question, my_sql.get("data"))
+        except Exception as e:
+            logging.error(f"semantic_cache_add() failed: {str(e)}")
+
     # add to knowledge-base
     if st.session_state.get("out_allow_feedback", True) and sql_is_valid == "Y" and my_question and sql_generated:
         db_name = cfg_data.get("db_name")
@@ -209,16 +218,23 @@ def ask_llm_direct(my_question):
     # st.write(prompt)
 
     ts_start = time()
-    resp = ask_llm(cfg_data, question=prompt, enable_st_cache=st_cache_enabled)
+    if st.session_state.get("out_stream", True):
+        assistant_message = st.chat_message(
+            "assistant", avatar=VANNA_ICON_URL
+        )
+        resp = assistant_message.write_stream(ask_llm_stream(cfg_data, question=prompt, use_cache=st_cache_enabled))
+    else:
+        resp = ask_llm(cfg_data, question=prompt, enable_st_cache=st_cache_enabled)
+        if resp:
+            assistant_message = st.chat_message(
+                "assistant", avatar=VANNA_ICON_URL
+            )
+            assistant_message.write(resp)
     ts_stop = time()
     ts_delta = f"{(ts_stop-ts_start):.2f}"
     # print(f"[DEBUG] resp = {resp}")
 
     if resp:
-        assistant_message = st.chat_message(
-            "assistant", avatar=VANNA_ICON_URL
-        )
-        assistant_message.write(resp)
         # store response in my_sql column
         my_answer.update({"my_sql":{"data":resp, "ts_delta": ts_delta}})
         my_answer.update({"my_valid_sql":{"data":"N"}})
@@ -231,6 +247,92 @@ def ask_llm_direct(my_question):
 
     return my_answer
 
+def run_chart_stage(my_question, my_sql, my_df, st_cache_enabled=True):
+    """should_generate_chart -> generate_plotly_code -> generate_plot (runs in worker thread)
+    """
+    result = {}
+    if not should_generate_chart(cfg_data, df=my_df, enable_st_cache=st_cache_enabled):
+        return result
+
+    ts_start = time()
+    my_plot = generate_plotly_code(cfg_data, question=my_question, sql=my_sql, df=my_df, enable_st_cache=st_cache_enabled)
+    ts_stop = time()
+    ts_delta = f"{(ts_stop-ts_start):.2f}"
+    result.update({"my_plot":{"data":my_plot, "ts_delta": ts_delta}})
+    if not my_plot:
+        return result
+
+    if st.session_state.get("out_show_chart", True):
+        my_fig = generate_plot(cfg_data, code=my_plot, df=my_df, enable_st_cache=st_cache_enabled)
+        result.update({"my_fig":{"data":my_fig}})
+    return result
+
+def run_summary_stage(my_question, my_df, st_cache_enabled=True):
+    """generate_summary (runs in worker thread)
+    """
+    ts_start = time()
+    my_summary = generate_summary(cfg_data, question=my_question, df=my_df, enable_st_cache=st_cache_enabled)
+    ts_stop = time()
+    ts_delta = f"{(ts_stop-ts_start):.2f}"
+    return {"my_summary":{"data":my_summary, "ts_delta": ts_delta}} if my_summary else {}
+
+def stream_summary_stage(my_question, my_df, container, st_cache_enabled=True):
+    """generate_summary with tokens streamed into container (runs in main thread)
+    """
+    ts_start = time()
+    with container:
+        assistant_message_summary = st.chat_message(
+            "assistant",
+            avatar=VANNA_ICON_URL,
+        )
+        my_summary = assistant_message_summary.write_stream(
+            generate_summary_stream(cfg_data, question=my_question, df=my_df, use_cache=st_cache_enabled)
+        )
+    ts_stop = time()
+    ts_delta = f"{(ts_stop-ts_start):.2f}"
+    return {"my_summary":{"data":my_summary, "ts_delta": ts_delta}} if my_summary else {}
+
+def render_chart(container, result):
+    my_plot = result.get("my_plot", {}).get("data")
+    if not my_plot:
+        return
+
+    with container:
+        if st.session_state.get("out_show_plotly_code", False):
+            assistant_message_plotly_code = st.chat_message(
+                "assistant",
+                avatar=VANNA_ICON_URL,
+            )
+            assistant_message_plotly_code.code(
+                my_plot, language="python", line_numbers=True
+            )
+        else:
+            with st.expander("Show Python Code", expanded=False):
+                st.code(my_plot, language="python", line_numbers=True)            
+
+        if st.session_state.get("out_show_chart", True):
+            assistant_message_chart = st.chat_message(
+                "assistant",
+                avatar=VANNA_ICON_URL,
+            )
+            my_fig = result.get("my_fig", {}).get("data")
+            if my_fig is not None:
+                assistant_message_chart.plotly_chart(my_fig)
+            else:
+                assistant_message_chart.error("I couldn't generate a chart")
+
+def render_summary(container, result):
+    my_summary = result.get("my_summary", {}).get("data")
+    if not my_summary:
+        return
+
+    with container:
+        assistant_message_summary = st.chat_message(
+            "assistant",
+            avatar=VANNA_ICON_URL,
+        )
+        assistant_message_summary.text(my_summary)
+
 def ask_rag(my_question):
     # store question/results in session_state, prefix vars with "my_"
     # so that they can be displayed in another page or persisted
@@ -246,7 +348,32 @@ def ask_rag(my_question):
 
     with c_left:
         ts_start = time()
-        my_sql = generate_sql(cfg_data, question=my_question, use_last_n_message=use_last_n_message, enable_st_cache=st_cache_enabled)
+        cache_hit = None
+        if st.session_state.get("enable_semantic_cache", True):
+            try:
+                cache_hit = semantic_cache_lookup(cfg_data, my_question, 
+                            threshold=st.session_state.get("semantic_cache_threshold", DEFAULT_SIMILARITY_THRESHOLD))
+            except Exception as e:
+                logging.error(f"semantic_cache_lookup() failed: {str(e)}")
+
+        if cache_hit:
+            my_sql = cache_hit.get("sql")
+            st.caption(f"♻️ Reused validated SQL of a similar question (similarity = {cache_hit.get('score'):.3f}): {cache_hit.get('question')}")
+        elif st.session_state.get("out_stream", True):
+            # show raw LLM tokens while they arrive, then replace them by the extracted SQL
+            placeholder = st.empty()
+            llm_response = placeholder.write_stream(
+                generate_sql_stream(cfg_data, question=my_question, use_last_n_message=use_last_n_message, use_cache=st_cache_enabled)
+            )
+            placeholder.empty()
+            if "intermediate_sql" in llm_response:
+                # needs database introspection: run it and prompt with its result
+                my_sql = generate_sql_intermediate(cfg_data, question=my_question, llm_response=llm_response, 
+                            use_last_n_message=use_last_n_message, use_cache=st_cache_enabled)
+            else:
+                my_sql = extract_sql(cfg_data, llm_response)
+        else:
+            my_sql = generate_sql(cfg_data, question=my_question, use_last_n_message=use_last_n_message, enable_st_cache=st_cache_enabled)
         ts_stop = time()
         ts_delta = f"{(ts_stop-ts_start):.2f}"
         my_answer.update({"my_sql":{"data":my_sql, "ts_delta": ts_delta}})
@@ -269,12 +396,35 @@ def ask_rag(my_question):
             with st.expander("Show SQL Query", expanded=False):
                 st.code(my_sql, language="sql", line_numbers=True)
 
+        my_sql, cost_check = precheck_sql(cfg_data, my_question, my_sql, 
+                    use_last_n_message=use_last_n_message, enable_st_cache=st_cache_enabled)
+        if cost_check and cost_check.get("over_budget"):
+            issues = "".join(f"\n- {i}" for i in cost_check.get("issues", []))
+            st.warning(f"Expensive query: ~{cost_check['est_rows']:,} rows touched (budget {cost_check['budget']:,}){issues}")
+        if cost_check and (cost_check.get("rewritten_from") or cost_check.get("limit_added")):
+            if cost_check.get("rewritten_from"):
+                st.caption(f"SQL rewritten by LLM with query plan feedback (estimated rows: {cost_check['prev_est_rows']:,} → {cost_check['est_rows']:,}):")
+            else:
+                st.caption("LIMIT added by cost check:")
+            st.code(my_sql, language="sql", line_numbers=True)
+            my_answer.update({"my_sql":{"data":my_sql, "ts_delta": my_answer["my_sql"]["ts_delta"]}})
+        if cost_check and st.session_state.get("debug_ask_ai", False):
+            with st.expander("Query Plan", expanded=False):
+                st.code(cost_check.get("plan", ""))
+
         ts_start = time()
         my_df = run_sql(cfg_data, sql=my_sql, enable_st_cache=st_cache_enabled)
         ts_stop = time()
         ts_delta = f"{(ts_stop-ts_start):.2f}"        
         my_answer.update({"my_df":{"data":my_df, "ts_delta": ts_delta}})
 
+        if my_df is not None and my_df.attrs.get("truncated", False):
+            reason = my_df.attrs.get("truncated_reason")
+            if reason == "max_rows":
+                st.warning(f"Result truncated to the first {len(my_df)} rows (Max Rows)")
+            else:
+                st.warning(f"Query {reason} after {my_df.attrs.get('elapsed', 0):.1f}s, showing {len(my_df)} rows fetched so far")
+
         if my_df is None or my_df.empty: 
             return my_answer 
 
@@ -285,57 +435,36 @@ def ask_rag(my_question):
             )
             assistant_message_table.dataframe(my_df)
 
-    with c_right:
-
-        if should_generate_chart(cfg_data, df=my_df, enable_st_cache=st_cache_enabled):
-
-            ts_start = time()
-            my_plot = generate_plotly_code(cfg_data, question=my_question, sql=my_sql, df=my_df, enable_st_cache=st_cache_enabled)
-            ts_stop = time()
-            ts_delta = f"{(ts_stop-ts_start):.2f}"
-            my_answer.update({"my_plot":{"data":my_plot, "ts_delta": ts_delta}})
-            if not my_plot:
-                return my_answer
-
-            if st.session_state.get("out_show_plotly_code", False):
-                assistant_message_plotly_code = st.chat_message(
-                    "assistant",
-                    avatar=VANNA_ICON_URL,
-                )
-                assistant_message_plotly_code.code(
-                    my_plot, language="python", line_numbers=True
-                )
-            else:
-                with st.expander("Show Python Code", expanded=False):
-                    st.code(my_plot, language="python", line_numbers=True)            
-
-            if st.session_state.get("out_show_chart", True):
-                assistant_message_chart = st.chat_message(
-                    "assistant",
-                    avatar=VANNA_ICON_URL,
-                )
-                my_fig = generate_plot(cfg_data, code=my_plot, df=my_df, enable_st_cache=st_cache_enabled)
-                my_answer.update({"my_fig":{"data":my_fig}})
-                if my_fig is not None:
-                    assistant_message_chart.plotly_chart(my_fig)
-                else:
-                    assistant_message_chart.error("I couldn't generate a chart")
-
-    # display summary
+    # chart and summary stages only depend on my_df,
+    # run their LLM calls concurrently and render each one as soon as it completes
+    chart_area = c_right.container()
+    summary_area = st.container()
+
+    tasks = {
+        "chart": (run_chart_stage, dict(my_question=my_question, my_sql=my_sql, my_df=my_df, st_cache_enabled=st_cache_enabled)),
+    }
+    # a streamed summary is rendered by the main thread while the chart stage runs in the pool
+    foreground = None
+    stream_summary = st.session_state.get("out_stream", True)
     if st.session_state.get("out_show_summary", True):
-        ts_start = time()
-        my_summary = generate_summary(cfg_data, question=my_question, df=my_df, enable_st_cache=st_cache_enabled)
-        ts_stop = time()
-        ts_delta = f"{(ts_stop-ts_start):.2f}"
-        my_answer.update({"my_summary":{"data":my_summary, "ts_delta": ts_delta}})
-        if not my_summary:
-            return my_answer 
+        summary_kwargs = dict(my_question=my_question, my_df=my_df, st_cache_enabled=st_cache_enabled)
+        if stream_summary:
+            foreground = ("summary", stream_summary_stage, dict(container=summary_area, **summary_kwargs))
+        else:
+            tasks["summary"] = (run_summary_stage, summary_kwargs)
 
-        assistant_message_summary = st.chat_message(
-            "assistant",
-            avatar=VANNA_ICON_URL,
-        )
-        assistant_message_summary.text(my_summary)
+    for stage, result, error in run_concurrently(tasks, foreground=foreground):
+        if error is not None:
+            st.error(f"{stage} failed: {str(error)}")
+            continue
+        if not result:
+            continue
+
+        my_answer.update(result)
+        if stage == "chart":
+            render_chart(chart_area, result)
+        elif stage == "summary" and not stream_summary:
+            render_summary(summary_area, result)
 
     return my_answer
 
@@ -343,6 +472,14 @@ def ask_rag(my_question):
 def ask_ai():
     """ Question AI
     """
+    cancelled_df = st.session_state.pop("sql_cancelled_df", None)
+    if st.session_state.pop("sql_cancelled", False):
+        if cancelled_df is not None and not cancelled_df.empty:
+            st.info(f"SQL query cancelled after {cancelled_df.attrs.get('elapsed', 0):.1f}s, showing {len(cancelled_df)} rows fetched so far")
+            st.dataframe(cancelled_df)
+        else:
+            st.info("SQL query cancelled")
+
     my_question = st.chat_input(
         "Ask me a question about your data",
     )
@@ -396,14 +533,74 @@ def do_sidebar():
             st.checkbox("Show Summary", value=False, key="out_show_summary")
             # st.checkbox("Show Follow-up Questions", value=False, key="show_followup")
 
+            st.checkbox("Stream Response", value=True, key="out_stream",
+                        help="Show LLM tokens as they arrive")
             st.checkbox("Allow Feedback", value=True, key="out_allow_feedback")
             st.checkbox("Enable Streamlit Cache", value=True, key="enable_st_cache")
             st.number_input("SQL Limit", value=20, key="out_sql_limit")
+            st.number_input("SQL Timeout (sec)", min_value=1, value=SQL_TIMEOUT_SECONDS, key="sql_timeout",
+                            help="Generated SQL is interrupted after this wall-clock time")
+            st.number_input("Max Rows", min_value=1, value=SQL_MAX_ROWS, step=1000, key="sql_max_rows",
+                            help="Rows beyond this cap are not fetched")
+            st.number_input("Cost Budget (rows)", min_value=0, value=SQL_COST_BUDGET, step=100000, key="sql_cost_budget",
+                            help="Estimated rows touched (from EXPLAIN QUERY PLAN) above which a query is expensive, 0 disables the check")
+            st.selectbox("Over Budget Action", options=OVER_BUDGET_ACTIONS, index=0, key="sql_over_budget_action")
 
             st.checkbox("Debug", value=False, key="debug_ask_ai")
 
             # st.button("Reset", on_click=lambda: reset_my_state(), use_container_width=True)
 
+        with st.expander("Semantic Cache", expanded=False):
+            st.checkbox("Enable Semantic Cache", value=True, key="enable_semantic_cache",
+                        help="Reuse validated SQL of a similar past question without calling the LLM")
+            st.slider("Similarity Threshold", min_value=0.70, max_value=1.0, 
+                      value=DEFAULT_SIMILARITY_THRESHOLD, step=0.01, key="semantic_cache_threshold",
+                      help="Lower value gives more cache hits, but risks reusing SQL of a different question")
+            sc_stats = get_semantic_cache().stats()
+            c_1, c_2, c_3 = st.columns(3)
+            c_1.metric("Hits", sc_stats.get("hits", 0))
+            c_2.metric("Misses", sc_stats.get("misses", 0))
+            c_3.metric("Hit Rate", f"{100*sc_stats.get('hit_rate', 0):.1f}%")
+            if sc_stats.get("recent"):
+                st.caption("Recent lookups (best similarity score):")
+                st.dataframe(pd.DataFrame(sc_stats.get("recent")), hide_index=True)
+            if st.button("Reload Semantic Cache", key="btn_reload_semantic_cache"):
+                get_semantic_cache().invalidate()
+
+        with st.expander("LLM Cache", expanded=False):
+            cache_stats = get_llm_cache_stats()
+            if not cache_stats:
+                st.info("LLM cache is disabled (LLM_CACHE_ENABLED=0)")
+            else:
+                c_1, c_2 = st.columns(2)
+                c_1.metric("Hits", cache_stats.get("hits", 0))
+                c_2.metric("Misses", cache_stats.get("misses", 0))
+                c_1.metric("Hit Rate", f"{100*cache_stats.get('hit_rate', 0):.1f}%")
+                c_2.metric("Entries", cache_stats.get("entries", 0))
+                st.caption(f"Size: {cache_stats.get('size_bytes', 0)/1024/1024:.2f} MB, evictions: {cache_stats.get('evictions', 0)}")
+                st.button("Clear LLM Cache", on_click=clear_llm_cache, key="btn_clear_llm_cache")
+
+        with st.expander("Retrieval Cache", expanded=False):
+            rt_stats = get_retrieval_cache().stats()
+            c_1, c_2, c_3 = st.columns(3)
+            c_1.metric("Hits", rt_stats.get("hits", 0))
+            c_2.metric("Misses", rt_stats.get("misses", 0))
+            c_3.metric("Hit Rate", f"{100*rt_stats.get('hit_rate', 0):.1f}%")
+            st.caption(f"Entries (question embeddings and related DDL/documentation/SQL): {rt_stats.get('entries', 0)}")
+            emb_stats = get_embedding_function().stats()
+            if emb_stats:
+                st.caption(f"Embedding cache (on disk): {emb_stats.get('entries', 0)} vectors, hit rate {100*emb_stats.get('hit_rate', 0):.1f}%")
+            st.button("Clear Retrieval Cache", on_click=lambda: get_retrieval_cache().clear(), key="btn_clear_retrieval_cache")
+
+        with st.expander("Result Cache", expanded=False):
+            rc_stats = get_result_cache().stats()
+            c_1, c_2, c_3 = st.columns(3)
+            c_1.metric("Hits", rc_stats.get("hits", 0))
+            c_2.metric("Misses", rc_stats.get("misses", 0))
+            c_3.metric("Hit Rate", f"{100*rc_stats.get('hit_rate', 0):.1f}%")
+            st.caption(f"Entries: {rc_stats.get('entries', 0)}, memory: {rc_stats.get('memory_bytes', 0)/1024/1024:.2f} MB, disk: {rc_stats.get('disk_bytes', 0)/1024/1024:.2f} MB")
+            st.button("Clear Result Cache", on_click=lambda: get_result_cache().invalidate(), key="btn_clear_result_cache")
+
         sample_q = ""
         for db_name in sample_questions.keys():
             if db_name in DB_URL:
@@ -8,34 +8,8 @@ KEY_PREFIX = f"col_{TABLE_NAME}"
 
 SELECTED_COLS = [ "question", "sql_generated", "py_generated", "fig_generated", "summary_generated", "is_rag", "sql_is_valid", "id", "id_config"]
 
-def convert_df2md(df):
-    """
-    Convert a pandas DataFrame to a Markdown table.
-
-    Parameters:
-    df (pd.DataFrame): The input DataFrame to convert.
-
-    Returns:
-    str: A string containing the Markdown formatted table.
-    """
-    if df is None or df.empty:
-        return ""
-
-    # Get the column names and data rows
-    headers = list(df.columns)
-    rows = df.values.tolist()
-
-    # Create the header row
-    markdown_table = '| ' + ' | '.join(headers) + ' |\n'
-    markdown_table += '| ' + ' | '.join(['---'] * len(headers)) + ' |\n'
-
-    # Add data rows
-    for row in rows:
-        markdown_table += '| ' + ' | '.join(str(cell) for cell in row) + ' |\n'
-
-    return markdown_table
-
 def prepare_df(selected_cols, where_clause, DB_URL = CFG["META_DB_URL"]):
+    """return DataFrame of QA history (AgGrid takes pandas, so no Arrow round trip)"""
     df = None
     try:
         with DBConn(DB_URL) as _conn:
@@ -57,11 +31,15 @@ def review_qa_history():
     #     st.session_state.previous_row = None
     df = None 
 
-    c1, _, c2 = st.columns([2,1,10])
+    c1, _, c2, c3 = st.columns([2,1,8,2])
     with c1:
         btn_refresher = st.button("Refresher")
     with c2:
         search_question = st.text_input("🔍Search question:", key=f"{KEY_PREFIX}_search_question").strip()
+    with c3:
+        if st.button("Generate report (background)", key=f"{KEY_PREFIX}_btn_report"):
+            db_name = db_current_cfg().get("db_name")
+            ui_submit_job("qa_report", dict(db_name=db_name), title=f"Q&A report: {db_name}")
 
     where_clause = f" question like '%{search_question}%'" if search_question else " 1=1 "
 
@@ -82,12 +60,7 @@ def review_qa_history():
     if selected_rows is None or len(selected_rows) < 1:
 
         if df is not None and not df.empty:
-            st.download_button(
-                label="Download CSV",
-                data=df_to_csv(df, index=False),
-                file_name=f"qa_history-{get_ts_now()}.csv",
-                mime='text/csv',
-            )
+            ui_download_arrow(pa.Table.from_pandas(df, preserve_index=False), file_stem=f"qa_history-{get_ts_now()}", key=KEY_PREFIX)
 
         return
 
@@ -165,7 +138,7 @@ def review_qa_history():
                 fd_md.write(f"{md_text}\n")
 
             try:
-                with DBConn(cfg_db_url) as _conn2:
+                with DBConn(cfg_db_url, read_only=True) as _conn2:
                     my_df = pd.read_sql(row_sql_generated, _conn2) if row_sql_is_valid == "Y" else None
                     if my_df is not None:
                         st.dataframe(my_df)
@@ -69,20 +69,13 @@ def create_sqlite_ddl(df, table_name, file_name, column_mapping):
             'bool': 'INTEGER'
         }
         
-        # Add table comment with original filename
-        ddl = [f"-- Original CSV file: {file_name}"]
-        ddl.append(f"CREATE TABLE IF NOT EXISTS {table_name} (")
-        
-        # Add columns with comments showing original names
+        # columns with comments showing original names
         columns = []
         for orig_col, snake_col in column_mapping.items():
             sql_type = type_map.get(str(df[orig_col].dtype), 'TEXT')
-            columns.append(f"    {snake_col} {sql_type}  -- Original column: {orig_col}")
-        
-        ddl.append(",\n".join(columns))
-        ddl.append(");")
+            columns.append((snake_col, sql_type, f"Original column: {orig_col}"))
         
-        return "\n".join(ddl)
+        return sqlite_table_ddl(table_name, columns, header=f"Original CSV file: {file_name}")
     except Exception as e:
         st.error(f"Error generating DDL for {table_name}: {str(e)}")
         return None
@@ -125,7 +118,10 @@ def show_existing_db(key_pfx=""):
         if btn_drop and db_type in [DEFAULT_DB_DIALECT, "DuckDB"] and db_name not in [DEFAULT_DB_NAME]:
             # st.info(Path.cwd())
             # Remove directory and all its contents
+            close_pool(db_url)
             shutil.rmtree(Path.cwd() / f"{DB_PATH_SQLITE}/{db_name}")
+            # drop upload blobs no other dataset links to
+            prune_blobs()
 
 
 def csv_import_tool():
@@ -138,6 +134,12 @@ def csv_import_tool():
         st.session_state.table_names = {}
     if 'column_names' not in st.session_state:
         st.session_state.column_names = {}
+    if 'file_paths' not in st.session_state:
+        st.session_state.file_paths = {}
+    if 'index_columns' not in st.session_state:
+        st.session_state.index_columns = {}
+    if 'file_hashes' not in st.session_state:
+        st.session_state.file_hashes = {}
     
     st.subheader("Existing Dataset")
     show_existing_db(key_pfx="csv")
@@ -168,21 +170,30 @@ def csv_import_tool():
         if uploaded_files:
             for file in uploaded_files:
                 try:
-                    # Save file
+                    # Save file (streamed to disk block by block)
                     save_path = f"{DB_PATH_SQLITE}/{dataset_name}/{file.name}"
-                    with open(save_path, "wb") as f:
-                        f.write(file.getvalue())
+                    if st.session_state.file_paths.get(file.name) == save_path and \
+                        os.path.exists(save_path) and os.path.getsize(save_path) == file.size:
+                        continue
+                    saved = save_upload(file, save_path)
+                    if st.session_state.file_hashes.get(file.name) == saved["content_hash"] and \
+                        file.name in st.session_state.dataframes:
+                        # identical content, keep the parsed sample and mapping
+                        st.session_state.file_paths[file.name] = save_path
+                        continue
+                    st.session_state.file_hashes[file.name] = saved["content_hash"]
                     
-                    # Read DataFrame
-                    df = pd.read_csv(save_path, sep='\t',)
+                    # Read a sample for preview and type inference, the full file is streamed in "Load Data"
+                    df = sample_csv(save_path, sep='\t')
                     
                     # Validate DataFrame
-                    if not validate_dataframe(df, file.name):
+                    if not validate_dataframe(df, f"{file.name} (first {IMPORT_SAMPLE_ROWS} rows)"):
                         st.warning(f"invalid data file: {file.name}")
                         continue
                     
                     table_name = snake_case(os.path.splitext(file.name)[0])
                     st.session_state.dataframes[file.name] = df
+                    st.session_state.file_paths[file.name] = save_path
                     st.session_state.table_names[file.name] = table_name
                     st.session_state.column_names[file.name] = {col: snake_case(col) for col in df.columns}
                 
@@ -215,6 +226,15 @@ def csv_import_tool():
                     key=f"col_{file_name}_{orig_col}"
                 )
                 cols[orig_col] = new_col
+
+            # Indexes are built after the load, key-like columns are selected by default
+            st.session_state.index_columns[file_name] = st.multiselect(
+                "Index columns:",
+                options=list(df.columns),
+                default=[c for c in df.columns if cols[c] in auto_index_columns(cols.values())],
+                format_func=lambda c, cols=cols: cols[c],
+                key=f"index_{file_name}"
+            )
             
             # Show sample data
             st.write("Sample data (first 5 rows):")
@@ -279,21 +299,36 @@ def csv_import_tool():
     if st.session_state.dataframes:
         st.subheader("4. Load Data")
         
+        bulk_load = st.checkbox("Bulk-load mode", value=True, key="csv_bulk_load",
+                    help="Faster load without journal/fsync, indexes and ANALYZE run after the load")
+        is_background = st.checkbox("Run in background", value=False, key="csv_background",
+                    help="Load in a background job, progress is shown on page 'Jobs'")
         if st.button("Load Data"):
             loaded_tables = []
             db_path = f"{DB_PATH_SQLITE}/{dataset_name}/{dataset_name}.sqlite3"
-            conn = None
             try:
-                conn = sqlite3.connect(db_path)
+                # stream each CSV in chunks into the table created from its DDL (types inferred from sample),
+                # multiple files are parsed in parallel and written by a single connection
+                jobs = []
                 for file_name, df in st.session_state.dataframes.items():
                     table_name = st.session_state.table_names[file_name]
-                    try:
-                        # Rename columns before loading
-                        df_renamed = df.rename(columns=st.session_state.column_names[file_name])
-                        df_renamed.to_sql(table_name, conn, if_exists='replace', index=False)
-                        loaded_tables.append(table_name)
-                    except Exception as e:
-                        st.error(f"Error loading table {table_name}: {str(e)}")
+                    column_mapping = st.session_state.column_names[file_name]
+                    jobs.append(dict(
+                        name=file_name, kind="csv", sep='\t',
+                        path=st.session_state.file_paths[file_name],
+                        table=table_name,
+                        ddl=create_sqlite_ddl(df, table_name, file_name, column_mapping),
+                        columns=[column_mapping[c] for c in df.columns],
+                        indexes=[column_mapping[c] for c in st.session_state.index_columns.get(file_name, [])],
+                        content_hash=st.session_state.file_hashes.get(file_name),
+                    ))
+                if is_background:
+                    ui_submit_job("import", dict(db_path=db_path, jobs=jobs, bulk=bulk_load, cfg_data=db_current_cfg()), 
+                                  title=f"Import {len(jobs)} table(s) into {dataset_name}")
+                    results = {}
+                else:
+                    results = ui_import_files(db_path, jobs, bulk=bulk_load)
+                loaded_tables = [v["table"] for v in results.values() if v["status"] == "done"]
 
                 if loaded_tables:
                     loaded_tables = [f"<li>{i}</li>" for i in sorted(loaded_tables)]
@@ -304,9 +339,6 @@ def csv_import_tool():
                     """, unsafe_allow_html=True)
             except Exception as e:
                 st.error(f"Error connecting to database: {str(e)}")
-            finally:
-                if conn:
-                    conn.close()
 
 def main():
     try:
@@ -73,19 +73,13 @@ def create_sqlite_ddl(df, table_name, sheet_name, column_mapping, ignored_column
             'bool': 'INTEGER'
         }
         
-        ddl = [f"-- Original Excel sheet: {sheet_name}"]
-        ddl.append(f"CREATE TABLE IF NOT EXISTS {table_name} (")
-        
         columns = []
         for orig_col, snake_col in column_mapping.items():
             if orig_col not in ignored_columns:
                 sql_type = type_map.get(str(df[orig_col].dtype), 'TEXT')
-                columns.append(f"    {snake_col} {sql_type}  -- Original column: {orig_col}")
-        
-        ddl.append(",\n".join(columns))
-        ddl.append(");")
+                columns.append((snake_col, sql_type, f"Original column: {orig_col}"))
         
-        return "\n".join(ddl)
+        return sqlite_table_ddl(table_name, columns, header=f"Original Excel sheet: {sheet_name}")
     except Exception as e:
         st.error(f"Error generating DDL for {table_name}: {str(e)}")
         return None
@@ -128,7 +122,10 @@ def show_existing_db(key_pfx=""):
         if btn_drop and db_type in [DEFAULT_DB_DIALECT, "DuckDB"] and db_name not in [DEFAULT_DB_NAME]:
             # st.info(Path.cwd())
             # Remove directory and all its contents
+            close_pool(db_url)
             shutil.rmtree(Path.cwd() / f"{DB_PATH_SQLITE}/{db_name}")
+            # drop upload blobs no other dataset links to
+            prune_blobs()
 
 
 def xlsx_import_tool():
@@ -145,6 +142,8 @@ def xlsx_import_tool():
         st.session_state.ignored_sheets = set()
     if 'ignored_columns' not in st.session_state:
         st.session_state.ignored_columns = {}
+    if 'index_columns' not in st.session_state:
+        st.session_state.index_columns = {}
     
     st.subheader("Existing Dataset")
     show_existing_db(key_pfx="xlsx")
@@ -172,31 +171,31 @@ def xlsx_import_tool():
         uploaded_file = st.file_uploader("Upload Excel file", type=["xlsx", "xls"])
         if uploaded_file:
             try:
-                # Save file
+                # Save file (streamed to disk block by block), skip re-processing on reruns
                 save_path = f"{DB_PATH_SQLITE}/{dataset_name}/{uploaded_file.name}"
-                with open(save_path, "wb") as f:
-                    f.write(uploaded_file.getvalue())
-                
-                # Read all sheets
-                excel_file = pd.ExcelFile(save_path)
-                sheet_names = excel_file.sheet_names
-                
-                st.success(f"Found {len(sheet_names)} sheets in the Excel file")
-                
-                # Process each sheet
-                for sheet_name in sheet_names:
-                    df = pd.read_excel(save_path, sheet_name=sheet_name)
-                    
-                    if validate_dataframe(df, sheet_name):
-                        table_name = snake_case(sheet_name)
-                        st.session_state.sheets_data[sheet_name] = df
-                        st.session_state.table_names[sheet_name] = table_name
-                        st.session_state.column_names[sheet_name] = {col: snake_case(col) for col in df.columns}
-                        # Initialize ignored columns for this sheet
-                        if sheet_name not in st.session_state.ignored_columns:
-                            st.session_state.ignored_columns[sheet_name] = set()
-                    else:
-                        st.warning(f"invalid data sheet: {sheet_name}")
+                if not (st.session_state.get("xlsx_path") == save_path and \
+                        os.path.exists(save_path) and os.path.getsize(save_path) == uploaded_file.size):
+                    saved = save_upload(uploaded_file, save_path)
+                    st.session_state.xlsx_path = save_path
+                    if st.session_state.get("xlsx_hash") != saved["content_hash"] or not st.session_state.sheets_data:
+                        st.session_state.xlsx_hash = saved["content_hash"]
+
+                        # Sheets are streamed in read-only mode, only a sample of each sheet is kept
+                        # for preview and type inference, the data is read in "Load Data"
+                        sheets = sample_xlsx(save_path)
+                        st.success(f"Found {len(sheets)} sheets in the Excel file")
+
+                        for sheet_name, df in sheets.items():
+                            if validate_dataframe(df, f"{sheet_name} (first {IMPORT_SAMPLE_ROWS} rows)"):
+                                table_name = snake_case(sheet_name)
+                                st.session_state.sheets_data[sheet_name] = df
+                                st.session_state.table_names[sheet_name] = table_name
+                                st.session_state.column_names[sheet_name] = {col: snake_case(col) for col in df.columns}
+                                # Initialize ignored columns for this sheet
+                                if sheet_name not in st.session_state.ignored_columns:
+                                    st.session_state.ignored_columns[sheet_name] = set()
+                            else:
+                                st.warning(f"invalid data sheet: {sheet_name}")
             except Exception as e:
                 st.error(f"Error processing Excel file: {str(e)}")
     
@@ -251,6 +250,16 @@ def xlsx_import_tool():
                         else:
                             st.session_state.ignored_columns[sheet_name].discard(orig_col)
                 
+                # Indexes are built after the load, key-like columns are selected by default
+                kept_cols = [col for col in df.columns if col not in st.session_state.ignored_columns[sheet_name]]
+                st.session_state.index_columns[sheet_name] = st.multiselect(
+                    "Index columns:",
+                    options=kept_cols,
+                    default=[c for c in kept_cols if cols[c] in auto_index_columns(cols.values())],
+                    format_func=lambda c, cols=cols: cols[c],
+                    key=f"index_{sheet_name}"
+                )
+
                 # Show sample data
                 st.write("Sample data (first 5 rows):")
                 display_cols = [col for col in df.columns if col not in st.session_state.ignored_columns[sheet_name]]
@@ -314,25 +323,42 @@ def xlsx_import_tool():
     if st.session_state.sheets_data:
         st.subheader("4. Load Data")
         
+        bulk_load = st.checkbox("Bulk-load mode", value=True, key="xlsx_bulk_load",
+                    help="Faster load without journal/fsync, indexes and ANALYZE run after the load")
+        is_background = st.checkbox("Run in background", value=False, key="xlsx_background",
+                    help="Load in a background job, progress is shown on page 'Jobs'")
         if st.button("Load Data"):
             loaded_tables = []
             db_path = f"{DB_PATH_SQLITE}/{dataset_name}/{dataset_name}.sqlite3"
-            conn = None
             try:
-                conn = sqlite3.connect(db_path)
+                # only non-ignored sheets and columns are read, rows are streamed in batches,
+                # multiple sheets are parsed in parallel worker processes and written by a single connection
+                jobs = []
                 for sheet_name, df in st.session_state.sheets_data.items():
                     if sheet_name not in st.session_state.ignored_sheets:
                         table_name = st.session_state.table_names[sheet_name]
-                        try:
-                            # Filter out ignored columns and rename remaining ones
-                            df_filtered = df[[col for col in df.columns if col not in st.session_state.ignored_columns[sheet_name]]]
-                            column_mapping = {col: st.session_state.column_names[sheet_name][col] 
-                                           for col in df_filtered.columns}
-                            df_renamed = df_filtered.rename(columns=column_mapping)
-                            df_renamed.to_sql(table_name, conn, if_exists='replace', index=False)
-                            loaded_tables.append(table_name)
-                        except Exception as e:
-                            st.error(f"Error loading table {table_name}: {str(e)}")
+                        # Filter out ignored columns and rename remaining ones
+                        kept_cols = [col for col in df.columns if col not in st.session_state.ignored_columns[sheet_name]]
+                        jobs.append(dict(
+                            name=sheet_name, kind="xlsx", 
+                            path=st.session_state.xlsx_path, sheet=sheet_name,
+                            table=table_name,
+                            ddl=create_sqlite_ddl(df, table_name, sheet_name, 
+                                    st.session_state.column_names[sheet_name], 
+                                    st.session_state.ignored_columns[sheet_name]),
+                            columns=[st.session_state.column_names[sheet_name][col] for col in kept_cols],
+                            source_columns=kept_cols,
+                            indexes=[st.session_state.column_names[sheet_name][c] 
+                                        for c in st.session_state.index_columns.get(sheet_name, []) if c in kept_cols],
+                            content_hash=st.session_state.get("xlsx_hash"),
+                        ))
+                if is_background:
+                    ui_submit_job("import", dict(db_path=db_path, jobs=jobs, bulk=bulk_load, cfg_data=db_current_cfg()), 
+                                  title=f"Import {len(jobs)} table(s) into {dataset_name}")
+                    results = {}
+                else:
+                    results = ui_import_files(db_path, jobs, bulk=bulk_load)
+                loaded_tables = [v["table"] for v in results.values() if v["status"] == "done"]
 
                 if loaded_tables:
                     loaded_tables = [f"<li>{i}</li>" for i in sorted(loaded_tables)]
@@ -343,9 +369,6 @@ def xlsx_import_tool():
                     """, unsafe_allow_html=True)
             except Exception as e:
                 st.error(f"Error connecting to database: {str(e)}")
-            finally:
-                if conn:
-                    conn.close()
 
 def main():
     try:
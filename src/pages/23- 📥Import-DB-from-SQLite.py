@@ -2,36 +2,6 @@ from utils import *
 
 st.set_page_config(layout="wide")
 
-def get_all_tables(db_path):
-    """Get list of all tables in SQLite database."""
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [table[0] for table in cursor.fetchall()]
-        
-        conn.close()
-        return tables
-    except Exception as e:
-        st.error(f"Error reading database tables: {str(e)}")
-        return []
-
-def preview_table(db_path, table_name):
-    """Show preview of table data."""
-    try:
-        # Read first 5 rows from table
-        conn = sqlite3.connect(db_path)
-        query = f"SELECT * FROM {table_name} LIMIT 5"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        
-        return df
-    except Exception as e:
-        st.error(f"Error previewing table {table_name}: {str(e)}")
-        return None
-
 def show_existing_db(key_pfx=""):
     db_dialects = sorted(SQL_DIALECTS)
     c1, c2, c3, c4 = st.columns([1,1,4,1])
@@ -70,7 +40,10 @@ def show_existing_db(key_pfx=""):
         if btn_drop and db_type in [DEFAULT_DB_DIALECT, "DuckDB"] and db_name not in [DEFAULT_DB_NAME]:
             # st.info(Path.cwd())
             # Remove directory and all its contents
+            close_pool(db_url)
             shutil.rmtree(Path.cwd() / f"{DB_PATH_SQLITE}/{db_name}")
+            # drop upload blobs no other dataset links to
+            prune_blobs()
 
 def sqlite_import_tool():
     st.header("SQlite Import Tool 📥")
@@ -111,20 +84,32 @@ def sqlite_import_tool():
             try:
                 # Save the uploaded file with the new name
                 save_path = f"{DB_PATH_SQLITE}/{dataset_name}/{dataset_name}.sqlite3"
-                
-                # Write the uploaded file
-                with open(save_path, "wb") as f:
-                    f.write(uploaded_file.getvalue())
-                
-                st.success(f"""
-                Database imported successfully:
-                - Original file: {uploaded_file.name}
-                - Saved as: {save_path}
-                """)
+
+                if st.session_state.get("sqlite_upload") != (save_path, uploaded_file.file_id) or not os.path.exists(save_path):
+                    # release pooled connections to the file being replaced, stale WAL files belong to the old content
+                    close_pool(save_path)
+                    clear_catalog(save_path)
+                    for ext in ["-wal", "-shm"]:
+                        if os.path.exists(f"{save_path}{ext}"):
+                            os.remove(f"{save_path}{ext}")
+
+                    # Stream the upload into the content-addressed store, identical databases share one file on disk
+                    saved = save_upload(uploaded_file, save_path)
+                    same_datasets = [d for d in db_find_upload_datasets(saved["content_hash"]) if d != dataset_name]
+                    if dataset_name not in db_find_upload_datasets(saved["content_hash"]):
+                        db_record_upload(saved["content_hash"], uploaded_file.name, saved["n_bytes"], dataset_name)
+                    st.session_state.sqlite_upload = (save_path, uploaded_file.file_id)
+
+                    st.success(f"""
+                    Database imported successfully:
+                    - Original file: {uploaded_file.name}
+                    - Saved as: {save_path}
+                    """)
+                    if not saved["is_new"]:
+                        st.info(f"Identical file uploaded before{' as ' + ', '.join(same_datasets) if same_datasets else ''}: linked, not copied")
 
                 DB_LOADED = True
                 
-                
             except Exception as e:
                 st.error(f"Error processing database file: {str(e)}")
 
@@ -132,22 +117,26 @@ def sqlite_import_tool():
         # Preview Section - Now in full width below upload section
         st.subheader("2. Preview Data")
         
-        # Get all tables
-        tables = get_all_tables(save_path)
-        
+        # integrity check, schema, row counts and previews in one pass over one connection (cached per file version)
+        with st.spinner("Checking database integrity (PRAGMA quick_check) ..."):
+            catalog = get_catalog(save_path, check=True)
+        if catalog["quick_check"]:
+            st.error("Database integrity check failed:")
+            st.code("\n".join(catalog["quick_check"]))
+            return
+
+        tables = catalog["tables"]
         if tables:
             st.success(f"Imported {len(tables)} tables:")
-            tab_list = ',\t '.join(tables)
+            tab_list = ',\t '.join(tables.keys())
             st.info(f"{tab_list}")
             
             # Preview each table
-            for table in tables:
-                with st.expander(f"Table: {table}"):
+            for table, info in tables.items():
+                with st.expander(f"Table: {table} ({info['row_count']:,} rows)"):
                     st.caption("First 5 rows:")
-                    df = preview_table(save_path, table)
-                    if df is not None:
-                        st.dataframe(df)
-                        st.caption(f"Columns: {', '.join(df.columns)}")
+                    st.dataframe(info["preview"])
+                    st.caption(f"Columns: {', '.join(c for c, _ in info['columns'])}")
         else:
             st.warning("No tables found in database")
 
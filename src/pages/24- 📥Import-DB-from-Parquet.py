@@ -0,0 +1,342 @@
+from utils import *
+
+st.set_page_config(layout="wide")
+
+def show_file_stats(file_path, schema, file_name):
+    """Show row count (from file metadata), columns and file size."""
+    try:
+        if arrow_format(file_path) == "parquet":
+            import pyarrow.parquet as pq
+            meta = pq.ParquetFile(file_path).metadata
+            n_rows, n_groups = meta.num_rows, meta.num_row_groups
+        else:
+            n_rows, n_groups = None, None
+
+        with st.expander(f"📊 File Stats - {file_name}"):
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Rows", f"{n_rows:,}" if n_rows is not None else "n/a")
+            col2.metric("Columns", len(schema))
+            col3.metric("Row Groups", n_groups if n_groups is not None else "n/a")
+            col4.metric("Size", f"{os.path.getsize(file_path) / 1024:.2f} KB")
+        return True
+    except Exception as e:
+        st.error(f"Error reading metadata of {file_name}: {str(e)}")
+        return False
+
+def add_download_buttons(dataset_name):
+    """Add download buttons for DDL and SQLite database."""
+    try:
+        col1, col2 = st.columns(2)
+
+        # Download DDL
+        ddl_path = f"{DB_PATH_SQLITE}/{dataset_name}/{dataset_name}_ddl.sql"
+        if os.path.exists(ddl_path):
+            with open(ddl_path, 'r') as f:
+                ddl_content = f.read()
+            col1.download_button(
+                "📥 Download DDL",
+                ddl_content,
+                file_name=f"{dataset_name}_ddl.sql",
+                mime="text/plain"
+            )
+
+        # Download SQLite DB
+        db_path = f"{DB_PATH_SQLITE}/{dataset_name}/{dataset_name}.sqlite3"
+        if os.path.exists(db_path):
+            with open(db_path, 'rb') as f:
+                db_content = f.read()
+            col2.download_button(
+                "📥 Download SQLite DB",
+                db_content,
+                file_name=f"{dataset_name}.sqlite3",
+                mime="application/x-sqlite3"
+            )
+    except Exception as e:
+        st.error(f"Error setting up download buttons: {str(e)}")
+
+def create_sqlite_ddl(schema, table_name, file_name, column_mapping, selected_columns):
+    """Generate SQLite DDL from the Arrow schema, with comments for original filename and column names."""
+    try:
+        columns = []
+        for orig_col in selected_columns:
+            arrow_type = schema.field(orig_col).type
+            columns.append((column_mapping[orig_col], arrow_sqlite_type(arrow_type), f"Original column: {orig_col} ({arrow_type})"))
+
+        return sqlite_table_ddl(table_name, columns, header=f"Original file: {file_name}")
+    except Exception as e:
+        st.error(f"Error generating DDL for {table_name}: {str(e)}")
+        return None
+
+def show_existing_db(key_pfx=""):
+    db_dialects = sorted(SQL_DIALECTS)
+    c1, c2, c3, c4 = st.columns([1,1,4,1])
+    with c1:
+        db_type = st.selectbox(
+            "SQL DB Type",
+            options=db_dialects,
+            index=db_dialects.index(DEFAULT_DB_DIALECT),
+            key=f"{key_pfx}_db_type_select"
+        )
+        if db_type != DEFAULT_DB_DIALECT:
+            st.error(f"Unsupported DB Type: {db_type}")
+            return
+
+        avail_dbs = list_datasets(db_type)
+        if not avail_dbs:
+            st.error("No dataset found, please import first")
+            return
+
+    with c2:
+        db_names = sorted(list(avail_dbs.keys()))
+        db_name = st.selectbox(
+            "DB Name",
+            options=(db_names),
+            index=0,
+            key=f"{key_pfx}_db_name_select"
+        )
+    with c3:
+        db_url = st.text_input(
+            "DB URL",
+            value=avail_dbs[db_name].get("db_url"),
+            key=f"{key_pfx}_db_url"
+        )
+    with c4:
+        btn_drop = st.button("Drop")
+        if btn_drop and db_type in [DEFAULT_DB_DIALECT, "DuckDB"] and db_name not in [DEFAULT_DB_NAME]:
+            # Remove directory and all its contents
+            close_pool(db_url)
+            shutil.rmtree(Path.cwd() / f"{DB_PATH_SQLITE}/{db_name}")
+            # drop upload blobs no other dataset links to
+            prune_blobs()
+
+
+def parquet_import_tool():
+    st.header("Parquet / Arrow Import Tool 📥")
+
+    # Initialize session state
+    if 'pq_schemas' not in st.session_state:
+        st.session_state.pq_schemas = {}
+    if 'pq_samples' not in st.session_state:
+        st.session_state.pq_samples = {}
+    if 'pq_file_paths' not in st.session_state:
+        st.session_state.pq_file_paths = {}
+    if 'pq_table_names' not in st.session_state:
+        st.session_state.pq_table_names = {}
+    if 'pq_column_names' not in st.session_state:
+        st.session_state.pq_column_names = {}
+    if 'pq_selected_columns' not in st.session_state:
+        st.session_state.pq_selected_columns = {}
+    if 'pq_index_columns' not in st.session_state:
+        st.session_state.pq_index_columns = {}
+    if 'pq_file_hashes' not in st.session_state:
+        st.session_state.pq_file_hashes = {}
+
+    st.subheader("Existing Dataset")
+    show_existing_db(key_pfx="parquet")
+
+    # Section 1: Upload files
+    st.subheader("1. Upload Parquet / Arrow IPC")
+
+    c1, _, c2 = st.columns([3,1,6])
+    with c1:
+        dataset_name = st.text_input("Dataset Name")
+
+        # Early return if no dataset name
+        if not dataset_name:
+            st.error("Please enter a dataset name")
+            return
+
+        if st.button("Create Dataset"):
+            try:
+                # Create directories
+                Path(f"{DB_PATH_SQLITE}/{dataset_name}").mkdir(parents=True, exist_ok=True)
+                st.success(f"Created dataset directory: {DB_PATH_SQLITE}/{dataset_name}")
+            except Exception as e:
+                st.error(f"Error creating dataset directory: {str(e)}")
+                return
+
+    with c2:
+        uploaded_files = st.file_uploader(
+            "Upload Parquet / Arrow IPC (Feather) files",
+            type=[s.lstrip(".") for s in ARROW_FORMATS.keys()],
+            accept_multiple_files=True
+        )
+        if uploaded_files:
+            for file in uploaded_files:
+                try:
+                    # Save file (streamed to disk block by block)
+                    save_path = f"{DB_PATH_SQLITE}/{dataset_name}/{file.name}"
+                    if st.session_state.pq_file_paths.get(file.name) == save_path and \
+                        os.path.exists(save_path) and os.path.getsize(save_path) == file.size:
+                        continue
+                    saved = save_upload(file, save_path)
+                    if st.session_state.pq_file_hashes.get(file.name) == saved["content_hash"] and \
+                        file.name in st.session_state.pq_schemas:
+                        # identical content, keep the schema and mapping
+                        st.session_state.pq_file_paths[file.name] = save_path
+                        continue
+                    st.session_state.pq_file_hashes[file.name] = saved["content_hash"]
+
+                    # Only the schema and a sample batch are read here, the data is streamed in "Load Data"
+                    schema = read_arrow_schema(save_path)
+                    if not show_file_stats(save_path, schema, file.name):
+                        st.warning(f"invalid data file: {file.name}")
+                        continue
+
+                    st.session_state.pq_schemas[file.name] = schema
+                    st.session_state.pq_samples[file.name] = sample_arrow(save_path, nrows=5)
+                    st.session_state.pq_file_paths[file.name] = save_path
+                    st.session_state.pq_table_names[file.name] = snake_case(os.path.splitext(file.name)[0])
+                    st.session_state.pq_column_names[file.name] = {col: snake_case(col) for col in schema.names}
+                    st.session_state.pq_selected_columns[file.name] = list(schema.names)
+
+                except Exception as e:
+                    st.error(f"Error processing file {file.name}: {str(e)}")
+                    continue
+
+    # Section 2: Review Data
+    if st.session_state.pq_schemas:
+        st.subheader("2. Review Data")
+
+        for file_name, schema in st.session_state.pq_schemas.items():
+            st.subheader(f"File: '{file_name}' ")
+
+            # Table name input
+            new_table_name = st.text_input(
+                f"Table name:",
+                value=st.session_state.pq_table_names[file_name],
+                key=f"pq_table_{file_name}"
+            )
+            st.session_state.pq_table_names[file_name] = new_table_name
+
+            # Column projection, columns not selected are never read from the file
+            st.session_state.pq_selected_columns[file_name] = st.multiselect(
+                "Columns to load:",
+                options=list(schema.names),
+                default=st.session_state.pq_selected_columns[file_name],
+                key=f"pq_select_{file_name}"
+            )
+
+            # Column name inputs
+            st.write("Column names:")
+            cols = st.session_state.pq_column_names[file_name]
+            for orig_col in st.session_state.pq_selected_columns[file_name]:
+                new_col = st.text_input(
+                    f"Rename column: {orig_col} ({schema.field(orig_col).type})",
+                    value=cols[orig_col],
+                    key=f"pq_col_{file_name}_{orig_col}"
+                )
+                cols[orig_col] = new_col
+
+            # Indexes are built after the load, key-like columns are selected by default
+            selected = st.session_state.pq_selected_columns[file_name]
+            st.session_state.pq_index_columns[file_name] = st.multiselect(
+                "Index columns:",
+                options=selected,
+                default=[c for c in selected if cols[c] in auto_index_columns([cols[c] for c in selected])],
+                format_func=lambda c, cols=cols: cols[c],
+                key=f"pq_index_{file_name}"
+            )
+
+            # Show sample data
+            st.write("Sample data (first 5 rows):")
+            st.dataframe(st.session_state.pq_samples[file_name][selected])
+
+    # Section 3: Create Tables
+    if st.session_state.pq_schemas:
+        st.subheader("3. Create Tables")
+
+        # Generate DDL with timestamp and subheader
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        all_ddl = [
+            f"-- Generated on: {timestamp}",
+            f"-- Dataset: {dataset_name}",
+            ""
+        ]
+
+        ddls = {}
+        for file_name, schema in st.session_state.pq_schemas.items():
+            if not st.session_state.pq_selected_columns[file_name]:
+                st.warning(f"No column selected for '{file_name}', skipped")
+                continue
+            ddl = create_sqlite_ddl(
+                schema,
+                st.session_state.pq_table_names[file_name],
+                file_name,
+                st.session_state.pq_column_names[file_name],
+                st.session_state.pq_selected_columns[file_name]
+            )
+            if ddl:
+                ddls[file_name] = ddl
+                all_ddl.append(ddl)
+                all_ddl.append("")  # Empty line between tables
+
+        ddl_content = "\n".join(all_ddl)
+        st.code(ddl_content, language="sql")
+
+        try:
+            # Save DDL to file
+            ddl_path = f"{DB_PATH_SQLITE}/{dataset_name}/{dataset_name}_ddl.sql"
+            with open(ddl_path, "w", encoding='utf-8') as f:
+                f.write(ddl_content)
+            st.success(f"DDL saved to: '{ddl_path}'")
+        except Exception as e:
+            st.error(f"Error saving DDL file: {str(e)}")
+
+        # Add download buttons after tables are created
+        add_download_buttons(dataset_name)
+
+    # Section 4: Load Data
+    if st.session_state.pq_schemas:
+        st.subheader("4. Load Data")
+
+        bulk_load = st.checkbox("Bulk-load mode", value=True, key="pq_bulk_load",
+                    help="Faster load without journal/fsync, indexes and ANALYZE run after the load")
+        is_background = st.checkbox("Run in background", value=False, key="pq_background",
+                    help="Load in a background job, progress is shown on page 'Jobs'")
+        if st.button("Load Data"):
+            db_path = f"{DB_PATH_SQLITE}/{dataset_name}/{dataset_name}.sqlite3"
+            try:
+                # tables are (re)created from their DDL, only the selected columns are read,
+                # batch by batch (Parquet row groups / Arrow record batches)
+                jobs = []
+                for file_name, ddl in ddls.items():
+                    file_path = st.session_state.pq_file_paths[file_name]
+                    column_mapping = st.session_state.pq_column_names[file_name]
+                    selected = st.session_state.pq_selected_columns[file_name]
+                    jobs.append(dict(
+                        name=file_name, kind=arrow_format(file_path),
+                        path=file_path,
+                        table=st.session_state.pq_table_names[file_name],
+                        ddl=ddl,
+                        columns=[column_mapping[c] for c in selected],
+                        source_columns=selected,
+                        indexes=[column_mapping[c] for c in st.session_state.pq_index_columns.get(file_name, [])],
+                        content_hash=st.session_state.pq_file_hashes.get(file_name),
+                    ))
+                if is_background:
+                    ui_submit_job("import", dict(db_path=db_path, jobs=jobs, bulk=bulk_load, cfg_data=db_current_cfg()), 
+                                  title=f"Import {len(jobs)} table(s) into {dataset_name}")
+                    results = {}
+                else:
+                    results = ui_import_files(db_path, jobs, bulk=bulk_load)
+                loaded_tables = [v["table"] for v in results.values() if v["status"] == "done"]
+
+                if loaded_tables:
+                    loaded_tables = [f"<li>{i}</li>" for i in sorted(loaded_tables)]
+                    table_list = "\n".join(loaded_tables)
+                    st.success(f"Data loaded successfully:")
+                    st.markdown(f"""
+                        {table_list}
+                    """, unsafe_allow_html=True)
+            except Exception as e:
+                st.error(f"Error connecting to database: {str(e)}")
+
+def main():
+    try:
+        parquet_import_tool()
+    except Exception as e:
+        st.error(str(e))
+
+if __name__ == "__main__":
+    main()
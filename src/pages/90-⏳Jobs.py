@@ -0,0 +1,64 @@
+from utils import *
+
+st.set_page_config(layout="wide")
+st.header(f"{STR_MENU_JOBS} ⏳")
+
+KEY_PREFIX = "col_t_job"
+REFRESH_SECONDS = 2
+
+STATUS_ICONS = {
+    JOB_STATUS_QUEUED: "🕒",
+    JOB_STATUS_RUNNING: "⏳",
+    "done": "✅",
+    "error": "❌",
+    "cancelled": "🚫",
+}
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def show_active_jobs():
+    """progress of queued/running jobs, refreshed every few seconds"""
+    jobs = list_jobs(status=[JOB_STATUS_QUEUED, JOB_STATUS_RUNNING], db_url=CFG["META_DB_URL"])
+    if not jobs:
+        st.info("No active jobs")
+        return
+    for job in jobs:
+        c1, c2 = st.columns([8,1])
+        with c1:
+            text = f"{STATUS_ICONS.get(job['status'], '')} #{job['id']} {job['title']}: {job['message'] or job['status']}"
+            st.progress(float(job["progress"] or 0.0), text=text)
+        with c2:
+            if st.button("Cancel", key=f"{KEY_PREFIX}_cancel_{job['id']}", disabled=bool(job["cancel_requested"])):
+                cancel_job(job["id"], db_url=CFG["META_DB_URL"])
+                st.rerun(scope="fragment")
+
+def show_job_history():
+    jobs = list_jobs(limit=100, db_url=CFG["META_DB_URL"])
+    if not jobs:
+        return
+    df = pd.DataFrame(jobs)
+    df["status"] = df["status"].map(lambda s: f"{STATUS_ICONS.get(s, '')} {s}")
+    cols = ["id", "job_type", "title", "status", "progress", "message", "result",
+            "created_by", "created_at", "started_at", "finished_at"]
+    st.dataframe(df[cols], hide_index=True,
+                 column_config={"progress": st.column_config.ProgressColumn("progress", min_value=0.0, max_value=1.0)})
+
+def do_jobs():
+    ensure_job_workers()
+
+    st.subheader("Active Jobs")
+    show_active_jobs()
+
+    c1, _ = st.columns([2,8])
+    with c1:
+        st.button("Refresh", key=f"{KEY_PREFIX}_refresh")
+    st.subheader("Job History")
+    show_job_history()
+
+def main():
+    try:
+        do_jobs()
+    except Exception as e:
+        st.error(str(e))
+
+if __name__ == '__main__':
+    main()
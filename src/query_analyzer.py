@@ -0,0 +1,187 @@
+"""
+Pre-flight cost check of SQL queries on SQLite datasets
+
+EXPLAIN QUERY PLAN is parsed into scan/search steps, table sizes are taken from
+sqlite_stat1 (or a cached COUNT(*)), and the number of rows touched is estimated
+by walking the join loops: a full SCAN multiplies the outer loop by the table size,
+an index SEARCH costs about one lookup per outer row.
+"""
+
+from threading import Lock
+import logging
+import os
+import re
+
+from db_engine import get_pool
+from result_cache import db_file_version
+
+SQL_COST_BUDGET = int(os.getenv("SQL_COST_BUDGET", 5000000))    # estimated rows touched
+LARGE_TABLE_ROWS = 100000
+UNKNOWN_TABLE_ROWS = 1000    # e.g. CTE, subquery, view
+
+OVER_BUDGET_ACTIONS = ["Warn", "Add LIMIT", "Ask LLM to rewrite"]
+
+# (db_url, version) -> {table_name_lower: row_count}
+_ROW_COUNTS = {}
+_ROW_COUNTS_LOCK = Lock()
+
+def explain_query_plan(conn, sql):
+    """return list of (id, parent, detail)"""
+    sql = sql.strip().rstrip(";")
+    return [(r[0], r[1], r[3]) for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+
+def list_tables(conn):
+    return [r[0] for r in conn.execute("select name from sqlite_schema where type = 'table' and name not like 'sqlite_%'").fetchall()]
+
+def stat1_row_counts(conn):
+    """row counts from sqlite_stat1 (written by ANALYZE), first number of stat column"""
+    counts = {}
+    try:
+        for tbl, stat in conn.execute("select tbl, stat from sqlite_stat1").fetchall():
+            if stat:
+                counts[tbl.lower()] = int(str(stat).split()[0])
+    except Exception:
+        pass  # no sqlite_stat1 table
+    return counts
+
+def table_row_counts(db_url, conn, tables=None):
+    """row counts of tables, cached per database file version
+
+    COUNT(*) is only run for (referenced) tables that are missing in sqlite_stat1
+    """
+    key = (str(db_url), db_file_version(db_url))
+    with _ROW_COUNTS_LOCK:
+        counts = _ROW_COUNTS.get(key)
+        if counts is None:
+            # drop counts of older versions
+            for k in [k for k in _ROW_COUNTS if k[0] == key[0]]:
+                _ROW_COUNTS.pop(k)
+            counts = stat1_row_counts(conn)
+            _ROW_COUNTS[key] = counts
+
+    all_tables = {t.lower(): t for t in list_tables(conn)}
+    for t in (tables if tables is not None else all_tables.keys()):
+        t = t.lower()
+        if t in counts or t not in all_tables:
+            continue
+        counts[t] = conn.execute(f'select count(*) from "{all_tables[t]}"').fetchone()[0]
+    return counts
+
+def parse_table_aliases(sql):
+    """map alias/name (lower) -> table name (lower) for FROM/JOIN clauses"""
+    aliases = {}
+    pattern = r'(?:\bfrom|\bjoin|,)\s+["`\[]?(\w+)["`\]]?(?:\s+(?:as\s+)?(\w+))?'
+    keywords = {"where", "on", "join", "inner", "left", "right", "full", "cross", "natural",
+                "group", "order", "limit", "using", "union", "having", "outer", "select"}
+    for table, alias in re.findall(pattern, sql, flags=re.I):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.lower() not in keywords:
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+def parse_plan_step(detail):
+    """parse 'SCAN t', 'SCAN TABLE t AS a', 'SEARCH a USING INDEX ...' into (op, name, rest)"""
+    m = re.match(r"(SCAN|SEARCH)\s+(?:TABLE\s+)?(\S+)(?:\s+AS\s+(\S+))?(.*)", detail)
+    if not m:
+        return None
+    op, name, alias, rest = m.groups()
+    return op, (alias or name), rest.strip()
+
+def estimate_cost(plan, row_counts, aliases):
+    """walk plan steps, return (est_rows, steps, issues)"""
+    steps, issues = [], []
+    loop_rows, total = 1, 0
+    nodes = {node_id: (parent, detail) for node_id, parent, detail in plan}
+
+    def _correlated(parent):
+        # a CORRELATED ... SUBQUERY runs once per outer row
+        while parent in nodes:
+            parent, detail = nodes[parent]
+            if detail.startswith("CORRELATED"):
+                return True
+        return False
+
+    for node_id, parent, detail in plan:
+        parsed = parse_plan_step(detail)
+        if parsed is None:
+            if "TEMP B-TREE" in detail:
+                steps.append(dict(detail=detail, table=None, rows=None, cost=0))
+            continue
+        op, name, rest = parsed
+        table = aliases.get(name.lower(), name.lower())
+        rows = row_counts.get(table)
+        n = rows if rows is not None else UNKNOWN_TABLE_ROWS
+        auto_index = "AUTOMATIC" in rest
+
+        if parent != 0 and _correlated(parent):
+            if op == "SCAN" and loop_rows > 1:
+                issues.append(f"correlated subquery scans '{table}' ({n:,} rows) for each of ~{loop_rows:,} outer rows")
+            cost = loop_rows * (n if op == "SCAN" else 1)
+        elif parent != 0:
+            # subquery / materialized CTE, runs once
+            cost = n if op == "SCAN" else 1
+        elif op == "SCAN":
+            if loop_rows > 1 and rows is not None and rows >= LARGE_TABLE_ROWS:
+                issues.append(f"nested full scan of large table '{table}' ({n:,} rows) for each of ~{loop_rows:,} outer rows")
+            loop_rows *= n
+            cost = loop_rows
+        elif auto_index:
+            issues.append(f"join on '{table}' without index (SQLite builds an automatic index on {n:,} rows per query)")
+            cost = n + loop_rows
+        else:
+            cost = loop_rows
+        total += cost
+
+        if op == "SCAN" and rows is not None and rows >= LARGE_TABLE_ROWS and parent == 0 and loop_rows == rows:
+            issues.append(f"full table scan of large table '{table}' ({n:,} rows)")
+        steps.append(dict(detail=detail, table=table, rows=rows, cost=cost))
+    return total, steps, issues
+
+def analyze_sql(db_url, sql, budget=SQL_COST_BUDGET):
+    """EXPLAIN QUERY PLAN based pre-check of a query
+
+    return dict(est_rows, over_budget, issues, steps, plan) or None if the plan
+    cannot be obtained (e.g. invalid SQL, the query itself will report the error)
+    """
+    try:
+        with get_pool(db_url).connection() as conn:
+            plan = explain_query_plan(conn, sql)
+            aliases = parse_table_aliases(sql)
+            row_counts = table_row_counts(db_url, conn, tables=set(aliases.values()))
+    except Exception as e:
+        logging.warning(f"[query_analyzer] EXPLAIN QUERY PLAN failed: {str(e)}")
+        return None
+
+    est_rows, steps, issues = estimate_cost(plan, row_counts, aliases)
+    return {
+        "est_rows": est_rows,
+        "budget": budget,
+        "over_budget": bool(budget) and est_rows > budget,
+        "issues": issues,
+        "steps": steps,
+        "plan": "\n".join(d for _, _, d in plan),
+    }
+
+def add_limit(sql, limit):
+    """cap the result of a query by wrapping it, unless it ends with a LIMIT clause already"""
+    sql = sql.strip().rstrip(";").strip()
+    if re.search(r"\blimit\s+\d+(\s*(offset|,)\s*\d+)?\s*$", sql, flags=re.I):
+        return f"{sql};"
+    return f"SELECT * FROM (\n{sql}\n) LIMIT {int(limit)};"
+
+def plan_feedback(sql, analysis):
+    """text appended to the question when asking the LLM to rewrite an expensive query"""
+    issues = "\n".join(f"- {i}" for i in analysis.get("issues", [])) or "- too many rows touched"
+    return f"""
+        The following SQL query is too expensive to run, it touches an estimated {analysis['est_rows']:,} rows (budget: {analysis['budget']:,}):
+        {sql}
+
+        Query plan:
+        {analysis['plan']}
+
+        Issues:
+        {issues}
+
+        Rewrite the SQL query to answer the question at lower cost: filter on indexed columns, avoid cross joins and
+        joins on non-indexed columns, aggregate early, and limit the number of rows returned.
+    """
@@ -0,0 +1,227 @@
+"""
+SQL result cache
+
+Query results are cached per (db_url, normalized SQL, db file version), where the
+version is the mtime/size of the database file and its WAL, so any write to the
+dataset (e.g. an import) invalidates its cached results automatically.
+
+Entries are kept in an in-memory LRU bounded by a memory budget, large DataFrames
+are spilled to Parquet files on disk (with its own LRU budget). The index of
+spilled files lives in memory, so each process spills into its own subdirectory,
+locked while the process runs; directories of exited processes are removed at startup.
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+import hashlib
+import logging
+import os
+import re
+import shutil
+import uuid
+
+try:
+    import fcntl    # lock of a process's spill dir, not on Windows
+except ImportError:
+    fcntl = None
+
+import pandas as pd
+
+def normalize_sql(sql):
+    """strip comments, trailing semicolons and collapse whitespace
+    (literals are kept as-is, so no case folding)
+    """
+    sql = re.sub(r"--[^\n]*", " ", sql or "")
+    sql = re.sub(r"/\*.*?\*/", " ", sql, flags=re.S)
+    sql = " ".join(sql.split())
+    return sql.rstrip("; ")
+
+def db_file_version(db_url):
+    """version stamp of a file-based database: mtime/size of db file (and its WAL)
+    """
+    stamp = []
+    for path in (str(db_url), f"{db_url}-wal"):
+        try:
+            st = os.stat(path)
+            stamp.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            stamp.append("-")
+    return "|".join(stamp)
+
+def df_nbytes(df):
+    try:
+        return int(df.memory_usage(deep=True).sum())
+    except Exception:
+        return 0
+
+
+class ResultCache(object):
+    """LRU cache of query results with memory budget and spill-to-disk"""
+
+    def __init__(self, spill_dir, max_memory_bytes=256*1024*1024,
+                 spill_threshold_bytes=32*1024*1024, max_disk_bytes=2*1024*1024*1024):
+        self.spill_root = Path(spill_dir)
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_threshold_bytes = spill_threshold_bytes
+        self.max_disk_bytes = max_disk_bytes
+        # key -> dict(db_url, version, df, path, size, disk_size)
+        self.entries = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        self.spill_root.mkdir(parents=True, exist_ok=True)
+        self.spill_dir, self.spill_lock = self._make_spill_dir()
+        self._sweep_spill_dirs()
+
+    @staticmethod
+    def make_key(db_url, sql, version):
+        return hashlib.sha256(f"{db_url}\n{version}\n{normalize_sql(sql)}".encode("utf-8")).hexdigest()
+
+    def get(self, db_url, sql):
+        version = db_file_version(db_url)
+        key = self.make_key(db_url, sql, version)
+        with self.lock:
+            self._purge_stale(db_url, version)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        if entry["df"] is not None:
+            # callers (e.g. generated plotly code) may modify df
+            return entry["df"].copy()
+        try:
+            return self._read_spill(entry["path"])
+        except Exception as e:
+            logging.warning(f"[ResultCache] failed to read {entry['path']}: {str(e)}")
+            with self.lock:
+                self._drop(key)
+            return None
+
+    def put(self, db_url, sql, df):
+        if df is None or not isinstance(df, pd.DataFrame):
+            return
+        version = db_file_version(db_url)
+        key = self.make_key(db_url, sql, version)
+        size = df_nbytes(df)
+        entry = dict(db_url=str(db_url), version=version, df=None, path=None, size=0, disk_size=0)
+
+        if size > self.spill_threshold_bytes:
+            try:
+                entry["path"], entry["disk_size"] = self._write_spill(key, df)
+            except Exception as e:
+                logging.warning(f"[ResultCache] spill failed, result not cached: {str(e)}")
+                return
+        else:
+            entry["df"], entry["size"] = df.copy(), size
+
+        with self.lock:
+            self._drop(key)
+            self.entries[key] = entry
+            self.memory_bytes += entry["size"]
+            self.disk_bytes += entry["disk_size"]
+            self._evict()
+
+    def _write_spill(self, key, df):
+        path = self.spill_dir / f"{key}.parquet"
+        try:
+            df.to_parquet(path, index=False)
+        except Exception:
+            # e.g. mixed-type object columns, keep dtypes as-is
+            path = self.spill_dir / f"{key}.pkl"
+            df.to_pickle(path)
+        return path, path.stat().st_size
+
+    @staticmethod
+    def _read_spill(path):
+        if path.suffix == ".parquet":
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+
+    def _make_spill_dir(self):
+        """spill dir of this process, set up under a hidden name (never swept) and locked before it appears"""
+        name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        tmp = self.spill_root / f".{name}"
+        tmp.mkdir()
+        lock_file = None
+        if fcntl:
+            lock_file = open(tmp / ".lock", "a+b")
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        spill_dir = tmp.rename(self.spill_root / name)
+        return spill_dir, lock_file
+
+    def _sweep_spill_dirs(self):
+        """remove spill dirs of exited processes (their lock is free) and loose files of the old layout,
+        spill files of live processes sharing the root are kept
+        """
+        n_removed = 0
+        for path in self.spill_root.iterdir():
+            if path.name.startswith(".") or path == self.spill_dir:
+                continue
+            try:
+                if path.is_file():
+                    if path.suffix in (".parquet", ".pkl"):
+                        path.unlink()
+                        n_removed += 1
+                    continue
+                if fcntl is None:
+                    continue
+                with open(path / ".lock", "rb") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    shutil.rmtree(path, ignore_errors=True)
+                    n_removed += 1
+            except OSError:
+                # locked by a live process
+                continue
+        if n_removed:
+            logging.info(f"[ResultCache] removed {n_removed} spill dirs/files of exited processes")
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.memory_bytes -= entry["size"]
+        self.disk_bytes -= entry["disk_size"]
+        if entry["path"] is not None:
+            try:
+                entry["path"].unlink()
+            except OSError:
+                pass
+
+    def _purge_stale(self, db_url, version):
+        """drop results of older versions of this database"""
+        stale = [k for k, v in self.entries.items() if v["db_url"] == str(db_url) and v["version"] != version]
+        for k in stale:
+            self._drop(k)
+        if stale:
+            logging.info(f"[ResultCache] invalidated {len(stale)} results of {db_url}")
+
+    def _evict(self):
+        for key in list(self.entries.keys()):
+            if self.memory_bytes <= self.max_memory_bytes and self.disk_bytes <= self.max_disk_bytes:
+                break
+            entry = self.entries[key]
+            if (entry["size"] and self.memory_bytes > self.max_memory_bytes) or \
+               (entry["disk_size"] and self.disk_bytes > self.max_disk_bytes):
+                self._drop(key)
+
+    def invalidate(self, db_url=None):
+        with self.lock:
+            for key in [k for k, v in self.entries.items() if db_url is None or v["db_url"] == str(db_url)]:
+                self._drop(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "entries": len(self.entries),
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes,
+        }
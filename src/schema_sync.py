@@ -0,0 +1,128 @@
+"""
+Incremental sync of dataset DDL into the vector store
+
+Each table's DDL is hashed and recorded in t_schema_sync (the manifest of a dataset),
+so a sync embeds only new or changed tables and deletes the vectors of changed or
+dropped ones. Syncing an unchanged dataset costs one DDL query and no embedding.
+
+The vector id of a DDL is derived from its text (see vector_store.py), so two tables of a
+dataset with identical DDL share one vector: an id is only deleted when no other table refers to it.
+"""
+
+from pathlib import Path
+import hashlib
+import logging
+import sqlite3
+from datetime import datetime
+
+from vanna.utils import deterministic_uuid
+
+from vector_store import TRAINING_KINDS
+
+META_DB_URL = Path(__file__).parent / "store/sql/sqlite/data_copilot/data_copilot.sqlite3"
+
+def get_ts_now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def ddl_hash(ddl):
+    """hash of DDL text, insensitive to whitespace"""
+    return hashlib.sha256(" ".join(str(ddl).split()).encode("utf-8")).hexdigest()
+
+def ddl_vector_id(ddl):
+    return deterministic_uuid(ddl) + TRAINING_KINDS["ddl"]
+
+def _connect(db_url=META_DB_URL):
+    conn = sqlite3.connect(db_url, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def get_manifest(db_name, db_url=META_DB_URL):
+    """table_name -> dict(ddl_hash, vector_id) of a dataset"""
+    with _connect(db_url) as conn:
+        rows = conn.execute("""
+            select table_name, ddl_hash, vector_id from t_schema_sync where db_name = ?
+        """, (db_name,)).fetchall()
+    return {r["table_name"]: dict(ddl_hash=r["ddl_hash"], vector_id=r["vector_id"]) for r in rows}
+
+def diff_schema(ddls, manifest):
+    """compare current DDL (table_name -> ddl) with the manifest
+
+    Returns:
+        dict(added, changed, removed, unchanged), lists of table names
+    """
+    diff = dict(added=[], changed=[], removed=[], unchanged=[])
+    for table_name, ddl in ddls.items():
+        entry = manifest.get(table_name)
+        if entry is None:
+            diff["added"].append(table_name)
+        elif entry["ddl_hash"] != ddl_hash(ddl):
+            diff["changed"].append(table_name)
+        else:
+            diff["unchanged"].append(table_name)
+    diff["removed"] = [t for t in manifest if t not in ddls]
+    return diff
+
+def _referenced_ids(db_name, vector_ids, db_url=META_DB_URL):
+    """vector ids still referred to by the manifest of a dataset"""
+    if not vector_ids:
+        return set()
+    with _connect(db_url) as conn:
+        rows = conn.execute(f"""
+            select distinct vector_id from t_schema_sync
+            where db_name = ? and vector_id in ({','.join('?' * len(vector_ids))})
+        """, [db_name] + list(vector_ids)).fetchall()
+    return {r[0] for r in rows}
+
+def sync_schema(vn, db_name, ddls, db_url=META_DB_URL, user="", progress_callback=None):
+    """embed new/changed table DDL of a dataset, delete vectors of changed/dropped tables
+
+    Args:
+        vn: Vanna instance with MyChromaDB_VectorStore
+        ddls: dict of table_name -> DDL
+        progress_callback: called with (kind, n_done, n_total) while embedding
+
+    Returns:
+        dict(added, changed, removed, unchanged), lists of table names
+    """
+    manifest = get_manifest(db_name, db_url)
+    diff = diff_schema(ddls, manifest)
+    if diff["unchanged"]:
+        # vectors removed since the last sync (e.g. "Remove All") are embedded again
+        ids = [manifest[t]["vector_id"] for t in diff["unchanged"]]
+        stored = set(vn.ddl_collection.get(ids=ids, include=[])["ids"])
+        missing = [t for t in diff["unchanged"] if manifest[t]["vector_id"] not in stored]
+        diff["unchanged"] = [t for t in diff["unchanged"] if t not in missing]
+        diff["added"] += missing
+    to_embed = diff["added"] + diff["changed"]
+    to_drop = diff["changed"] + diff["removed"]
+    if not to_embed and not to_drop:
+        return diff
+
+    if to_embed:
+        vn.add_bulk("ddl", [ddls[t] for t in to_embed], dataset=db_name, progress_callback=progress_callback)
+
+    curr_ts = get_ts_now()
+    with _connect(db_url) as conn:
+        conn.executemany("delete from t_schema_sync where db_name = ? and table_name = ?",
+                         [(db_name, t) for t in diff["removed"]])
+        conn.executemany("""
+            insert into t_schema_sync(db_name, table_name, ddl_hash, vector_id, created_at, updated_at, created_by, updated_by)
+            values(?, ?, ?, ?, ?, ?, ?, ?)
+            on conflict(db_name, table_name) do update set
+                ddl_hash = excluded.ddl_hash, vector_id = excluded.vector_id,
+                updated_at = excluded.updated_at, updated_by = excluded.updated_by
+        """, [(db_name, t, ddl_hash(ddls[t]), ddl_vector_id(ddls[t]), curr_ts, curr_ts, user, user) for t in to_embed])
+
+    # vectors of old DDL versions, unless the same DDL is still used by another table
+    stale_ids = {manifest[t]["vector_id"] for t in to_drop}
+    stale_ids -= _referenced_ids(db_name, stale_ids, db_url)
+    if stale_ids:
+        vn.delete_training_ids("ddl", stale_ids)
+
+    logging.info(f"[schema_sync] {db_name}: " + ", ".join(f"{len(v)} {k}" for k, v in diff.items()))
+    return diff
+
+def clear_manifest(db_name, db_url=META_DB_URL):
+    """forget the manifest of a dataset (e.g. after its vectors were removed), the next sync embeds all tables"""
+    with _connect(db_url) as conn:
+        conn.execute("delete from t_schema_sync where db_name = ?", (db_name,))
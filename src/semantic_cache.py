@@ -0,0 +1,134 @@
+"""
+Semantic question cache
+
+Keeps an in-memory embedding index of previously validated questions per dataset
+(rows in t_qa with sql_is_valid = 'Y') so that a re-worded question can reuse
+the validated SQL instead of another generate_sql round-trip. A hit also requires
+the same numbers and quoted literals ("top 5 ... in 2023" is not "top 10 ... in 2024"),
+as embeddings barely tell them apart.
+
+Embeddings are produced by the same embedding function that ChromaDB_VectorStore uses.
+"""
+
+from collections import deque
+from threading import Lock
+import logging
+import re
+
+import numpy as np
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.90
+EMBED_BATCH_SIZE = 64
+
+def normalize_question(question):
+    return " ".join(str(question).lower().split())
+
+_LITERAL_RE = re.compile(r"""'([^']*)'|"([^"]*)"|(?<![\w.])(\d+(?:\.\d+)?)(?![\w.])""")
+
+def question_literals(question):
+    """sorted numbers and quoted strings of a question, they must match for SQL reuse"""
+    literals = []
+    for quoted1, quoted2, number in _LITERAL_RE.findall(str(question)):
+        literals.append(number if number else (quoted1 or quoted2))
+    return sorted(literals)
+
+def embed_texts(embedding_function, texts, batch_size=EMBED_BATCH_SIZE):
+    """embed texts in batches, return L2-normalized float32 matrix"""
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(embedding_function(texts[i:i+batch_size]))
+    m = np.asarray(vectors, dtype=np.float32)
+    if m.ndim == 1:
+        m = m.reshape(1, -1)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+class SemanticQuestionCache(object):
+    """Cosine-similarity lookup of validated question/SQL pairs, per dataset"""
+
+    def __init__(self, threshold=DEFAULT_SIMILARITY_THRESHOLD, history_size=50):
+        self.threshold = threshold
+        self.datasets = {}    # dataset -> dict(questions=[], sqls=[], matrix=np.ndarray)
+        self.hits = 0
+        self.misses = 0
+        # recent (question, best_score, is_hit) for threshold tuning
+        self.recent = deque(maxlen=history_size)
+        self.lock = Lock()
+
+    def is_loaded(self, dataset):
+        return dataset in self.datasets
+
+    def load(self, dataset, qa_pairs, embedding_function):
+        """(re)build the index of a dataset from list of (question, sql)"""
+        latest = {}
+        for question, sql in qa_pairs:
+            key = normalize_question(question)
+            if key and sql and key not in latest:
+                latest[key] = (question, sql)
+
+        questions = [q for q, _ in latest.values()]
+        sqls = [s for _, s in latest.values()]
+        matrix = embed_texts(embedding_function, questions) if questions else None
+        with self.lock:
+            self.datasets[dataset] = dict(questions=questions, sqls=sqls, matrix=matrix)
+        logging.info(f"[SemanticCache] loaded {len(questions)} questions for dataset '{dataset}'")
+
+    def add(self, dataset, question, sql, embedding_function):
+        if not self.is_loaded(dataset) or not question or not sql:
+            return
+        entry = self.datasets[dataset]
+        key = normalize_question(question)
+        if key in [normalize_question(q) for q in entry["questions"]]:
+            return
+        v = embed_texts(embedding_function, [question])
+        with self.lock:
+            entry["questions"].append(question)
+            entry["sqls"].append(sql)
+            entry["matrix"] = v if entry["matrix"] is None else np.vstack([entry["matrix"], v])
+
+    def lookup(self, dataset, question, embedding_function, threshold=None):
+        """return dict(sql, score, question) of the closest validated question
+        above threshold, or None
+        """
+        threshold = self.threshold if threshold is None else threshold
+        entry = self.datasets.get(dataset)
+        best_score, result = 0.0, None
+        if entry and entry["matrix"] is not None and len(entry["questions"]):
+            v = embed_texts(embedding_function, [question])[0]
+            scores = entry["matrix"] @ v
+            best_score = float(scores.max())
+            literals = question_literals(question)
+            # closest question above threshold with the same literals
+            for i in np.argsort(-scores):
+                if scores[i] < threshold:
+                    break
+                if question_literals(entry["questions"][i]) == literals:
+                    result = dict(sql=entry["sqls"][i], score=float(scores[i]), question=entry["questions"][i])
+                    break
+
+        with self.lock:
+            if result:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.recent.appendleft(dict(question=question, best_score=round(best_score, 4), is_hit=result is not None))
+        return result
+
+    def invalidate(self, dataset=None):
+        with self.lock:
+            if dataset is None:
+                self.datasets.clear()
+            else:
+                self.datasets.pop(dataset, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "questions": {k: len(v["questions"]) for k, v in self.datasets.items()},
+            "recent": list(self.recent),
+        }
@@ -141,3 +141,76 @@ CREATE TABLE if not exists t_note
 -- select * from t_note;
 
 
+
+-- content-addressed uploads (see upload_store.py):
+-- one row per file content loaded into a dataset table ('' for a whole SQLite database)
+-- drop table t_upload;
+CREATE TABLE if not exists t_upload
+(
+    id INTEGER PRIMARY KEY AUTOINCREMENT
+
+    , content_hash text NOT NULL   -- sha256 of file content
+    , file_name text
+    , file_size INTEGER
+    , db_name text
+    , table_name text DEFAULT ''
+    , load_key text DEFAULT ''     -- hash of DDL and column mapping, a changed mapping reloads the table
+    , row_count INTEGER
+
+    , is_active INTEGER DEFAULT 1 CHECK(is_active IN (0, 1))
+    , created_at text
+    , updated_at text
+    , created_by text  NOT NULL -- user email
+    , updated_by text  
+);
+CREATE INDEX if not exists idx_t_upload_content_hash ON t_upload(content_hash);
+-- select * from t_upload;
+
+
+-- background jobs (see job_queue.py): imports, knowledge base training, reports
+-- drop table t_job;
+CREATE TABLE if not exists t_job
+(
+    id INTEGER PRIMARY KEY AUTOINCREMENT
+
+    , job_type text NOT NULL      -- import, train, qa_report
+    , title text
+    , params text                 -- JSON
+    , status text DEFAULT 'queued' CHECK(status IN ('queued', 'running', 'done', 'error', 'cancelled'))
+    , progress REAL DEFAULT 0     -- 0..1
+    , message text
+    , result text                 -- JSON
+    , cancel_requested INTEGER DEFAULT 0 CHECK(cancel_requested IN (0, 1))
+    , pid INTEGER                 -- worker process
+    , worker_token text           -- boot id, pid and start time of the worker, pids are reused
+    , started_at text
+    , finished_at text
+
+    , is_active INTEGER DEFAULT 1 CHECK(is_active IN (0, 1))
+    , created_at text
+    , updated_at text
+    , created_by text  NOT NULL -- user email
+    , updated_by text  
+);
+CREATE INDEX if not exists idx_t_job_status ON t_job(status);
+-- select * from t_job order by id desc;
+
+
+-- manifest of table DDL embedded into the vector store per dataset (see schema_sync.py)
+-- drop table t_schema_sync;
+CREATE TABLE if not exists t_schema_sync
+(
+    id INTEGER PRIMARY KEY AUTOINCREMENT
+
+    , db_name text NOT NULL
+    , table_name text NOT NULL
+    , ddl_hash text NOT NULL      -- sha256 of whitespace-normalized DDL
+    , vector_id text              -- id in the ddl collection
+
+    , created_at text
+    , updated_at text
+    , created_by text
+    , updated_by text  
+    , UNIQUE(db_name, table_name)
+);
+-- select * from t_schema_sync;
@@ -0,0 +1,116 @@
+"""
+Content-addressed storage of uploaded files
+
+Uploads are hashed (sha256) block by block while they are copied to disk, and kept once
+under store/uploads/<hash[:2]>/<hash>. Dataset directories get a hard link to the blob,
+so the same file uploaded again (or into another dataset) takes no extra disk space,
+and t_upload (see utils.py) records which tables were already loaded from which content.
+
+A linked file is shared: before a dataset file is modified, unshare_file() gives it its own copy.
+"""
+
+from pathlib import Path
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+UPLOAD_STORE_PATH = os.getenv("UPLOAD_STORE_PATH", "store/uploads")
+HASH_BLOCK = 1024*1024    # bytes
+
+def blob_path(content_hash, store=UPLOAD_STORE_PATH):
+    return Path(store) / content_hash[:2] / content_hash
+
+def hash_file(file_path, block_size=HASH_BLOCK):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def store_upload(uploaded_file, store=UPLOAD_STORE_PATH, block_size=HASH_BLOCK):
+    """copy a file-like object into the store block by block, hashing as it goes
+
+    Returns:
+        (content_hash, n_bytes, blob, is_new), is_new=False if the content was stored already
+    """
+    Path(store).mkdir(parents=True, exist_ok=True)
+    h = hashlib.sha256()
+    n_bytes = 0
+    uploaded_file.seek(0)
+    fd, tmp_path = tempfile.mkstemp(dir=store, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                block = uploaded_file.read(block_size)
+                if not block:
+                    break
+                h.update(block)
+                f.write(block)
+                n_bytes += len(block)
+        content_hash = h.hexdigest()
+        blob = blob_path(content_hash, store)
+        if blob.exists() and blob.stat().st_size == n_bytes:
+            os.remove(tmp_path)
+            return content_hash, n_bytes, blob, False
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, blob)
+        return content_hash, n_bytes, blob, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def link_file(src, dst):
+    """make dst the same file as src: hard link, or a copy across file systems
+
+    dst is replaced atomically, never written in place (it may be linked to another blob)
+    return "same" | "link" | "copy"
+    """
+    src, dst = Path(src), Path(dst)
+    if dst.exists() and os.path.samefile(src, dst):
+        return "same"
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.link")
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        os.link(src, tmp)
+        how = "link"
+    except OSError:
+        shutil.copyfile(src, tmp)
+        how = "copy"
+    os.replace(tmp, dst)
+    return how
+
+def is_shared(file_path):
+    try:
+        return os.stat(file_path).st_nlink > 1
+    except OSError:
+        return False
+
+def unshare_file(file_path):
+    """copy-on-write: give a hard-linked file its own copy before it is modified,
+    so the blob and other datasets linked to it stay unchanged
+    """
+    if not is_shared(file_path):
+        return False
+    file_path = Path(file_path)
+    tmp = file_path.with_name(f".{file_path.name}.cow")
+    shutil.copyfile(file_path, tmp)
+    os.replace(tmp, file_path)
+    logging.info(f"[upload_store] unshared {file_path}")
+    return True
+
+def prune_blobs(store=UPLOAD_STORE_PATH):
+    """remove blobs no dataset links to anymore, return number of blobs removed"""
+    n = 0
+    for blob in Path(store).glob("??/*"):
+        if blob.is_file() and blob.stat().st_nlink == 1:
+            blob.unlink()
+            n += 1
+    return n
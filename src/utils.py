@@ -15,8 +15,11 @@ from traceback import format_exc
 from pathlib import Path
 from uuid import uuid4
 import json
+import hashlib
 import jsonlines
 from time import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 
 import click   # CLI interface
 
@@ -24,12 +27,14 @@ import click   # CLI interface
 from bs4 import BeautifulSoup
 from lxml import html
 import pandas as pd
+import pyarrow as pa
 import sqlite3
 
 import google.generativeai as genai 
 
 # streamlit libs
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from streamlit_option_menu import option_menu
 from st_aggrid import (
     AgGrid, GridOptionsBuilder, GridUpdateMode
@@ -37,6 +42,21 @@ from st_aggrid import (
 )
 
 from ui_layout import *
+from db_engine import (get_pool, close_pool, mark_dataset_changed, query_arrow, arrow_to_bytes, export_query, run_sql_guarded, 
+    SQL_TIMEOUT_SECONDS, SQL_MAX_ROWS, DUCKDB_DIALECT, DUCKDB_SUFFIXES, DDL_QUERIES, EXPORT_FORMATS)
+from import_engine import (save_upload, sample_csv, sample_xlsx, load_job, import_parallel, 
+    bulk_load_mode, finalize_load, auto_index_columns, IMPORT_SAMPLE_ROWS,
+    sample_arrow, read_arrow_schema, arrow_format, arrow_sqlite_type, ARROW_FORMATS)
+from contextlib import nullcontext
+from upload_store import is_shared, unshare_file, prune_blobs
+from db_catalog import get_catalog, clear_catalog
+from job_queue import (submit_job, list_jobs, get_job, cancel_job, start_workers, JobCancelled,
+    JOB_WORKERS, JOB_FINAL_STATUS, JOB_STATUS_RUNNING, JOB_STATUS_QUEUED)
+from query_analyzer import analyze_sql, add_limit, plan_feedback, SQL_COST_BUDGET, OVER_BUDGET_ACTIONS
+from index_advisor import advise_indexes, apply_indexes
+from schema_sync import sync_schema, get_manifest, clear_manifest
+from vector_store import get_retrieval_cache, RETRIEVAL_PREWARM_QUESTIONS
+from embedding_engine import get_embedding_function
 
 from vanna_calls import (
     # helper functions
@@ -59,13 +79,26 @@ from vanna_calls import (
     generate_summary_not_cached,
     ask_llm_not_cached,
 
+    generate_sql_stream,
+    generate_sql_intermediate,
+    generate_summary_stream,
+    ask_llm_stream,
+    extract_sql,
+
     parse_llm_model_spec,
     get_ollama_models,
+    get_llm_cache_stats,
+    clear_llm_cache,
+    get_semantic_cache,
+    get_result_cache,
+    prewarm_retrieval,
 
     # constants
+    DEFAULT_SIMILARITY_THRESHOLD,
     META_APP_NAME,
     DEFAULT_USER,
     DEFAULT_DB_DIALECT,
+    FILE_DB_DIALECTS,
     DEFAULT_DB_NAME,
     DEFAULT_VECTOR_DB,
     DEFAULT_LLM_MODEL,
@@ -113,6 +146,7 @@ STR_MENU_RESULT          = "Review Q&A History"
 STR_MENU_EVAL            = "Evaluate LLM Models"
 STR_MENU_NOTE            = "Take Notes"
 STR_MENU_IMPORT_DATA     = "Import Data"
+STR_MENU_JOBS            = "Background Jobs"
 STR_MENU_ACKNOWLEDGE     = "Thank You"
 
 STR_SAVE = "✅ Save" # 💾
@@ -164,14 +198,36 @@ def fix_None_val(v):
 #  DB related  (2nd)
 #############################
 class DBConn(object):
-    def __init__(self, db_file=CFG["META_DB_URL"]):
-        self.conn = sqlite3.connect(db_file)
+    """SQLite connection context manager
+
+    read_only=True borrows a pooled read-only connection (see db_engine.py) for user datasets,
+    otherwise (and always for the meta DB) a new read-write connection is opened
+    """
+    def __init__(self, db_file=CFG["META_DB_URL"], read_only=False):
+        self.read_only = read_only and str(db_file) != str(CFG["META_DB_URL"])
+        self.conn = None
+        if self.read_only:
+            self.pool_ctx = get_pool(db_file).connection()
+        else:
+            if str(db_file) != str(CFG["META_DB_URL"]) and is_shared(db_file):
+                # copy-on-write of a dataset file linked to an upload blob (see upload_store.py),
+                # pooled readers and the cached catalog still refer to the old inode
+                close_pool(db_file)
+                clear_catalog(db_file)
+                unshare_file(db_file)
+            self.conn = sqlite3.connect(db_file, timeout=30)
+            self.conn.execute("PRAGMA temp_store=MEMORY;")
 
     def __enter__(self):
+        if self.read_only:
+            self.conn = self.pool_ctx.__enter__()
         return self.conn
 
     def __exit__(self, type, value, traceback):
-        self.conn.close()
+        if self.read_only:
+            self.pool_ctx.__exit__(type, value, traceback)
+        else:
+            self.conn.close()
 
 class DBUtils():
     """SQLite database query utility """
@@ -280,14 +336,28 @@ def list_datasets(db_type=DEFAULT_DB_DIALECT):
     Returns:
         dict of datasets
     """
-    sufix = db_type.lower()
-    datasets = {}
+    if db_type == DUCKDB_DIALECT:
+        # DuckDB also queries SQLite datasets (attached via sqlite scanner),
+        # native .duckdb files take precedence
+        datasets = list_datasets(DEFAULT_DB_DIALECT)
+        for k in datasets:
+            datasets[k].update(db_type=db_type, mode="sqlite")
+        sufixes = [s.lstrip(".") for s in DUCKDB_SUFFIXES]
+    else:
+        datasets = {}
+        sufixes = [db_type.lower()]
+
     cwd = os.getcwd()
-    for p in [i for i in glob(f"store/sql/**/*.{sufix}*", recursive=True) if META_APP_NAME not in i and sufix in i.lower()]:
-        db_url = os.path.abspath(os.path.join(cwd, p))
-        l = Path(db_url).parts
-        db_name = l[l.index("sql")+2]
-        datasets[db_name] = dict(db_type=db_type, db_url=db_url)
+    for sufix in sufixes:
+        for p in [i for i in glob(f"store/sql/**/*.{sufix}*", recursive=True) if META_APP_NAME not in i and sufix in i.lower()]:
+            if p.endswith(".wal") or p.endswith("-wal") or p.endswith("-shm"):
+                continue
+            db_url = os.path.abspath(os.path.join(cwd, p))
+            l = Path(db_url).parts
+            db_name = l[l.index("sql")+2]
+            datasets[db_name] = dict(db_type=db_type, db_url=db_url)
+            if db_type == DUCKDB_DIALECT:
+                datasets[db_name].update(mode="native")
     return datasets
 
 #############################
@@ -326,9 +396,10 @@ def db_execute(sql_stmt,
             logging.warning("[WARN] SQL Execution is off ! ")   
 
 def db_list_tables_sqlite(db_url):
-    """get a list of tables from SQLite database
+    """get a list of tables from SQLite database,
+    only names: the catalog (see db_catalog.py) also counts and previews every table
     """
-    with DBConn(db_url) as _conn:
+    with DBConn(db_url, read_only=True) as _conn:
         sql_stmt = f'''
         SELECT 
             name
@@ -461,21 +532,99 @@ def db_upsert(data, user_key_cols="note_name", call_meta_func=False):
         except Exception as ex:
             logging.error(f"[ERROR] db_upsert():\n\t{str(ex)}")
 
-def db_query_data(db_url, table_name, limit=50, order_by=""):
+def db_get_validated_qa(db_name):
+    """get validated question/SQL pairs of a dataset from Q&A history, latest first
+    """
+    sql_stmt = f"""
+        select 
+            qa.question
+            , qa.sql_generated
+        from {CFG["TABLE_QA"]} qa
+        join t_config cfg
+            on cfg.id = qa.id_config
+        join t_resource db
+            on db.id = cfg.id_db
+            and db.type = 'SQL'
+        where qa.sql_is_valid = 'Y'
+            and qa.is_rag = 1
+            and qa.is_active = 1
+            and db.name = '{escape_single_quote(db_name)}'
+        order by qa.updated_at desc
+        ;
+    """
+    with DBConn() as _conn:
+        df = pd.read_sql(sql_stmt, _conn)
+    return list(df.itertuples(index=False, name=None))
+
+def ui_advise_indexes(db_name, db_url):
+    """propose indexes for a dataset from its validated Q&A history"""
+    queries = [sql for _, sql in db_get_validated_qa(db_name)]
+    if not queries:
+        return []
+    return advise_indexes(db_url, queries)
+
+def ui_apply_indexes(db_url, proposals):
+    """create selected indexes, return before/after latency report as dataframe"""
+    close_pool(db_url)
     with DBConn(db_url) as _conn:
-        order_by = order_by.strip()
-        order_by_clause = f" order by {order_by} " if order_by else " "
-        limit_clause = f" limit {limit} " if limit and limit > 0 else " "
+        report = apply_indexes(db_url, proposals, _conn)
+    return pd.DataFrame(report, columns=["name", "used", "before", "after", "speedup", "query", "ddl"])
+
+def db_get_frequent_questions(db_name, limit=RETRIEVAL_PREWARM_QUESTIONS):
+    """most frequently asked questions of a dataset from Q&A history"""
+    sql_stmt = f"""
+        select 
+            max(qa.question) as question
+            , count(*) as n_asked
+        from {CFG["TABLE_QA"]} qa
+        join t_config cfg
+            on cfg.id = qa.id_config
+        join t_resource db
+            on db.id = cfg.id_db
+            and db.type = 'SQL'
+        where qa.is_active = 1
+            and db.name = '{escape_single_quote(db_name)}'
+        group by lower(trim(qa.question))
+        order by n_asked desc, max(qa.updated_at) desc
+        limit {int(limit)}
+        ;
+    """
+    with DBConn() as _conn:
+        df = pd.read_sql(sql_stmt, _conn)
+    return df["question"].to_list()
 
-        sql_stmt = f"""
-            select 
-                *
-            from {table_name}
-            {order_by_clause}
-            {limit_clause}
-            ;
-        """
-        return pd.read_sql(sql_stmt, _conn)
+@st.cache_resource(show_spinner=False)
+def _prewarm_retrieval_thread(cfg_key, _cfg_data):
+    """pre-warm the retrieval cache once per dataset/config, in a background thread"""
+    def _run():
+        try:
+            prewarm_retrieval(_cfg_data, db_get_frequent_questions(_cfg_data.get("db_name")))
+        except Exception as e:
+            logging.warning(f"[prewarm_retrieval] {cfg_key}: {str(e)}")
+    t = threading.Thread(target=_run, daemon=True)
+    t.start()
+    return t
+
+def ui_prewarm_retrieval(cfg_data):
+    if not cfg_data or RETRIEVAL_PREWARM_QUESTIONS <= 0:
+        return None
+    setup_vanna_cached(cfg_data)    # in the script thread, so the instance is cached before the thread uses it
+    cfg_key = tuple(cfg_data.get(k) for k in ["llm_vendor", "llm_model", "vector_db", "db_name", "db_type", "db_url"])
+    return _prewarm_retrieval_thread(cfg_key, cfg_data)
+
+def semantic_cache_lookup(cfg_data, question, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+    """return validated SQL of a similar past question for the same dataset, or None
+    """
+    db_name = cfg_data.get("db_name")
+    vn = setup_vanna_cached(cfg_data)
+    cache = get_semantic_cache()
+    if not cache.is_loaded(db_name):
+        cache.load(db_name, db_get_validated_qa(db_name), vn.embedding_function)
+    return cache.lookup(db_name, question, vn.embedding_function, threshold=threshold)
+
+def semantic_cache_add(cfg_data, question, sql):
+    vn = setup_vanna_cached(cfg_data)
+    get_semantic_cache().add(cfg_data.get("db_name"), question, sql, vn.embedding_function)
 
 def db_current_cfg(id_config=None):
     if id_config:
@@ -1214,10 +1363,384 @@ def ui_display_df_grid(df,
  
     return grid_response
 
+def upload_load_key(job):
+    """hash of what defines a table loaded from a file: DDL, column mapping and sheet"""
+    key = json.dumps([job.get("ddl"), job.get("columns"), job.get("source_columns"), job.get("sheet")], default=str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def db_find_upload(content_hash, db_name, table_name="", load_key=""):
+    """row count recorded when this content was last loaded into db_name.table_name, or None"""
+    sql_stmt = f"""
+        select row_count
+        from t_upload
+        where content_hash = '{escape_single_quote(content_hash)}'
+            and db_name = '{escape_single_quote(db_name)}'
+            and table_name = '{escape_single_quote(table_name)}'
+            and load_key = '{escape_single_quote(load_key)}'
+            and is_active = 1
+        order by id desc
+        limit 1
+        ;
+    """
+    with DBConn() as _conn:
+        row = _conn.execute(sql_stmt).fetchone()
+    return row[0] if row else None
+
+def db_find_upload_datasets(content_hash):
+    """datasets a whole SQLite database with this content was uploaded as"""
+    sql_stmt = f"""
+        select distinct db_name
+        from t_upload
+        where content_hash = '{escape_single_quote(content_hash)}'
+            and table_name = ''
+            and is_active = 1
+        ;
+    """
+    with DBConn() as _conn:
+        return [r[0] for r in _conn.execute(sql_stmt).fetchall()]
+
+def db_record_upload(content_hash, file_name, file_size, db_name, table_name="", load_key="", row_count=None):
+    curr_ts = get_ts_now()
+    sql_stmt = f"""
+        insert into t_upload(
+            content_hash, file_name, file_size, db_name, table_name, load_key, row_count,
+            created_at, updated_at, created_by, updated_by
+        )
+        values(
+            '{escape_single_quote(content_hash)}', '{escape_single_quote(file_name)}', {int(file_size or 0)},
+            '{escape_single_quote(db_name)}', '{escape_single_quote(table_name)}', '{escape_single_quote(load_key)}',
+            {"NULL" if row_count is None else int(row_count)},
+            '{curr_ts}', '{curr_ts}', '{DEFAULT_USER}', '{DEFAULT_USER}'
+        );
+    """
+    with DBConn() as _conn:
+        db_run_sql(sql_stmt, _conn, debug=False)
+
+def sqlite_table_ddl(table_name, columns, header=""):
+    """CREATE TABLE DDL of an import, columns as (name, sql_type, comment) tuples
+
+    the DDL is executed by load_job(), so a column's comma goes before its "--" comment
+    """
+    ddl = [f"-- {header}"] if header else []
+    ddl.append(f"CREATE TABLE IF NOT EXISTS {table_name} (")
+    for i, (name, sql_type, comment) in enumerate(columns):
+        sep = "," if i < len(columns) - 1 else ""
+        ddl.append(f"    {name} {sql_type}{sep}" + (f"  -- {comment}" if comment else ""))
+    ddl.append(");")
+    return "\n".join(ddl)
+
+def table_row_count(db_path, table_name):
+    """row count of a table, None if the file or table does not exist"""
+    if not os.path.exists(db_path):
+        return None
+    with DBConn(db_path, read_only=True) as _conn:
+        exists = _conn.execute("select 1 from sqlite_schema where type = 'table' and name = ?", (table_name,)).fetchone()
+        if not exists:
+            return None
+        return _conn.execute(f'select count(*) from "{table_name}"').fetchone()[0]
+
+def find_unchanged_jobs(db_path, jobs):
+    """jobs whose file content (job["content_hash"]) was loaded into the same table with the same mapping,
+    and the table still has the recorded row count: dict of name -> row count
+    """
+    db_name = Path(db_path).stem
+    unchanged = {}
+    for j in jobs:
+        if not j.get("content_hash"):
+            continue
+        n_rows = db_find_upload(j["content_hash"], db_name, j["table"], upload_load_key(j))
+        if n_rows is not None and table_row_count(db_path, j["table"]) == n_rows:
+            unchanged[j["name"]] = n_rows
+    return unchanged
+
+def ui_import_files(db_path, jobs, bulk=True):
+    """load import jobs (see import_engine.import_parallel) into db_path,
+    with a progress bar per file/sheet and a summary of failures
+
+    a single file/sheet is streamed in-process, multiple jobs are parsed in a process pool;
+    with bulk=True the load runs in bulk_load_mode, then indexes (job["indexes"]) are built and ANALYZE runs;
+    jobs with a content_hash already loaded unchanged (see t_upload) are skipped
+    """
+    progress_bars = {j["name"]: st.progress(0.0, text=f"{j['name']}: waiting ...") for j in jobs}
+
+    unchanged = find_unchanged_jobs(db_path, jobs)
+    for name, n_rows in unchanged.items():
+        progress_bars[name].progress(1.0, text=f"⏭️ {name}: unchanged, {n_rows:,} rows")
+    skipped = {j["name"]: dict(table=j["table"], status="done", rows=unchanged[j["name"]], error=None) 
+                for j in jobs if j["name"] in unchanged}
+    jobs = [j for j in jobs if j["name"] not in unchanged]
+    if not jobs:
+        return skipped
+
+    def _show_progress(name, status, n_rows, fraction):
+        if status == "error":
+            progress_bars[name].progress(1.0, text=f"❌ {name}: failed")
+        else:
+            icon = "✅ " if status == "done" else ""
+            progress_bars[name].progress(min(fraction or 0.0, 1.0), text=f"{icon}{name}: {n_rows:,} rows")
+
+    # pooled read-only connections would block switching the journal mode
+    close_pool(db_path)
+    unshare_file(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        with (bulk_load_mode(conn) if bulk else nullcontext(conn)):
+            if len(jobs) == 1:
+                j = jobs[0]
+                result = dict(table=j["table"], status="running", rows=0, error=None)
+                try:
+                    result["rows"] = load_job(conn, j,
+                            progress_callback=lambda n_rows, done, total: _show_progress(j["name"], "running", n_rows, done / max(total, 1)))
+                    result["status"] = "done"
+                except Exception as e:
+                    result.update(status="error", error=str(e))
+                _show_progress(j["name"], result["status"], result["rows"], 1.0)
+                results = {j["name"]: result}
+            else:
+                results = import_parallel(db_path, jobs, progress_callback=_show_progress, conn=conn)
+
+            indexes = {j["table"]: j.get("indexes", []) for j in jobs if results[j["name"]]["status"] == "done"}
+            with st.spinner("Building indexes and statistics (ANALYZE) ..."):
+                created = finalize_load(conn, indexes)
+            if created:
+                st.caption(f"Indexes created: {', '.join(created)}")
+    finally:
+        conn.close()
+
+    db_name = Path(db_path).stem
+    for j in jobs:
+        r = results[j["name"]]
+        if r["status"] == "done" and j.get("content_hash"):
+            db_record_upload(j["content_hash"], Path(j["path"]).name, os.path.getsize(j["path"]), 
+                             db_name, j["table"], upload_load_key(j), r["rows"])
+    if any(r["status"] == "done" for r in results.values()):
+        ui_schedule_schema_sync(db_path)
+    results.update(skipped)
+
+    failed = {k: v for k, v in results.items() if v["status"] != "done"}
+    if failed:
+        st.error(f"{len(failed)} of {len(results)} imports failed:")
+        st.dataframe(pd.DataFrame([dict(name=k, table=v["table"], error=v["error"]) for k, v in failed.items()]), hide_index=True)
+    return results
+
+#############################
+# background jobs (see job_queue.py)
+#############################
+@st.cache_resource
+def ensure_job_workers():
+    """start the background job worker processes once per app server"""
+    return start_workers(JOB_WORKERS, db_url=CFG["META_DB_URL"])
+
+def ui_submit_job(job_type, params, title=""):
+    ensure_job_workers()
+    job_id = submit_job(job_type, params, title=title, created_by=DEFAULT_USER, db_url=CFG["META_DB_URL"])
+    st.info(f"Job #{job_id} submitted: {title or job_type}, see page 'Jobs' for progress")
+    return job_id
+
+def job_import(params, ctx):
+    """background import of files/sheets into a dataset (see ui_import_files)
+
+    params: dict(db_path, jobs, bulk, cfg_data); jobs are loaded one after another in the worker process,
+    then the schema of the dataset is synced into the knowledge base (if cfg_data is given)
+    """
+    db_path, jobs, bulk = params["db_path"], params["jobs"], params.get("bulk", True)
+    unchanged = find_unchanged_jobs(db_path, jobs)
+    results = {name: dict(status="done", rows=n_rows, skipped=True) for name, n_rows in unchanged.items()}
+    jobs = [j for j in jobs if j["name"] not in unchanged]
+    if not jobs:
+        return results
+
+    unshare_file(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        with (bulk_load_mode(conn) if bulk else nullcontext(conn)):
+            for i, j in enumerate(jobs):
+                def _progress(n_rows, done, total, i=i, name=j["name"]):
+                    ctx.progress((i + done / max(total, 1)) / len(jobs), f"{name}: {n_rows:,} rows")
+                try:
+                    n_rows = load_job(conn, j, progress_callback=_progress)
+                    results[j["name"]] = dict(status="done", rows=n_rows)
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    results[j["name"]] = dict(status="error", error=str(e))
+            ctx.progress(1.0, "building indexes and statistics (ANALYZE)")
+            finalize_load(conn, {j["table"]: j.get("indexes", []) for j in jobs if results[j["name"]]["status"] == "done"})
+    finally:
+        conn.close()
+        # the app's pooled readers may still hold the file replaced by unshare_file(), or stale pages
+        mark_dataset_changed(db_path)
+
+    db_name = Path(db_path).stem
+    for j in jobs:
+        r = results[j["name"]]
+        if r["status"] == "done" and j.get("content_hash"):
+            db_record_upload(j["content_hash"], Path(j["path"]).name, os.path.getsize(j["path"]), 
+                             db_name, j["table"], upload_load_key(j), r["rows"])
+    failed = [k for k, v in results.items() if v["status"] != "done"]
+    cfg_data = params.get("cfg_data")
+    if cfg_data and len(failed) < len(jobs):
+        try:
+            ctx.progress(1.0, "syncing schema into knowledge base")
+            results["schema_sync"] = {k: len(v) for k, v in sync_dataset_schema(dataset_cfg(db_path, cfg_data)).items()}
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logging.warning(f"[job_import] schema sync of {db_path} failed: {str(e)}")
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(jobs)} imports failed: {', '.join(failed)}")
+    return results
+
+def dataset_cfg(db_path, cfg_data=None):
+    """config of the current (or given) settings pointed at another SQLite dataset, e.g. one just imported"""
+    cfg_data = dict(cfg_data or db_current_cfg())
+    cfg_data.update(db_name=Path(db_path).stem, db_url=str(db_path), db_type=DEFAULT_DB_DIALECT)
+    return cfg_data
+
+def sync_dataset_schema(cfg_data, progress_callback=None):
+    """embed DDL of new/changed tables of a dataset into the knowledge base, see schema_sync.py
+
+    Returns:
+        dict(added, changed, removed, unchanged), lists of table names
+    """
+    vn = setup_vanna_cached(cfg_data)
+    df_ddl = vn.run_sql(DDL_QUERIES.get(vn.dialect, DDL_QUERIES[DEFAULT_DB_DIALECT]))
+    ddls = {name: strip_brackets(ddl) for name, ddl in zip(df_ddl["name"], df_ddl["sql"]) if ddl}
+    return sync_schema(vn, cfg_data.get("db_name"), ddls, db_url=CFG["META_DB_URL"], user=DEFAULT_USER,
+                       progress_callback=progress_callback)
+
+def ui_schedule_schema_sync(db_path):
+    """after an import: sync the dataset schema into the knowledge base in a background job"""
+    cfg_data = db_current_cfg()
+    if not cfg_data:
+        return None
+    return ui_submit_job("schema_sync", dict(cfg_data=dataset_cfg(db_path, cfg_data)), 
+                         title=f"Sync schema: {Path(db_path).stem}")
+
+def job_schema_sync(params, ctx):
+    """background schema sync, params: dict(cfg_data)"""
+    ctx.progress(0.0, "comparing DDL with manifest")
+    diff = sync_dataset_schema(params["cfg_data"], 
+                progress_callback=lambda kind, n_done, n_total: ctx.progress(n_done / max(n_total, 1), f"{n_done}/{n_total} {kind} embedded"))
+    return {k: len(v) for k, v in diff.items()}
+
+def job_train(params, ctx):
+    """background knowledge base training
+
+    params: dict(cfg_data, kind, items), kind in ddl|documentation|sql, sql items are dict(question, sql)
+    """
+    cfg_data, kind, items = params["cfg_data"], params["kind"], params["items"]
+    vn = setup_vanna_cached(cfg_data)
+    arg_name = "question_sql" if kind == "sql" else kind
+    result = vn.train_bulk(**{arg_name: items}, dataset=cfg_data.get("db_name"),
+                progress_callback=lambda kind, n_done, n_total: ctx.progress(n_done / max(n_total, 1), f"{n_done}/{n_total} {kind} embedded"))
+    return dict(trained=len(result.get(kind, [])), kind=kind)
+
+def job_qa_report(params, ctx):
+    """background markdown report of the validated Q&A history of a dataset:
+    question, SQL, first rows of the (re-run) result and summary
+
+    params: dict(db_name, max_rows)
+    """
+    db_name, max_rows = params["db_name"], int(params.get("max_rows", 20))
+    sql_stmt = f"""
+        select 
+            qa.id, qa.question, qa.sql_generated, qa.summary_generated, db.url as db_url
+        from {CFG["TABLE_QA"]} qa
+        join t_config cfg
+            on cfg.id = qa.id_config
+        join t_resource db
+            on db.id = cfg.id_db
+            and db.type = 'SQL'
+        where qa.sql_is_valid = 'Y'
+            and qa.is_active = 1
+            and db.name = '{escape_single_quote(db_name)}'
+        order by qa.id
+        ;
+    """
+    with DBConn() as _conn:
+        df_qa = pd.read_sql(sql_stmt, _conn)
+
+    report_path = Path(__file__).parent / "reports" / f"qa_report_{snake_case(db_name)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+    with open(report_path, "w", encoding="utf-8") as fd_md:
+        fd_md.write(f"# Q&A Report: {db_name}\n\nGenerated on: {get_ts_now()}\n\n")
+        for i, row in enumerate(df_qa.itertuples(index=False)):
+            ctx.progress(i / max(len(df_qa), 1), f"{i}/{len(df_qa)} questions")
+            fd_md.write(f"## {row.id}. {row.question}\n\n```sql\n{row.sql_generated}\n```\n\n")
+            try:
+                with DBConn(row.db_url, read_only=True) as _conn:
+                    df = run_sql_guarded(_conn, row.sql_generated, max_rows=max_rows)
+                fd_md.write(f"{convert_df2md(df)}\n")
+                if df.attrs.get("truncated"):
+                    fd_md.write(f"_first {len(df)} rows_\n\n")
+            except Exception as e:
+                fd_md.write(f"_error: {str(e)}_\n\n")
+            if row.summary_generated:
+                fd_md.write(f"{row.summary_generated}\n\n")
+    return dict(report=str(report_path), questions=len(df_qa))
+
+def convert_df2md(df):
+    """
+    Convert a pandas DataFrame to a Markdown table.
+
+    Parameters:
+    df (pd.DataFrame): The input DataFrame to convert.
+
+    Returns:
+    str: A string containing the Markdown formatted table.
+    """
+    if df is None or df.empty:
+        return ""
+
+    # Get the column names and data rows
+    headers = list(df.columns)
+    rows = df.values.tolist()
+
+    # Create the header row
+    markdown_table = '| ' + ' | '.join(headers) + ' |\n'
+    markdown_table += '| ' + ' | '.join(['---'] * len(headers)) + ' |\n'
+
+    # Add data rows
+    for row in rows:
+        markdown_table += '| ' + ' | '.join(str(cell) for cell in row) + ' |\n'
+
+    return markdown_table
+
 def df_to_csv(df, index=False):
     # IMPORTANT: Cache the conversion to prevent computation on every rerun
     return df.to_csv(index=index).encode('utf-8')
 
+def arrow_to_csv(table):
+    """CSV bytes written by pyarrow from the Arrow buffers (no pandas round-trip)
+    """
+    import pyarrow.csv as pa_csv
+    buf = pa.BufferOutputStream()
+    pa_csv.write_csv(table, buf)
+    return buf.getvalue().to_pybytes()
+
+def ui_download_arrow(table, file_stem, key, label="Download"):
+    """format selector (CSV/Parquet/Arrow IPC) and download button of a pyarrow.Table"""
+    c1, c2, _ = st.columns([2,2,6])
+    with c1:
+        fmt = st.selectbox("Format", options=list(EXPORT_FORMATS.keys()), key=f"{key}_export_format", label_visibility="collapsed")
+    suffix, mime = EXPORT_FORMATS[fmt]
+    with c2:
+        st.download_button(
+            label=f"{label} {fmt}",
+            data=arrow_to_csv(table) if fmt == "CSV" else arrow_to_bytes(table, fmt),
+            file_name=f"{file_stem}.{suffix}",
+            mime=mime,
+            key=f"{key}_download",
+        )
+
+def db_export_table(db_url, table_name, fmt="Parquet"):
+    """export a whole table, rows are streamed from a pooled read-only connection into the file
+    return (bytes, n_rows)
+    """
+    with DBConn(db_url, read_only=True) as _conn:
+        return export_query(_conn, f'select * from "{table_name}"', fmt=fmt)
+
 def format_insert_sql(out_dict, table_name="w_zi_dup_merged"):
     """create SQL Insert statement using out_dict data
     """
@@ -1368,6 +1891,41 @@ def generate_sql(cfg_data, question: str, use_last_n_message: int=1, enable_st_c
     else:
         return generate_sql_not_cached(cfg_data, question, use_last_n_message=use_last_n_message)
 
+def precheck_sql(cfg_data, question: str, sql: str, use_last_n_message: int=1, enable_st_cache: bool=True):
+    """EXPLAIN QUERY PLAN cost check of generated SQL before it runs
+
+    over-budget queries are handled per session_state["sql_over_budget_action"]:
+        "Warn"               - run as-is
+        "Add LIMIT"          - wrap query with LIMIT "out_sql_limit"
+        "Ask LLM to rewrite" - regenerate SQL with the plan as feedback (once), then add LIMIT if still over budget
+    return (sql, analysis)
+    """
+    if cfg_data.get("db_type") != DEFAULT_DB_DIALECT:
+        return sql, None
+
+    db_url = cfg_data.get("db_url")
+    budget = st.session_state.get("sql_cost_budget", SQL_COST_BUDGET)
+    action = st.session_state.get("sql_over_budget_action", OVER_BUDGET_ACTIONS[0])
+    analysis = analyze_sql(db_url, sql, budget=budget)
+    if analysis is None or not analysis["over_budget"]:
+        return sql, analysis
+
+    analysis["action"] = action
+    if action == "Ask LLM to rewrite":
+        question_feedback = f"{question}\n{plan_feedback(sql, analysis)}"
+        new_sql = generate_sql(cfg_data, question=question_feedback, use_last_n_message=use_last_n_message, enable_st_cache=enable_st_cache)
+        new_analysis = analyze_sql(db_url, new_sql, budget=budget) if is_sql_valid(cfg_data, sql=new_sql) else None
+        if new_analysis is not None:
+            new_analysis.update({"action": action, "rewritten_from": sql, "prev_est_rows": analysis["est_rows"]})
+            sql, analysis = new_sql, new_analysis
+        if not analysis["over_budget"]:
+            return sql, analysis
+
+    if action in ["Add LIMIT", "Ask LLM to rewrite"]:
+        sql = add_limit(sql, st.session_state.get("out_sql_limit", 20))
+        analysis["limit_added"] = True
+    return sql, analysis
+
 def run_sql(cfg_data, sql: str, enable_st_cache: bool=True):
     if enable_st_cache:
         return run_sql_cached(cfg_data, sql)
@@ -1404,6 +1962,48 @@ def ask_llm(cfg_data, question, enable_st_cache: bool=True):
     else:
         return ask_llm_not_cached(cfg_data, question)
 
+def run_concurrently(tasks, max_workers=None, foreground=None):
+    """Run independent tasks in a thread pool, yield results as each one completes
+
+    Args:
+        tasks (dict): task name -> (func, kwargs)
+        foreground (tuple): optional (name, func, kwargs) run in the calling thread 
+            while the pool works, e.g. to stream tokens into the UI
+
+    Yields:
+        (name, result, error) in order of completion, error is None on success
+
+    The Streamlit script context is attached to worker threads so that 
+    st.session_state and st.cache_data keep working inside the tasks,
+    rendering should stay in the calling (main) thread.
+    """
+    if not tasks and foreground is None:
+        return
+
+    ctx = get_script_run_ctx()
+    def _run(func, kwargs):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return func(**kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(tasks), 1)) as executor:
+        futures = {executor.submit(_run, func, kwargs): name for name, (func, kwargs) in tasks.items()}
+        if foreground is not None:
+            name, func, kwargs = foreground
+            try:
+                yield name, func(**kwargs), None
+            except Exception as e:
+                logging.error(f"run_concurrently() task '{name}' failed: {format_exc()}")
+                yield name, None, e
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                yield name, future.result(), None
+            except Exception as e:
+                logging.error(f"run_concurrently() task '{name}' failed: {format_exc()}")
+                yield name, None, e
+
 def filter_by_ollama_model(llm_models):
     """
     If Ollama is not installed, open-source models will not be listed
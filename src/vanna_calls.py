@@ -7,9 +7,20 @@ from vanna.google import GoogleGeminiChat
 from vanna.openai import OpenAI_Chat
 from vanna.anthropic import Anthropic_Chat
 from vanna.bedrock import Bedrock_Chat  # , Bedrock_Converse
-from vanna.chromadb.chromadb_vector import ChromaDB_VectorStore
+from vector_store import MyChromaDB_VectorStore
 import logging 
 import boto3
+from contextvars import ContextVar
+from contextlib import nullcontext
+from pathlib import Path
+
+from llm_cache import LLMCache, hash_text, split_prompt
+from semantic_cache import SemanticQuestionCache, DEFAULT_SIMILARITY_THRESHOLD
+from result_cache import ResultCache
+from db_engine import connect_to_sqlite_pool, connect_to_duckdb, DUCKDB_DIALECT, SQL_TIMEOUT_SECONDS, SQL_MAX_ROWS
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 
 # from api_key_store import ApiKeyStore
 
@@ -21,6 +32,7 @@ DEFAULT_USER = 'joe_coder@gmail.com'  # dummy placeholder
 
 META_APP_NAME = "data_copilot"
 DEFAULT_DB_DIALECT = "SQLite"
+FILE_DB_DIALECTS = [DEFAULT_DB_DIALECT, DUCKDB_DIALECT]   # file-based datasets under store/sql
 DEFAULT_DB_NAME = "chinook"
 DEFAULT_VECTOR_DB = "ChromaDB"
 # DEFAULT_LLM_MODEL = "OpenAI GPT 3.5 Turbo" # "Alibaba QWen 2.5 Coder (Open)"
@@ -65,6 +77,23 @@ LLM_MODEL_MAP = {
 
 LLM_MODEL_REVERSE_MAP = {v:k for k, v in LLM_MODEL_MAP.items()}
 
+# disk-backed LLM response cache, shared by all app processes on this host
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+LLM_CACHE_PATH = Path(__file__).parent / "store/cache" / f"{META_APP_NAME}_llm_cache.sqlite3"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7*24*3600))          # seconds
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", 256))
+
+# SQL result cache, invalidated when the dataset file changes
+RESULT_CACHE_DIR = Path(__file__).parent / "store/cache/results"
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", 256))           # in-memory budget
+RESULT_CACHE_SPILL_MB = int(os.getenv("RESULT_CACHE_SPILL_MB", 32))        # larger results go to disk
+RESULT_CACHE_MAX_DISK_MB = int(os.getenv("RESULT_CACHE_MAX_DISK_MB", 2048))
+
+SQL_CANCEL_WAIT_SECONDS = 5    # wait for the partial result of a cancelled query
+
+# set to True within bypass_llm_cache() so that *_not_cached calls reach the LLM
+_llm_cache_bypass = ContextVar("llm_cache_bypass", default=False)
+
 def parse_llm_model_spec(model_name):
     llm_vendor = model_name.split()[0]
     llm_model = LLM_MODEL_MAP.get(model_name)
@@ -103,55 +132,309 @@ def lookup_llm_api_key(llm_model, llm_vendor):
         st.error(f"Unknown LLM vendor: {vendor} | {llm_vendor}")
         return None
 
+@st.cache_resource
+def get_llm_cache():
+    if not LLM_CACHE_ENABLED:
+        return None
+    return LLMCache(LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_MB*1024*1024)
+
+def get_llm_cache_stats():
+    cache = get_llm_cache()
+    return cache.stats() if cache is not None else {}
+
+def clear_llm_cache():
+    cache = get_llm_cache()
+    if cache is not None:
+        cache.clear()
+
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(RESULT_CACHE_DIR, 
+                max_memory_bytes=RESULT_CACHE_MAX_MB*1024*1024,
+                spill_threshold_bytes=RESULT_CACHE_SPILL_MB*1024*1024,
+                max_disk_bytes=RESULT_CACHE_MAX_DISK_MB*1024*1024)
+
+@st.cache_resource
+def get_semantic_cache():
+    return SemanticQuestionCache(threshold=DEFAULT_SIMILARITY_THRESHOLD)
+
+class bypass_llm_cache(object):
+    """context manager to skip the disk cache, e.g. when Streamlit cache is disabled"""
+    def __enter__(self):
+        self.token = _llm_cache_bypass.set(True)
+
+    def __exit__(self, type, value, traceback):
+        _llm_cache_bypass.reset(self.token)
+
+class LLMCacheMixin(object):
+    """Serve submit_prompt() from the shared disk cache before calling the LLM
+
+    Must be listed first among base classes so that it wraps the vendor submit_prompt()
+    """
+    def _llm_cache_key(self, cache, prompt):
+        config = self.config or {}
+        model = config.get("model") or config.get("modelId", "")
+        dataset = config.get("dataset", "")
+        context, messages = split_prompt(prompt)
+        prompt_hash, context_hash = hash_text(messages), hash_text(context)
+        key = cache.make_key(model, dataset, prompt_hash, context_hash)
+        return key, dict(model=model, dataset=dataset, prompt_hash=prompt_hash, context_hash=context_hash)
+
+    def submit_prompt(self, prompt, **kwargs):
+        cache = get_llm_cache()
+        if cache is None or _llm_cache_bypass.get():
+            return super().submit_prompt(prompt, **kwargs)
+
+        key, key_parts = self._llm_cache_key(cache, prompt)
+        resp = cache.get(key)
+        if resp is not None:
+            logging.info(f"[LLMCache] hit: model={key_parts['model']}, dataset={key_parts['dataset']}")
+            return resp
+
+        resp = super().submit_prompt(prompt, **kwargs)
+        if resp:
+            cache.put(key, resp, **key_parts)
+        return resp
+
+    def submit_prompt_stream(self, prompt, use_cache=True, **kwargs):
+        """yield response tokens, a cache hit is yielded as a single chunk
+        and the full text of a miss is saved once the stream completes
+        """
+        cache = get_llm_cache() if use_cache and not _llm_cache_bypass.get() else None
+        if cache is None:
+            yield from super().submit_prompt_stream(prompt, **kwargs)
+            return
+
+        key, key_parts = self._llm_cache_key(cache, prompt)
+        resp = cache.get(key)
+        if resp is not None:
+            yield resp
+            return
+
+        chunks = []
+        for chunk in super().submit_prompt_stream(prompt, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        resp = "".join(chunks)
+        if resp:
+            cache.put(key, resp, **key_parts)
+
+############################
+## Streaming
+############################
+class StreamingMixin(object):
+    """Token streaming for the My*/MyVanna* classes
+
+    Vendor subclasses implement stream_prompt(prompt) as a generator of text chunks
+    """
+    def stream_prompt(self, prompt, **kwargs):
+        # fallback for vendors without streaming: one chunk with the full response
+        yield self.submit_prompt(prompt, **kwargs)
+
+    def submit_prompt_stream(self, prompt, **kwargs):
+        if prompt is None or len(prompt) == 0:
+            raise Exception("Prompt is empty")
+        for chunk in self.stream_prompt(prompt, **kwargs):
+            if chunk:
+                yield chunk
+
+    def ask_llm_stream(self, question, **kwargs):
+        message_log = [
+            self.system_message("You are a helpful assistant."),
+            self.user_message(question),
+        ]
+        yield from self.submit_prompt_stream(message_log, **kwargs)
+
+    def generate_summary_stream(self, question, df, **kwargs):
+        # same prompt as VannaBase.generate_summary()
+        message_log = [
+            self.system_message(
+                f"You are a helpful data assistant. The user asked the question: '{question}'\n\nThe following is a pandas DataFrame with the results of the query: \n{df.to_markdown()}\n\n"
+            ),
+            self.user_message(
+                "Briefly summarize the data based on the question that was asked. Do not respond with any additional explanation beyond the summary." +
+                self._response_language()
+            ),
+        ]
+        yield from self.submit_prompt_stream(message_log, **kwargs)
+
+    def _sql_prompt(self, question, extra_docs=None, **kwargs):
+        # same prompt as VannaBase.generate_sql()
+        initial_prompt = self.config.get("initial_prompt", None) if self.config is not None else None
+        question_sql_list = self.get_similar_question_sql(question, **kwargs)
+        ddl_list = self.get_related_ddl(question, **kwargs)
+        doc_list = self.get_related_documentation(question, **kwargs)
+        return self.get_sql_prompt(
+            initial_prompt=initial_prompt,
+            question=question,
+            question_sql_list=question_sql_list,
+            ddl_list=ddl_list,
+            doc_list=doc_list + (extra_docs or []),
+            **kwargs,
+        )
+
+    def generate_sql_stream(self, question, use_cache=True, **kwargs):
+        """stream the raw LLM response of the first generate_sql() pass,
+        caller should apply extract_sql() on the full text
+        """
+        prompt = self._sql_prompt(question, **kwargs)
+        self.log(title="SQL Prompt", message=prompt)
+        yield from self.submit_prompt_stream(prompt, use_cache=use_cache)
+
+    def generate_sql_intermediate(self, question, llm_response, **kwargs):
+        """second pass of generate_sql() for a streamed response asking for intermediate_sql:
+        run the introspection query, then prompt with its result (the first prompt is not sent again)
+        """
+        intermediate_sql = self.extract_sql(llm_response)
+        try:
+            self.log(title="Running Intermediate SQL", message=intermediate_sql)
+            df = self.run_sql(intermediate_sql)
+            prompt = self._sql_prompt(question, 
+                        extra_docs=[f"The following is a pandas DataFrame with the results of the intermediate SQL query {intermediate_sql}: \n" + df.to_markdown()],
+                        **kwargs)
+            self.log(title="Final SQL Prompt", message=prompt)
+            llm_response = self.submit_prompt(prompt, **kwargs)
+            self.log(title="LLM Response", message=llm_response)
+        except Exception as e:
+            return f"Error running intermediate SQL: {e}"
+        return self.extract_sql(llm_response)
+
+class OpenAIStreaming(StreamingMixin):
+    def stream_prompt(self, prompt, **kwargs):
+        stream = self.client.chat.completions.create(
+            model=self.config["model"],
+            messages=prompt,
+            temperature=self.temperature,
+            stream=True,
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class AnthropicStreaming(StreamingMixin):
+    def stream_prompt(self, prompt, **kwargs):
+        # claude requires system message as a separate field
+        system_message = ''
+        no_system_prompt = []
+        for prompt_message in prompt:
+            if prompt_message['role'] == 'system':
+                system_message = prompt_message['content']
+            else:
+                no_system_prompt.append({"role": prompt_message['role'], "content": prompt_message['content']})
+
+        with self.client.messages.stream(
+            model=self.config["model"],
+            messages=no_system_prompt,
+            system=system_message,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+        ) as stream:
+            for text in stream.text_stream:
+                yield text
+
+class GoogleStreaming(StreamingMixin):
+    def stream_prompt(self, prompt, **kwargs):
+        response = self.chat_model.generate_content(
+            prompt,
+            generation_config={
+                "temperature": self.temperature,
+            },
+            stream=True,
+        )
+        for chunk in response:
+            try:
+                yield chunk.text
+            except ValueError:
+                # chunk without text part, e.g. finish reason only
+                continue
+
+class OllamaStreaming(StreamingMixin):
+    def stream_prompt(self, prompt, **kwargs):
+        stream = self.ollama_client.chat(
+            model=self.model,
+            messages=prompt,
+            stream=True,
+            options=self.ollama_options,
+            keep_alive=self.keep_alive,
+        )
+        for chunk in stream:
+            yield chunk["message"]["content"]
+
+class BedrockStreaming(StreamingMixin):
+    def stream_prompt(self, prompt, **kwargs):
+        system_message = None
+        no_system_prompt = []
+        for prompt_message in prompt:
+            if prompt_message["role"] == "system":
+                system_message = prompt_message["content"]
+            else:
+                no_system_prompt.append({"role": prompt_message["role"], "content": [{"text": prompt_message["content"]}]})
+
+        converse_api_params = {
+            "modelId": self.config["modelId"],
+            "messages": no_system_prompt,
+            "inferenceConfig": {
+                "temperature": getattr(self, "temperature", 0.0),
+                "maxTokens": getattr(self, "max_tokens", 500),
+            },
+        }
+        if system_message:
+            converse_api_params["system"] = [{"text": system_message}]
+
+        response = self.client.converse_stream(**converse_api_params)
+        for event in response["stream"]:
+            if "contentBlockDelta" in event:
+                yield event["contentBlockDelta"]["delta"].get("text", "")
+
 ############################
 ## Ask LLM directly
 ############################
-class MyOpenAI(OpenAI_Chat):
+class MyOpenAI(LLMCacheMixin, OpenAIStreaming, OpenAI_Chat):
     def __init__(self, config=None):
         OpenAI_Chat.__init__(self, config=config)
 
-class MyGoogle(GoogleGeminiChat):
+class MyGoogle(LLMCacheMixin, GoogleStreaming, GoogleGeminiChat):
     def __init__(self, config=None):
         GoogleGeminiChat.__init__(self, config=config)
 
-class MyAnthropic(Anthropic_Chat):
+class MyAnthropic(LLMCacheMixin, AnthropicStreaming, Anthropic_Chat):
     def __init__(self, config=None):
         Anthropic_Chat.__init__(self, config=config)
 
-class MyBedrockChat(Bedrock_Chat):
+class MyBedrockChat(LLMCacheMixin, BedrockStreaming, Bedrock_Chat):
     def __init__(self, client, config=None):
         Bedrock_Chat.__init__(self, client=client, config=config)
 
-class MyOllama(Ollama):
+class MyOllama(LLMCacheMixin, OllamaStreaming, Ollama):
     def __init__(self, config=None):
         Ollama.__init__(self, config=config)
 
 ############################
 ## Ask LLM with RAG
 ############################
-class MyVannaOpenAI(ChromaDB_VectorStore, OpenAI_Chat):
+class MyVannaOpenAI(LLMCacheMixin, OpenAIStreaming, MyChromaDB_VectorStore, OpenAI_Chat):
     def __init__(self, config=None):
-        ChromaDB_VectorStore.__init__(self, config=config)
+        MyChromaDB_VectorStore.__init__(self, config=config)
         OpenAI_Chat.__init__(self, config=config)
 
-class MyVannaGoogle(ChromaDB_VectorStore, GoogleGeminiChat):
+class MyVannaGoogle(LLMCacheMixin, GoogleStreaming, MyChromaDB_VectorStore, GoogleGeminiChat):
     def __init__(self, config=None):
-        ChromaDB_VectorStore.__init__(self, config=config)
+        MyChromaDB_VectorStore.__init__(self, config=config)
         GoogleGeminiChat.__init__(self, config=config)
 
-class MyVannaAnthropic(ChromaDB_VectorStore, Anthropic_Chat):
+class MyVannaAnthropic(LLMCacheMixin, AnthropicStreaming, MyChromaDB_VectorStore, Anthropic_Chat):
     def __init__(self, config=None):
-        ChromaDB_VectorStore.__init__(self, config=config)
+        MyChromaDB_VectorStore.__init__(self, config=config)
         Anthropic_Chat.__init__(self, config=config)
 
-class MyVannaBedrockChat(ChromaDB_VectorStore, Bedrock_Chat):
+class MyVannaBedrockChat(LLMCacheMixin, BedrockStreaming, MyChromaDB_VectorStore, Bedrock_Chat):
     def __init__(self, config=None):
-        ChromaDB_VectorStore.__init__(self, config=config)
+        MyChromaDB_VectorStore.__init__(self, config=config)
         Bedrock_Chat.__init__(self, config=config)
 
-class MyVannaOllama(ChromaDB_VectorStore, Ollama):
+class MyVannaOllama(LLMCacheMixin, OllamaStreaming, MyChromaDB_VectorStore, Ollama):
     def __init__(self, config=None):
-        ChromaDB_VectorStore.__init__(self, config=config)
+        MyChromaDB_VectorStore.__init__(self, config=config)
         Ollama.__init__(self, config=config)
 
 def unpack_cfg(cfg_data):
@@ -165,7 +448,7 @@ def unpack_cfg(cfg_data):
 
 @st.cache_resource(ttl=3600)
 def setup_vanna(llm_vendor,llm_model,vector_db,db_name,db_type,db_url):
-    if db_type not in [DEFAULT_DB_DIALECT]:
+    if db_type not in FILE_DB_DIALECTS:
         st.error(f"Unsupported db_type: {db_type}")
         return None
 
@@ -179,7 +462,7 @@ def setup_vanna(llm_vendor,llm_model,vector_db,db_name,db_type,db_url):
         model_name = "anthropic.claude-3-sonnet-20240229-v1:0"
         config = {
             "modelId": model_name,
-            "dialect": DEFAULT_DB_DIALECT,
+            "dialect": db_type,
             "dataset": db_name,
             "path": VECTOR_DB_PATH,
         }
@@ -216,7 +499,12 @@ def setup_vanna(llm_vendor,llm_model,vector_db,db_name,db_type,db_url):
                 st.error(f"Unsupported LLM vendor: {llm_vendor}")
                 return None
 
-    vn.connect_to_sqlite(db_url)
+    if db_type == DUCKDB_DIALECT:
+        # native .duckdb file or SQLite file attached via sqlite scanner
+        connect_to_duckdb(vn, db_url)
+    else:
+        # pooled read-only connections (WAL mode) instead of vn.connect_to_sqlite(db_url)
+        connect_to_sqlite_pool(vn, db_url)
 
     if not vn.run_sql_is_set:
         st.error(f"Failed to connect to DB")
@@ -240,18 +528,28 @@ def ask_llm_cached(cfg_data, question: str):
 
 def ask_llm_not_cached(cfg_data, question: str):
     vn = setup_vanna_cached(cfg_data)
-    resp = vn.ask_llm(question=question)
+    with bypass_llm_cache():
+        resp = vn.ask_llm(question=question)
     return resp
 
 
-@st.cache_data(show_spinner="Generating SQL query ...")
-def generate_sql_cached(cfg_data, question: str, use_last_n_message: int=1):
-    vn = setup_vanna_cached(cfg_data)
-    question_hint = f"""
+def sql_question_hint(question):
+    """question as sent to generate_sql(), also the key of cached retrieval results"""
+    return f"""
         Hint: When generating an SQL query, you must terminate the SQL query with an semicolon!
 
         {question}
     """
+
+def prewarm_retrieval(cfg_data, questions):
+    """embed questions and cache their related DDL/documentation/question-SQL, see vector_store.py"""
+    vn = setup_vanna_cached(cfg_data)
+    return vn.prewarm_retrieval([sql_question_hint(q) for q in questions], dataset=cfg_data.get("db_name"))
+
+@st.cache_data(show_spinner="Generating SQL query ...")
+def generate_sql_cached(cfg_data, question: str, use_last_n_message: int=1):
+    vn = setup_vanna_cached(cfg_data)
+    question_hint = sql_question_hint(question)
     raw_sql = vn.generate_sql(
             question=question_hint, 
             allow_llm_to_see_data=True, 
@@ -264,34 +562,117 @@ def generate_sql_cached(cfg_data, question: str, use_last_n_message: int=1):
 
 def generate_sql_not_cached(cfg_data, question: str, use_last_n_message: int=1):
     vn = setup_vanna_cached(cfg_data)
-    question_hint = f"""
-        Hint: When generating an SQL query, you must terminate the SQL query with an semicolon!
+    question_hint = sql_question_hint(question)
+    with bypass_llm_cache():
+        raw_sql = vn.generate_sql(
+                question=question_hint, 
+                allow_llm_to_see_data=True, 
+                sql_row_limit=st.session_state.get("out_sql_limit", 20),
+                dataset=cfg_data.get("db_name"),
+                use_last_n_message=use_last_n_message,
+            )
+    my_sql = vn.extract_sql(raw_sql)
+    return my_sql
 
-        {question}
+def generate_sql_stream(cfg_data, question: str, use_last_n_message: int=1, use_cache: bool=True):
+    """generator of raw LLM response tokens, apply extract_sql() on the joined text
     """
-    raw_sql = vn.generate_sql(
+    vn = setup_vanna_cached(cfg_data)
+    question_hint = sql_question_hint(question)
+    return vn.generate_sql_stream(
             question=question_hint, 
+            use_cache=use_cache,
             allow_llm_to_see_data=True, 
             sql_row_limit=st.session_state.get("out_sql_limit", 20),
             dataset=cfg_data.get("db_name"),
             use_last_n_message=use_last_n_message,
         )
-    my_sql = vn.extract_sql(raw_sql)
-    return my_sql
+
+def generate_sql_intermediate(cfg_data, question: str, llm_response: str, use_last_n_message: int=1, use_cache: bool=True):
+    """SQL of a streamed response (see generate_sql_stream) that asks for intermediate_sql
+    """
+    vn = setup_vanna_cached(cfg_data)
+    question_hint = sql_question_hint(question)
+    with (nullcontext() if use_cache else bypass_llm_cache()):
+        return vn.generate_sql_intermediate(
+                question=question_hint, 
+                llm_response=llm_response,
+                allow_llm_to_see_data=True, 
+                sql_row_limit=st.session_state.get("out_sql_limit", 20),
+                dataset=cfg_data.get("db_name"),
+                use_last_n_message=use_last_n_message,
+            )
+
+def extract_sql(cfg_data, llm_response: str):
+    vn = setup_vanna_cached(cfg_data)
+    return vn.extract_sql(llm_response)
 
 @st.cache_data(show_spinner="Checking for valid SQL ...")
 def is_sql_valid(cfg_data, sql: str):
     vn = setup_vanna_cached(cfg_data)
     return vn.is_sql_valid(sql=sql)
 
-@st.cache_data(show_spinner="Running SQL query ...")
-def run_sql_cached(cfg_data, sql: str):
+def cancel_sql_query():
+    """on_click callback of the "Cancel query" button"""
+    st.session_state["sql_cancelled"] = True
+
+def run_sql_guarded(cfg_data, sql: str):
+    """run SQL in a worker thread with timeout/max-rows from session_state,
+    the main thread polls and shows a "Cancel query" button
+
+    Any widget interaction (e.g. clicking Cancel) makes Streamlit stop this script run
+    at the next UI update, the finally clause then interrupts the query and keeps
+    the rows fetched so far in session_state["sql_cancelled_df"] for the next run.
+    """
     vn = setup_vanna_cached(cfg_data)
-    return vn.run_sql(sql=sql)
+    cancel_event = threading.Event()
+    st.session_state["sql_cancelled"] = False
+    st.session_state.pop("sql_cancelled_df", None)
+    interrupted = True
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(vn.run_sql, sql=sql,
+                timeout=st.session_state.get("sql_timeout", SQL_TIMEOUT_SECONDS),
+                max_rows=st.session_state.get("sql_max_rows", SQL_MAX_ROWS),
+                cancel_event=cancel_event)
+    status = st.empty()
+    ts_start = time.monotonic()
+    try:
+        with status.container():
+            progress = st.empty()
+            st.button("Cancel query", on_click=cancel_sql_query, key="btn_cancel_sql")
+        while not future.done():
+            progress.caption(f"Running SQL query ... {time.monotonic()-ts_start:.0f}s")
+            time.sleep(0.25)
+        interrupted = False
+        return future.result()
+    finally:
+        cancel_event.set()
+        if interrupted:
+            try:
+                # the guarded executor returns the partial result soon after cancel_event is set
+                st.session_state["sql_cancelled_df"] = future.result(timeout=SQL_CANCEL_WAIT_SECONDS)
+            except Exception as e:
+                logging.warning(f"[run_sql_guarded] no partial result after cancel: {str(e)}")
+        executor.shutdown(wait=False)
+        status.empty()
+
+def run_sql_cached(cfg_data, sql: str):
+    """results are cached per (db_url, normalized sql, db file version),
+    truncated (partial) results are not cached
+    """
+    cache = get_result_cache()
+    db_url = cfg_data.get("db_url")
+    df = cache.get(db_url, sql)
+    if df is not None:
+        return df
+
+    df = run_sql_guarded(cfg_data, sql)
+    if df is not None and not df.attrs.get("truncated", False):
+        cache.put(db_url, sql, df)
+    return df
 
 def run_sql_not_cached(cfg_data, sql: str):
-    vn = setup_vanna_cached(cfg_data)
-    return vn.run_sql(sql=sql)
+    return run_sql_guarded(cfg_data, sql)
 
 @st.cache_data(show_spinner="Checking if we should generate a chart ...")
 def should_generate_chart_cached(cfg_data, df):
@@ -309,7 +690,8 @@ def generate_plotly_code_cached(cfg_data, question, sql, df):
 
 def generate_plotly_code_not_cached(cfg_data, question, sql, df):
     vn = setup_vanna_cached(cfg_data)
-    return vn.generate_plotly_code(question=question, sql=sql, df=df)
+    with bypass_llm_cache():
+        return vn.generate_plotly_code(question=question, sql=sql, df=df)
 
 
 @st.cache_data(show_spinner="Running Plotly code ...")
@@ -328,7 +710,16 @@ def generate_summary_cached(cfg_data, question, df):
 
 def generate_summary_not_cached(cfg_data, question, df):
     vn = setup_vanna_cached(cfg_data)
-    return vn.generate_summary(question=question, df=df)
+    with bypass_llm_cache():
+        return vn.generate_summary(question=question, df=df)
+
+def generate_summary_stream(cfg_data, question, df, use_cache: bool=True):
+    vn = setup_vanna_cached(cfg_data)
+    return vn.generate_summary_stream(question=question, df=df, use_cache=use_cache)
+
+def ask_llm_stream(cfg_data, question: str, use_cache: bool=True):
+    vn = setup_vanna_cached(cfg_data)
+    return vn.ask_llm_stream(question=question, use_cache=use_cache)
 
 @st.cache_data
 def get_ollama_models() -> List[str]:
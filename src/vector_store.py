@@ -0,0 +1,421 @@
+"""
+ChromaDB vector store with bulk training
+
+vn.train() embeds and adds one item per call, so loading hundreds of DDL scripts or
+business terms makes hundreds of embedding calls and collection writes.
+train_bulk() embeds lists of DDL, documentation and question/SQL pairs in batches
+and writes each collection with one add() call (split only above Chroma's max batch size).
+
+Records use the same ids and documents as add_ddl(), add_documentation() and
+add_question_sql(), so bulk-loaded items are found and removed like single ones.
+
+Each dataset has its own ddl/documentation/sql collections (e.g. "ddl__chinook"), so a query
+for one dataset never searches the vectors of another and its cost scales with the size of
+the current dataset. All datasets share one Chroma client per store path; its segment
+cache is LRU-bounded (CHROMA_MEMORY_LIMIT_MB), so collections are loaded on first use and
+unloaded when memory is needed for others. Vectors of a dataset in the shared collections
+(ddl, documentation, sql) of earlier versions are moved to its own collections when it is first opened.
+
+Retrieval (get_similar_question_sql, get_related_ddl, get_related_documentation) embeds
+a question once for all three collections and caches the results per
+(dataset, collection version, question hash). A collection version is a token file next to
+the Chroma store, replaced on every write, so writes by other processes (background jobs)
+invalidate the cache as well.
+
+With HYBRID_RETRIEVAL on, vector candidates are fused with BM25 matches of a lexical
+index of the collection (see hybrid_search.py), which catches exact table and column
+names, and fewer but better documents (HYBRID_TOP_K) go into the prompt.
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import List
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+
+import chromadb
+from chromadb.config import Settings
+from vanna.chromadb.chromadb_vector import ChromaDB_VectorStore
+from vanna.utils import deterministic_uuid
+
+from semantic_cache import EMBED_BATCH_SIZE
+from hybrid_search import LexicalIndex, rrf_fuse
+from embedding_engine import get_embedding_function
+
+# kind -> id suffix used by ChromaDB_VectorStore
+TRAINING_KINDS = {"ddl": "-ddl", "documentation": "-doc", "sql": "-sql"}
+
+CHROMA_MEMORY_LIMIT_MB = int(os.getenv("CHROMA_MEMORY_LIMIT_MB", 1024))    # loaded collection segments, LRU
+COLLECTION_NAME_MAX_LEN = 63
+MIGRATE_BATCH_SIZE = 1000
+
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") not in ("0", "false", "False")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))    # candidates from each of vector and lexical search
+HYBRID_TOP_K = int(os.getenv("HYBRID_TOP_K", 5))               # fused documents per collection
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", 2048))    # entries
+RETRIEVAL_PREWARM_QUESTIONS = int(os.getenv("RETRIEVAL_PREWARM_QUESTIONS", 50))    # frequent Q&A history questions, 0 disables
+
+def hash_question(question):
+    return hashlib.sha256(str(question).encode("utf-8")).hexdigest()
+
+class RetrievalCache(object):
+    """LRU of question embeddings and retrieval results, shared by the Vanna instances of a process"""
+
+    def __init__(self, max_entries=RETRIEVAL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return dict(entries=len(self.entries), hits=self.hits, misses=self.misses,
+                        hit_rate=self.hits / total if total else 0.0)
+
+_RETRIEVAL_CACHE = RetrievalCache()
+
+def get_retrieval_cache():
+    return _RETRIEVAL_CACHE
+
+# (store path, collection name, dataset filter) -> (collection version, LexicalIndex)
+_LEXICAL_INDEXES = {}
+_LEXICAL_INDEXES_LOCK = Lock()
+
+# store path -> client, one client per path and process
+_CLIENTS = {}
+_CLIENTS_LOCK = Lock()
+
+def get_chroma_client(path, memory_limit_mb=CHROMA_MEMORY_LIMIT_MB):
+    """shared persistent client of a store path, collection segments are loaded lazily and evicted LRU"""
+    key = str(Path(path).resolve())
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            _CLIENTS[key] = chromadb.PersistentClient(path=str(path), settings=Settings(
+                anonymized_telemetry=False,
+                chroma_segment_cache_policy="LRU",
+                chroma_memory_limit_bytes=memory_limit_mb*1024*1024,
+            ))
+        return _CLIENTS[key]
+
+def dataset_collection_name(kind, dataset):
+    """name of the collection of a kind (ddl|documentation|sql) for a dataset, valid for Chroma"""
+    name = f"{kind}__{re.sub(r'[^a-zA-Z0-9_-]', '_', str(dataset))}".rstrip("_-")
+    if len(name) > COLLECTION_NAME_MAX_LEN:
+        name = f"{name[:COLLECTION_NAME_MAX_LEN-9]}_{hashlib.sha256(str(dataset).encode('utf-8')).hexdigest()[:8]}"
+    return name
+
+def question_sql_document(question, sql):
+    return json.dumps({"question": question, "sql": sql}, ensure_ascii=False)
+
+class MyChromaDB_VectorStore(ChromaDB_VectorStore):
+
+    def __init__(self, config=None):
+        config = dict(config or {})
+        self.vector_path = Path(config.get("path", "."))
+        if config.get("client", "persistent") == "persistent":
+            config["client"] = get_chroma_client(self.vector_path)
+        if "embedding_function" not in config:
+            config["embedding_function"] = get_embedding_function()
+        ChromaDB_VectorStore.__init__(self, config=config)
+        self.collection_metadata = config.get("collection_metadata", None)
+        self.dataset = config.get("dataset")
+        if self.dataset:
+            for kind in TRAINING_KINDS:
+                self._set_training_collection(kind, self._get_dataset_collection(kind))
+            self.migrate_shared_collections()
+
+    def _get_dataset_collection(self, kind):
+        return self.chroma_client.get_or_create_collection(
+            name=dataset_collection_name(kind, self.dataset),
+            embedding_function=self.embedding_function,
+            metadata=self.collection_metadata,
+        )
+
+    def _set_training_collection(self, kind, collection):
+        setattr(self, {"ddl": "ddl_collection", "documentation": "documentation_collection", "sql": "sql_collection"}[kind], collection)
+
+    def migrate_shared_collections(self, batch_size=MIGRATE_BATCH_SIZE):
+        """move this dataset's vectors from the shared collections into its own, without re-embedding"""
+        n_moved = 0
+        for kind in TRAINING_KINDS:
+            target = self._training_collection(kind)
+            try:
+                shared = self.chroma_client.get_collection(name=kind, embedding_function=self.embedding_function)
+            except Exception:
+                continue    # no shared collection
+            if target.count() > 0 or shared.count() == 0:
+                continue
+            while True:
+                batch = shared.get(where={"dataset": self.dataset}, limit=batch_size,
+                                   include=["documents", "embeddings", "metadatas"])
+                if not batch["ids"]:
+                    break
+                target.add(ids=batch["ids"], documents=batch["documents"],
+                           embeddings=batch["embeddings"], metadatas=batch["metadatas"])
+                shared.delete(ids=batch["ids"])
+                n_moved += len(batch["ids"])
+            self.touch_collection(kind)
+        if n_moved:
+            logging.info(f"[vector_store] moved {n_moved} vectors of {self.dataset} into its own collections")
+        return n_moved
+
+    def _training_collection(self, kind):
+        return {
+            "ddl": self.ddl_collection,
+            "documentation": self.documentation_collection,
+            "sql": self.sql_collection,
+        }[kind]
+
+    ############################
+    ## collection versions
+    ############################
+    def _version_file(self, kind):
+        return self.vector_path / f".version-{self._training_collection(kind).name}"
+
+    def collection_version(self, kind):
+        try:
+            return self._version_file(kind).read_text()
+        except OSError:
+            return ""
+
+    def touch_collection(self, *kinds):
+        """mark collections as changed, cached retrieval results of them become stale"""
+        self.vector_path.mkdir(parents=True, exist_ok=True)
+        for kind in kinds or TRAINING_KINDS:
+            version_file = self._version_file(kind)
+            tmp = version_file.with_name(f"{version_file.name}.{uuid.uuid4().hex}")
+            tmp.write_text(uuid.uuid4().hex)
+            os.replace(tmp, version_file)
+
+    def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
+        id = super().add_question_sql(question, sql, **kwargs)
+        self.touch_collection("sql")
+        return id
+
+    def add_ddl(self, ddl: str, **kwargs) -> str:
+        id = super().add_ddl(ddl, **kwargs)
+        self.touch_collection("ddl")
+        return id
+
+    def add_documentation(self, documentation: str, **kwargs) -> str:
+        id = super().add_documentation(documentation, **kwargs)
+        self.touch_collection("documentation")
+        return id
+
+    def remove_training_data(self, id: str, **kwargs) -> bool:
+        removed = super().remove_training_data(id, **kwargs)
+        self.touch_collection()
+        return removed
+
+    def remove_collection(self, collection_name: str=None, **kwargs) -> bool:
+        """reset a collection (sql|ddl|documentation) of this dataset to empty, all three if not given"""
+        if not self.dataset:
+            removed = super().remove_collection(collection_name, **kwargs)
+            self.touch_collection()
+            return removed
+        kinds = [collection_name] if collection_name else list(TRAINING_KINDS)
+        if any(kind not in TRAINING_KINDS for kind in kinds):
+            return False
+        for kind in kinds:
+            self.chroma_client.delete_collection(name=self._training_collection(kind).name)
+            self._set_training_collection(kind, self._get_dataset_collection(kind))
+        self.touch_collection(*kinds)
+        return True
+
+    def delete_training_ids(self, kind, ids: List[str]):
+        if ids:
+            self._training_collection(kind).delete(ids=list(ids))
+            self.touch_collection(kind)
+
+    ############################
+    ## embedding
+    ############################
+    def generate_embeddings(self, texts: List[str], batch_size=EMBED_BATCH_SIZE, progress_callback=None) -> List[List[float]]:
+        """embed texts round by round, progress_callback(n_done, n_total) after each round
+
+        a round is one batch per embedding thread (see embedding_engine.py), so the threads run in parallel
+        """
+        round_size = batch_size * max(getattr(self.embedding_function, "n_threads", 1), 1)
+        embeddings = []
+        for i in range(0, len(texts), round_size):
+            embeddings.extend(self.embedding_function(texts[i:i+round_size]))
+            if progress_callback:
+                progress_callback(min(i + round_size, len(texts)), len(texts))
+        return embeddings
+
+    def add_bulk(self, kind, documents: List[str], dataset=None, batch_size=EMBED_BATCH_SIZE, progress_callback=None) -> List[str]:
+        """embed and add documents of one kind (ddl|documentation|sql), return ids of all documents
+
+        duplicates and documents already in the collection are not embedded again
+        """
+        collection = self._training_collection(kind)
+        ids = [deterministic_uuid(doc) + TRAINING_KINDS[kind] for doc in documents]
+
+        new = dict(zip(ids, documents))    # keeps first occurrence
+        if new:
+            existing = set(collection.get(ids=list(new), include=[])["ids"])
+            new = {k: v for k, v in new.items() if k not in existing}
+        if not new:
+            return ids
+
+        new_ids, new_docs = list(new), list(new.values())
+        embeddings = self.generate_embeddings(new_docs, batch_size=batch_size, progress_callback=progress_callback)
+        metadatas = [{"dataset": dataset} for _ in new_ids] if dataset else None
+
+        max_batch = self.chroma_client.get_max_batch_size()
+        for i in range(0, len(new_ids), max_batch):
+            collection.add(
+                ids=new_ids[i:i+max_batch],
+                documents=new_docs[i:i+max_batch],
+                embeddings=embeddings[i:i+max_batch],
+                metadatas=metadatas[i:i+max_batch] if metadatas else None,
+            )
+        self.touch_collection(kind)
+        logging.info(f"[vector_store] added {len(new_ids)} of {len(documents)} {kind} items")
+        return ids
+
+    def train_bulk(self, ddl: List[str]=None, documentation: List[str]=None, question_sql: List[dict]=None,
+                   dataset=None, batch_size=EMBED_BATCH_SIZE, progress_callback=None) -> dict:
+        """bulk version of vn.train()
+
+        Args:
+            ddl: list of DDL scripts
+            documentation: list of documents
+            question_sql: list of dict(question, sql)
+            progress_callback: called with (kind, n_done, n_total) after each embedding batch
+
+        Returns:
+            dict of kind -> list of ids
+        """
+        items = {
+            "ddl": [d for d in (ddl or []) if d and d.strip()],
+            "documentation": [d for d in (documentation or []) if d and d.strip()],
+            "sql": [question_sql_document(q["question"], q["sql"]) for q in (question_sql or []) if q.get("sql")],
+        }
+        result = {}
+        for kind, documents in items.items():
+            if not documents:
+                continue
+            callback = (lambda n_done, n_total, kind=kind: progress_callback(kind, n_done, n_total)) if progress_callback else None
+            result[kind] = self.add_bulk(kind, documents, dataset=dataset, batch_size=batch_size, progress_callback=callback)
+        return result
+
+    ############################
+    ## retrieval
+    ############################
+    def _n_results(self, kind):
+        return {"ddl": self.n_results_ddl, "documentation": self.n_results_documentation, "sql": self.n_results_sql}[kind]
+
+    def _retrieval_key(self, kind, question_hash, dataset):
+        collection_name = self._training_collection(kind).name
+        mode = ("hybrid", HYBRID_CANDIDATES, HYBRID_TOP_K) if HYBRID_RETRIEVAL else ("vector",)
+        return ("related", dataset, collection_name, self.collection_version(kind), question_hash, self._n_results(kind), mode)
+
+    def _lexical_index(self, kind, where=None):
+        """lexical index of a collection, rebuilt when the collection version changes"""
+        collection = self._training_collection(kind)
+        version = self.collection_version(kind)
+        key = (str(self.vector_path), collection.name, json.dumps(where))
+        with _LEXICAL_INDEXES_LOCK:
+            cached = _LEXICAL_INDEXES.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        data = collection.get(where=where, include=["documents"])
+        index = LexicalIndex(data["ids"], data["documents"])
+        with _LEXICAL_INDEXES_LOCK:
+            _LEXICAL_INDEXES[key] = (version, index)
+        return index
+
+    def question_embeddings(self, questions: List[str]) -> List[List[float]]:
+        """embeddings of questions, computed once per question and kept in the retrieval cache"""
+        cache = get_retrieval_cache()
+        keys = [("embedding", hash_question(q)) for q in questions]
+        embeddings = [cache.get(k) for k in keys]
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            for i, e in zip(missing, self.generate_embeddings([questions[i] for i in missing])):
+                e = [float(x) for x in e]
+                cache.put(keys[i], e)
+                embeddings[i] = e
+        return embeddings
+
+    def _query_related(self, kind, questions: List[str], dataset=None) -> List[list]:
+        """documents related to each question, one collection query for all questions not cached"""
+        cache = get_retrieval_cache()
+        keys = [self._retrieval_key(kind, hash_question(q), dataset) for q in questions]
+        results = [cache.get(k) for k in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if not missing:
+            return results
+
+        collection = self._training_collection(kind)
+        # a dataset's own collection needs no filter
+        where = {"dataset": dataset} if dataset and dataset != self.dataset else None
+        n_results = self._n_results(kind)
+        embeddings = self.question_embeddings([questions[i] for i in missing])
+        query_results = collection.query(
+            query_embeddings=embeddings,
+            n_results=max(n_results, HYBRID_CANDIDATES) if HYBRID_RETRIEVAL else n_results,
+            where=where,
+        )
+        lexical_index = self._lexical_index(kind, where) if HYBRID_RETRIEVAL else None
+        for n, i in enumerate(missing):
+            documents = query_results["documents"][n]
+            if lexical_index is not None:
+                vector_ids = query_results["ids"][n]
+                lexical_ids = lexical_index.search(questions[i], k=max(n_results, HYBRID_CANDIDATES))
+                texts = dict(zip(vector_ids, documents)) | {d: lexical_index.documents[d] for d in lexical_ids}
+                documents = [texts[d] for d in rrf_fuse([vector_ids, lexical_ids], top_n=min(n_results, HYBRID_TOP_K))]
+            docs = ChromaDB_VectorStore._extract_documents(dict(documents=[documents]))
+            cache.put(keys[i], docs)
+            results[i] = docs
+        return results
+
+    def get_similar_question_sql(self, question: str, **kwargs) -> list:
+        return self._query_related("sql", [question], kwargs.get("dataset"))[0]
+
+    def get_related_ddl(self, question: str, **kwargs) -> list:
+        return self._query_related("ddl", [question], kwargs.get("dataset"))[0]
+
+    def get_related_documentation(self, question: str, **kwargs) -> list:
+        return self._query_related("documentation", [question], kwargs.get("dataset"))[0]
+
+    def prewarm_retrieval(self, questions: List[str], dataset=None) -> int:
+        """fill the retrieval cache for questions: embed them in batches, one query per collection"""
+        questions = list(dict.fromkeys(q for q in questions if q))
+        if not questions:
+            return 0
+        self.question_embeddings(questions)
+        for kind in TRAINING_KINDS:
+            self._query_related(kind, questions, dataset)
+        logging.info(f"[vector_store] pre-warmed retrieval of {len(questions)} questions ({dataset})")
+        return len(questions)